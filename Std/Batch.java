@@ -0,0 +1,154 @@
+import java.io.*;
+import java.nio.file.*;
+import java.util.*;
+import java.util.concurrent.*;
+
+// parses many files in parallel on a pool of threads, one Scan per file,
+// and prints a line for each file followed by the totals (plcc copies
+// this file when its batchparse flag is set)
+//
+// usage: java Batch [-j THREADS] [-m] [-q] [-x SUFFIX] FILE|DIR|- ...
+//   -j THREADS  the number of threads (default: the number of processors)
+//   -m          memory-map the files and scan them in buffer mode
+//   -q          only print the lines for files that fail to parse
+//   -x SUFFIX   only parse the files in the DIRs that follow whose
+//               names end in SUFFIX
+//   DIR         parse all of the files under the directory DIR
+//   -           read file names from standard input, one per line
+//
+// Each file is parsed like Rep does, as a sequence of start symbols.
+// The generated parse methods only use their arguments and locals, and
+// the static state of Scan and Token is either immutable once the
+// classes are initialized or initialized under a lock, so the threads
+// share no mutable state (apart from the counters added by the
+// parseprof flag, which should not be used here).
+public class Batch {
+
+    // the result of parsing one file
+    public static class Result {
+        public String fname;
+        public int items;    // the number of start symbols parsed
+        public int tokens;   // the number of tokens scanned, or -1 if unknown
+        public long bytes;   // the size of the file
+        public long nanos;   // the time taken
+        public String error; // the error message, or null if none
+    }
+
+    // parse the named file
+    public static Result parseFile(String fname, boolean mapped) {
+        Result r = new Result();
+        r.fname = fname;
+        long t0 = System.nanoTime();
+        Scan scn = null;
+        try {
+            r.bytes = new File(fname).length();
+            scn = PLCC$Start.scan$(fname, mapped);
+            while (scn.cur() != null) {
+                PLCC$Start.parse(scn, null);
+                r.items++;
+            }
+        } catch (NullPointerException e) {
+            r.error = "premature end of input";
+        } catch (Exception e) {
+            r.error = e.toString();
+        } catch (StackOverflowError e) {
+            r.error = "input nested too deeply (try plcc's table flag)";
+        }
+        if (scn != null)
+            r.tokens = PLCC$Start.count$(scn);
+        r.nanos = System.nanoTime() - t0;
+        return r;
+    }
+
+    // add the files named by arg (see the usage above) to fnames
+    public static void addFiles(String arg, String suffix, List<String> fnames)
+        throws IOException {
+        if (arg.equals("-")) {
+            BufferedReader rdr =
+                new BufferedReader(new InputStreamReader(System.in));
+            String line;
+            while ((line = rdr.readLine()) != null)
+                if (line.trim().length() > 0)
+                    fnames.add(line.trim());
+            return;
+        }
+        Path path = Paths.get(arg);
+        if (!Files.isDirectory(path)) {
+            fnames.add(arg);
+            return;
+        }
+        List<String> found = new ArrayList<String>();
+        try (DirectoryStream<Path> ds = Files.newDirectoryStream(path)) {
+            for (Path p : ds) {
+                String f = p.toString();
+                if (Files.isDirectory(p))
+                    addFiles(f, suffix, found);
+                else if (suffix == null || f.endsWith(suffix))
+                    found.add(f);
+            }
+        }
+        Collections.sort(found);
+        fnames.addAll(found);
+    }
+
+    public static void main(String [] args) throws Exception {
+        int threads = Runtime.getRuntime().availableProcessors();
+        boolean mapped = false;
+        boolean quiet = false;
+        String suffix = null;
+        List<String> fnames = new ArrayList<String>();
+        for (int i=0 ; i<args.length ; i++) {
+            String s = args[i];
+            if (s.equals("-j") && i+1 < args.length)
+                threads = Integer.parseInt(args[++i]);
+            else if (s.equals("-m"))
+                mapped = true;
+            else if (s.equals("-q"))
+                quiet = true;
+            else if (s.equals("-x") && i+1 < args.length)
+                suffix = args[++i];
+            else
+                addFiles(s, suffix, fnames);
+        }
+        final boolean map = mapped;
+        long t0 = System.nanoTime();
+        ExecutorService pool = Executors.newFixedThreadPool(Math.max(1, threads));
+        List<Future<Result>> futures = new ArrayList<Future<Result>>();
+        for (final String fname : fnames) {
+            futures.add(pool.submit(new Callable<Result>() {
+                public Result call() {
+                    return parseFile(fname, map);
+                }
+            }));
+        }
+        int failed = 0;
+        long tokens = 0;
+        long bytes = 0;
+        // print the results in the order the files were given
+        for (Future<Result> f : futures) {
+            Result r = f.get();
+            if (r.tokens < 0 || tokens < 0)
+                tokens = -1; // not counted (see PLCC$Start.count$)
+            else
+                tokens += r.tokens;
+            bytes += r.bytes;
+            if (r.error != null) {
+                failed++;
+                System.out.println(r.fname + ": error: " + r.error);
+            } else if (!quiet) {
+                String n = (r.tokens < 0) ? "" : ", " + r.tokens + " tokens";
+                System.out.printf("%s: ok (%d items%s, %.3f ms)\n",
+                                  r.fname, r.items, n, r.nanos / 1e6);
+            }
+        }
+        pool.shutdown();
+        double secs = (System.nanoTime() - t0) / 1e9;
+        String rate = (tokens < 0) ? "" : String.format(", %.0f tokens/s", tokens / secs);
+        System.out.printf("%d files (%d failed) on %d threads in %.3f s: "
+                          + "%.1f files/s%s, %.2f MB/s\n",
+                          fnames.size(), failed, threads, secs,
+                          fnames.size() / secs, rate, bytes / secs / 1e6);
+        if (failed > 0)
+            System.exit(1);
+    }
+}
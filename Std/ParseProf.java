@@ -0,0 +1,99 @@
+import java.io.*;
+import java.util.*;
+
+// Parse profile counters for one generated class, compiled into its
+// parse method by plcc's parseprof flag.  Calls are counted for every
+// call; time (in nanoseconds) and tokens consumed are inclusive, and are
+// only added up over the outermost calls, so recursion isn't counted
+// twice.  The counters are not synchronized: profile one parse at a time.
+//
+// The profile is printed to System.err when the program exits, as a
+// table sorted by time, or as JSON with -Dplcc.prof=json
+// (-Dplcc.prof=off turns this off).
+public class ParseProf {
+
+    public String name;  // the class name
+    public long calls;   // the number of calls to its parse method
+    public long nanos;   // the time spent in its outermost calls
+    public long tokens;  // the tokens consumed in its outermost calls
+    private int depth;   // the number of active calls
+    private int count0;  // the scanner's token count at the outermost call
+
+    private static List<ParseProf> entries = new ArrayList<ParseProf>();
+
+    private ParseProf(String name) {
+        this.name = name;
+    }
+
+    // return the counters for the named class
+    public static synchronized ParseProf entry(String name) {
+        if (entries.isEmpty()) {
+            final String prop = System.getProperty("plcc.prof", "table");
+            if (!prop.equals("off")) {
+                Runtime.getRuntime().addShutdownHook(new Thread() {
+                    public void run() {
+                        report(System.err, prop.equals("json"));
+                    }
+                });
+            }
+        }
+        ParseProf p = new ParseProf(name);
+        entries.add(p);
+        return p;
+    }
+
+    public long enter(Scan scn) {
+        calls++;
+        if (depth++ > 0)
+            return 0;
+        count0 = scn.count;
+        return System.nanoTime();
+    }
+
+    public void exit(Scan scn, long t0) {
+        if (--depth > 0)
+            return;
+        nanos += System.nanoTime() - t0;
+        tokens += scn.count - count0;
+    }
+
+    // clear all of the counters
+    public static synchronized void reset() {
+        for (ParseProf p : entries) {
+            p.calls = 0;
+            p.nanos = 0;
+            p.tokens = 0;
+        }
+    }
+
+    // print the counters of the classes that were called, sorted by time
+    public static synchronized void report(PrintStream out, boolean json) {
+        List<ParseProf> list = new ArrayList<ParseProf>();
+        for (ParseProf p : entries)
+            if (p.calls > 0)
+                list.add(p);
+        Collections.sort(list, new Comparator<ParseProf>() {
+            public int compare(ParseProf a, ParseProf b) {
+                if (a.nanos != b.nanos)
+                    return a.nanos > b.nanos ? -1 : 1;
+                return a.name.compareTo(b.name);
+            }
+        });
+        if (json) {
+            out.println("{\"classes\": [");
+            for (int i=0 ; i<list.size() ; i++) {
+                ParseProf p = list.get(i);
+                out.printf("  {\"name\": \"%s\", \"calls\": %d, \"nanos\": %d, \"tokens\": %d}%s\n",
+                           p.name, p.calls, p.nanos, p.tokens,
+                           i + 1 < list.size() ? "," : "");
+            }
+            out.println("]}");
+        } else {
+            out.printf("%-24s %12s %12s %12s\n", "class", "calls", "ms", "tokens");
+            for (ParseProf p : list)
+                out.printf("%-24s %12d %12.3f %12d\n",
+                           p.name, p.calls, p.nanos / 1e6, p.tokens);
+        }
+        out.flush();
+    }
+}
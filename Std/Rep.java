@@ -5,8 +5,11 @@ public class Rep {
 
     // do a read-eval-print loop, reading from command-line files
     // and then from standard input
+    // (files following a -m arg are memory-mapped and scanned in buffer
+    // mode, so that tokens can span lines)
     public static void main(String [] args) {
 	Trace trace = null;
+	boolean mapped = false;
 	// first read and process any input files from the command line
 	Scan scn = null;
 	for (int i=0 ; i<args.length ; i++) {
@@ -15,9 +18,13 @@ public class Rep {
                 trace = new Trace(); // trace any following args
                 continue;
             }
+            if (s.equals("-m")) {
+                mapped = true; // map any following files
+                continue;
+            }
 	    try {
-		scn = new Scan(new BufferedReader(new FileReader(s)));
-            } catch (FileNotFoundException e) {
+                scn = PLCC$Start.scan$(s, mapped);
+            } catch (IOException e) {
 		System.out.println(e + " ... exiting");
                 System.exit(1);
             }
@@ -0,0 +1,172 @@
+import java.util.*;
+
+// Incremental reparsing, for grammars whose start rule has the form
+// <start> ::= <list> with <list> an arbno rule without a separator
+// (see plcc's reparse flag, which generates PLCC$Reparse from this).
+//
+// The elements of the list (the trips through its arbno loop) are the
+// units of reuse.  After an edit, the new input is tokenized in bulk and
+// its tokens are compared with the old ones: the elements in the common
+// prefix of the two token streams, including the one token of lookahead
+// that the LL(1) parse of an element can examine, are reused, and so are
+// the elements in the common suffix from the first point where a newly
+// parsed element ends on an old element boundary.  Only the elements in
+// between are parsed again, so the tree is the same as a full parse of
+// the new input.  The line numbers and offsets of the tokens in reused
+// elements are updated in place, so the trees from earlier edits should
+// not be kept.
+public abstract class Reparse<T> {
+
+    // parse one element at the current token of scn, returning its
+    // field values, or return null if no element can begin there
+    protected abstract Object [] item(Scan scn);
+
+    // return the tree for the given list of elements
+    protected abstract T build(List<Object[]> items);
+
+    private static class Item {
+        Object [] vals;    // the field values of the element
+        List<Token> toks;  // the tokens of the element
+
+        Item(Object [] vals, List<Token> toks) {
+            this.vals = vals;
+            this.toks = toks;
+        }
+    }
+
+    private String text = "";  // the current input
+    private List<Item> items = new ArrayList<Item>();
+    private T tree;            // the tree for the current input
+    public int reused;         // the number of elements reused by the last edit
+    public int parsed;         // the number of elements parsed by the last edit
+
+    public String text() {
+        return text;
+    }
+
+    public T tree() {
+        return tree;
+    }
+
+    // parse all of the given input
+    public T parse(String text) {
+        return update(text);
+    }
+
+    // replace the len chars at offset pos of the input with repl,
+    // and return the tree for the new input
+    public T edit(int pos, int len, String repl) {
+        return update(text.substring(0, pos) + repl + text.substring(pos + len));
+    }
+
+    private T update(String s) {
+        Scan.Tokens ts = Scan.buffer(s).tokenize();
+        int nnew = ts.n;
+        // the old tokens, in order
+        List<Token> old = new ArrayList<Token>();
+        for (Item it : items)
+            old.addAll(it.toks);
+        int nold = old.size();
+        // the lengths of the common prefix and suffix of the token streams
+        int min = Math.min(nold, nnew);
+        int pre = 0;
+        while (pre < min && same(old.get(pre), s, ts, pre))
+            pre++;
+        int suf = 0;
+        while (suf < min - pre && same(old.get(nold - 1 - suf), s, ts, nnew - 1 - suf))
+            suf++;
+        int delta = nnew - nold;
+        boolean unchanged = (pre == nold && nold == nnew);
+        List<Item> out = new ArrayList<Item>();
+        List<Item> moved = new ArrayList<Item>();     // the reused elements
+        List<Integer> at = new ArrayList<Integer>();  // their new first tokens
+        // reuse the elements in the prefix
+        int j = 0; // the next old element
+        int t = 0; // its first token (in both streams)
+        while (j < items.size()) {
+            Item it = items.get(j);
+            int e = t + it.toks.size();
+            if (!unchanged && e >= pre)
+                break; // this element or its lookahead changed
+            out.add(it);
+            moved.add(it);
+            at.add(t);
+            t = e;
+            j++;
+        }
+        int reuse = j;
+        int count = 0;
+        if (j < items.size() || t < nnew) {
+            // parse new elements from token t until they resynchronize
+            // with the old elements in the suffix
+            Scan scn = Scan.buffer(s);
+            if (t < nnew)
+                scn.seek(ts.start[t], ts.line[t]);
+            else
+                scn.seek(s.length(), 0);
+            int k = t;      // the next new token
+            int ot = t;     // the first token of old element j
+            while (true) {
+                // skip the old elements that begin before new token k
+                while (j < items.size() && ot < k - delta) {
+                    ot += items.get(j).toks.size();
+                    j++;
+                }
+                if (k >= nnew - suf && ot == k - delta) {
+                    // the rest of the old elements are unchanged
+                    for ( ; j < items.size() ; j++) {
+                        Item it = items.get(j);
+                        out.add(it);
+                        moved.add(it);
+                        at.add(ot + delta);
+                        ot += it.toks.size();
+                        reuse++;
+                    }
+                    break;
+                }
+                List<Token> toks = new ArrayList<Token>();
+                scn.record = toks;
+                Object [] vals = item(scn);
+                if (vals == null) {
+                    if (scn.cur() != null)
+                        throw new RuntimeException("unexpected token " + scn.cur().val +
+                                                   " on line " + scn.cur().lno);
+                    break;
+                }
+                out.add(new Item(vals, toks));
+                count++;
+                k += toks.size();
+            }
+        }
+        List<Object[]> vals = new ArrayList<Object[]>();
+        for (Item it : out)
+            vals.add(it.vals);
+        T result = build(vals);
+        // all is well, so keep the new state
+        for (int i=0 ; i<moved.size() ; i++)
+            relocate(moved.get(i), at.get(i), ts);
+        text = s;
+        items = out;
+        tree = result;
+        reused = reuse;
+        parsed = count;
+        return result;
+    }
+
+    // is the old token t the same as token i of ts in the input s?
+    private static boolean same(Token t, String s, Scan.Tokens ts, int i) {
+        String str = t.toString();
+        return t.val.ordinal() == ts.kind[i] && str.length() == ts.len[i]
+            && s.regionMatches(ts.start[i], str, 0, ts.len[i]);
+    }
+
+    // update the offsets and line numbers of the tokens of an element
+    // to those of tokens t, t+1, ... of ts
+    private static void relocate(Item it, int t, Scan.Tokens ts) {
+        for (Token tok : it.toks) {
+            tok.pos = ts.start[t];
+            tok.lno = ts.line[t];
+            t++;
+        }
+    }
+}
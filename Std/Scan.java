@@ -1,15 +1,31 @@
 import java.util.regex.*;
 import java.util.*;
 import java.io.*;
+import java.nio.*;
+import java.nio.channels.*;
+import java.nio.charset.*;
+import java.nio.file.*;
 
 public class Scan implements IScan {
 
     private BufferedReader rdr;  // get input from here, line by line
-    private String s;   // current string being scanned
+    private CharSequence s;   // current string being scanned
     public int lno;    // current line number
     private String snl; // current string to scan, without the newline
     private int start;  // starting position in the string to scan
     private int end;    // ending position
+    private int base;   // the offset of s in the input (line mode)
+
+    // In buffer mode (see buffer() and map() below) s is the entire input,
+    // so a skip or token can match across lines.  Buffer mode compiles the
+    // patterns without DOTALL, so that '.' stops at the end of a line, and
+    // with MULTILINE, so that '$' matches at the end of every line (as it
+    // does on the single line scanned in line mode) and not only at the
+    // end of the input.  It does not use the DFA tables.  lno is kept up
+    // to date by counting the newlines between lpos and the start of each
+    // token.
+    private CharSequence buf; // the entire input in buffer mode, else null
+    private int lpos;         // newlines before lpos have been counted in lno
 
     // create a scanner object on a buffered reader
     public Scan(BufferedReader rdr) {
@@ -24,19 +40,122 @@ public class Scan implements IScan {
         this(new BufferedReader(new StringReader(s)));
     }
 
+    // create a scanner object on an entire input held in memory
+    // (a String, StringBuilder, CharBuffer, ...) in buffer mode
+    public static Scan buffer(CharSequence buf) {
+        Scan scn = new Scan((BufferedReader)null);
+        scn.buf = buf;
+        scn.lno = 1;
+        return scn;
+    }
+
+    // create a scanner object in buffer mode on the named file, which is
+    // memory-mapped and decoded as UTF-8 in a single pass
+    public static Scan map(String fname) throws IOException {
+        try (FileChannel ch = FileChannel.open(Paths.get(fname),
+                                               StandardOpenOption.READ)) {
+            MappedByteBuffer bb = ch.map(FileChannel.MapMode.READ_ONLY, 0, ch.size());
+            return buffer(StandardCharsets.UTF_8.decode(bb));
+        }
+    }
+
     public Token tok; // this is persistent across all calls to token()
 
+    private static final Token.Val [] VALS = Token.Val.values();
+    private static final Token.Skip [] SKIPS = Token.Skip.values();
+
+    // the matchers for the skip and token patterns (indexed by ordinal),
+    // created when first needed and reused for every token, and the text
+    // each one was last reset to, so scanning a token allocates nothing
+    // but the Token itself
+    private Matcher [] skipM = new Matcher[SKIPS.length];
+    private CharSequence [] skipOn = new CharSequence[SKIPS.length];
+    private Matcher [] valM = new Matcher[VALS.length];
+    private CharSequence [] valOn = new CharSequence[VALS.length];
+    private Matcher [] anyM = new Matcher[1];
+    private CharSequence [] anyOn = new CharSequence[1];
+
+    // the alternation of all of the skip patterns, which fails to match
+    // exactly when none of them matches, so one match attempt ends the
+    // skip loop wherever there is nothing to skip (see scan())
+    private static final Pattern skipAny = anyPattern(Pattern.DOTALL);
+
+    // return the alternation of the skip patterns, compiled with the given
+    // flags, or null if there are fewer than two of them or one has groups
+    // (whose numbers, for backreferences, the alternation would change)
+    private static Pattern anyPattern(int flags) {
+        if (SKIPS.length < 2)
+            return null;
+        StringBuilder sb = new StringBuilder();
+        for (Token.Skip skip : SKIPS) {
+            if (Pattern.compile(skip.pattern).matcher("").groupCount() > 0)
+                return null;
+            if (sb.length() > 0)
+                sb.append('|');
+            sb.append("(?:").append(skip.pattern).append(')');
+        }
+        return Pattern.compile(sb.toString(), flags);
+    }
+
+    // return the matcher in slot i of ms (for the pattern pat), set to
+    // the region [start, end) of s
+    private Matcher matcher(Matcher [] ms, CharSequence [] on, int i, Pattern pat) {
+        Matcher m = ms[i];
+        if (m == null) {
+            m = ms[i] = pat.matcher(s);
+            on[i] = s;
+        } else if (on[i] != s) {
+            m.reset(s);
+            on[i] = s;
+        }
+        m.region(start, end);
+        return m;
+    }
+
+    // the skip and token patterns for buffer mode, indexed by ordinal
+    private static Pattern [] bufSkips;
+    private static Pattern [] bufVals;
+    private static Pattern bufSkipAny;
+
+    private static synchronized void bufPatterns() {
+        if (bufVals != null)
+            return;
+        Pattern [] ps = new Pattern[SKIPS.length];
+        for (int i=0 ; i<SKIPS.length ; i++)
+            ps[i] = Pattern.compile(SKIPS[i].pattern, Pattern.MULTILINE);
+        bufSkips = ps;
+        bufSkipAny = anyPattern(Pattern.MULTILINE);
+        ps = new Pattern[VALS.length];
+        for (int i=0 ; i<VALS.length ; i++)
+            ps[i] = Pattern.compile(VALS[i].pattern, Pattern.MULTILINE);
+        bufVals = ps;
+    }
+
     // fill the string buffer from the reader if it's exhausted or null)
     public void fillString() {
+        if (buf != null) {
+            // buffer mode: the input is all there at once
+            if (s == null && start == 0) {
+                bufPatterns();
+                s = buf;
+                end = buf.length();
+            }
+            if (start >= end)
+                s = null; // end of input
+            return;
+        }
         if (s == null || start >= end) {
             // get the next line from the reader
+            if (s != null)
+                base += end;
             try {
-                s = rdr.readLine();
-                if (s == null)
+                snl = rdr.readLine();
+                if (snl == null) {
+                    s = null;
                     return; // end of file
+                }
 		lno++;
-                snl = s;
-                s += "\n";
+                s = snl + "\n";
                 start = 0;
                 end = s.length();
             } catch (IOException e) {
@@ -50,52 +169,115 @@ public class Scan implements IScan {
         // lazy
         if (tok != null)
             return tok; // don't get a new token if we already have one
+        if (!scan())
+            return null; // EOF
+	tok = makeToken(scanVal, scanPos, start); // persistent value
+	return tok;
+    }
 
-        int n; // size of pattern list
-        boolean skipped = true;
-        // process skip patterns
-        while (skipped) {
-            fillString(); // get another line if necessary
-            if (s == null)
-                return null; // EOF
-            // process all of the skip patterns
-            skipped = false;
-            for (Token.Skip skip : Token.Skip.values()) {
-                Pattern pat = skip.cPattern;
-                Matcher m = pat.matcher(s);
-                m.region(start, end);
-                if (m.lookingAt()) {
-                    int e = m.end();
-                    if (e > start) {
-                        // there's a non-empty skip match, so skip past it
-                        start = e;
-                        skipped = true;
-                    }
-                }
+    private Token.Val scanVal; // the Val of the token found by scan()
+    private int scanPos;       // its position in s (and start is its end)
+
+    // find the next token, returning false at the end of the input
+    private boolean scan() {
+        Token.Dfa dfa = Token.dfa; // not null if plcc generated a DFA scanner
+        if (buf != null)
+            dfa = null;
+        // process the skip patterns: try each in turn, cycling through them
+        // until none of them has matched for a whole round.  This skips
+        // the same text as repeated passes over all of them, except that
+        // it stops as soon as the last one to match has been tried again.
+        // At each new position, the alternation of all of them is tried
+        // first: if it fails, nothing can be skipped there, and the loop
+        // ends after one match attempt instead of a round of them.  (The
+        // alternation alone would not do, since at each position it takes
+        // the first pattern that matches, even with an empty match, rather
+        // than the next one in the cycle.)
+        fillString(); // get another line if necessary
+        if (s == null)
+            return false; // EOF
+        int nskip = (dfa != null) ? dfa.skipStart.length : SKIPS.length;
+        Pattern any = (dfa != null) ? null : (buf == null) ? skipAny : bufSkipAny;
+        int i = 0;      // the next skip pattern to try
+        int misses = 0; // the number tried since the last match
+        boolean fresh = true; // at a position where no pattern has been tried
+        while (misses < nskip) {
+            if (fresh && any != null && !matcher(anyM, anyOn, 0, any).lookingAt())
+                break;  // no skip pattern matches here
+            fresh = false;
+            int e; // the end of the skip match, or -1 if none
+            if (dfa != null) {
+                e = (int)dfa.match(s, start, end, dfa.skipStart[i]);
+            } else {
+                Pattern pat = (buf == null) ? SKIPS[i].cPattern : bufSkips[i];
+                Matcher m = matcher(skipM, skipOn, i, pat);
+                e = m.lookingAt() ? m.end() : -1;
+            }
+            if (e > start) {
+                // there's a non-empty skip match, so skip past it
+                start = e;
+                misses = 0;
+                fresh = true;
+            } else {
+                misses++;
+            }
+            if (++i == nskip)
+                i = 0;
+            if (start >= end) {
+                // start again with the first pattern on the next line
+                fillString();
+                if (s == null)
+                    return false; // EOF
+                i = 0;
+                misses = 0;
+                fresh = true;
             }
         }
 
         // s cannot be null here
         // now process the next token -- look for the longest match
-        String matchString = "";
         int matchEnd = start;  // current match end
 	Token.Val valFound = null;
-        for (Token.Val val: Token.Val.values()) {
-            Pattern pat = val.cPattern;
-            Matcher m = pat.matcher(s);
-            m.region(start, end);
-            if (m.lookingAt()) {
-                int e = m.end(); // the end pos of this match
-                // if we have found a longer match, record it
-                // if not, keep the previous match
-                if (matchEnd < e) {
-                    matchEnd = e;
-                    matchString = m.group();
-                    valFound = val;
+        if (dfa != null) {
+            // the DFA finds the longest match (first declared on ties)
+            long r = dfa.match(s, start, end, dfa.valStart);
+            if (r >= 0) {
+                matchEnd = (int)r;
+                valFound = VALS[(int)(r >>> 32)];
+            }
+        } else {
+            // only try the patterns that can match at this char
+            char ch = s.charAt(start);
+            for (Token.Val val: Token.candidates[ch < 128 ? ch : 128]) {
+                int k = val.ordinal();
+                Pattern pat = (buf == null) ? val.cPattern : bufVals[k];
+                Matcher m = matcher(valM, valOn, k, pat);
+                if (m.lookingAt()) {
+                    int e = m.end(); // the end pos of this match
+                    // if we have found a longer match, record it
+                    // if not, keep the previous match
+                    if (matchEnd < e) {
+                        matchEnd = e;
+                        valFound = val;
+                    }
                 }
             }
+            // the keyword with the same text wins if declared first
+            if (valFound != null && Token.keywords) {
+                Token.Val kw = Token.keyword(s, start, matchEnd - start);
+                if (kw != null && kw.ordinal() < valFound.ordinal())
+                    valFound = kw;
+            }
+        }
+        if (buf != null) {
+            // count the lines up to the start of this token
+            for ( ; lpos < start ; lpos++)
+                if (buf.charAt(lpos) == '\n')
+                    lno++;
         }
         if (valFound == null) {
+            if (buf != null)
+                snl = line(start);
             char ch = s.charAt(start);
             String sch;
             if (ch >= ' ' && ch <= '~')
@@ -111,18 +293,173 @@ public class Scan implements IScan {
                 snl + 
                 "\""); 
         }
+        scanVal = valFound;
+        scanPos = start;
         start = matchEnd; // start of next token match
-        // matchPos is the token number (the index into the pats array)
-        // matchString is the matching string
-	tok = new Token(valFound, matchString, lno); // persistent value
-	return tok;
+        return true;
+    }
+
+    // Token text.  When lazy is true, a token records where its text is
+    // in the string being scanned (the whole input in buffer mode), and
+    // the text is only created when the token's toString() is called --
+    // code reading tok.str directly must not set lazy.  After a call to
+    // intern(), identifier-like token texts (keywords included) are
+    // shared through a table owned by this scanner, which is looked up
+    // without creating a string unless the text is new.
+    public boolean lazy = false;
+    private String [] names; // the intern table (open addressing), or null
+    private int nnames;      // the number of entries in names
+
+    // start interning identifier-like token texts
+    public void intern() {
+        if (names == null)
+            names = new String[1024];
+    }
+
+    // create the token for the text s[pos..end)
+    private Token makeToken(Token.Val val, int pos, int end) {
+        int len = end - pos;
+        Token t;
+        if (names != null && isName(pos, end))
+            t = new Token(val, name(pos, len), lno);
+        else if (lazy)
+            return new Token(val, s, pos, len, lno);
+        else
+            t = new Token(val, s.subSequence(pos, end).toString(), lno);
+        t.pos = pos;
+        t.len = len;
+        return t;
     }
 
+    private boolean isName(int pos, int end) {
+        if (!Character.isJavaIdentifierStart(s.charAt(pos)))
+            return false;
+        for (int i=pos+1 ; i<end ; i++)
+            if (!Character.isJavaIdentifierPart(s.charAt(i)))
+                return false;
+        return true;
+    }
+
+    // return the interned string with the text s[pos..pos+len)
+    private String name(int pos, int len) {
+        int h = 0;
+        for (int i=pos ; i<pos+len ; i++)
+            h = 31 * h + s.charAt(i); // same as String.hashCode
+        int mask = names.length - 1;
+        int k = h & mask;
+        for (String n ; (n = names[k]) != null ; k = (k + 1) & mask) {
+            if (n.length() == len && n.hashCode() == h) {
+                int i = 0;
+                while (i < len && n.charAt(i) == s.charAt(pos + i))
+                    i++;
+                if (i == len)
+                    return n;
+            }
+        }
+        String n = s.subSequence(pos, pos + len).toString();
+        names[k] = n;
+        if (++nnames * 2 > names.length) {
+            // rehash into a table twice the size
+            String [] old = names;
+            names = new String[old.length * 2];
+            mask = names.length - 1;
+            for (String o : old) {
+                if (o == null)
+                    continue;
+                int j = o.hashCode() & mask;
+                while (names[j] != null)
+                    j = (j + 1) & mask;
+                names[j] = o;
+            }
+        }
+        return n;
+    }
+
+    // return the text of the line containing position pos in buffer mode
+    private String line(int pos) {
+        int lo = pos;
+        while (lo > 0 && buf.charAt(lo - 1) != '\n')
+            lo--;
+        int hi = pos;
+        while (hi < end && buf.charAt(hi) != '\n')
+            hi++;
+        return buf.subSequence(lo, hi).toString();
+    }
+
+    // The token kinds (Val ordinals), offsets, lengths and line numbers
+    // of a run of tokens in parallel arrays.  In line mode the offsets
+    // count each line terminator as one char.
+    public static class Tokens {
+        public int n;        // the number of tokens
+        public int [] kind;  // kind[i] is the Val ordinal of token i
+        public int [] start; // start[i] is its offset in the input
+        public int [] len;   // len[i] is its length
+        public int [] line;  // line[i] is its line number
+
+        public Tokens(int size) {
+            kind = new int[size];
+            start = new int[size];
+            len = new int[size];
+            line = new int[size];
+        }
+
+        public Token.Val val(int i) {
+            return VALS[kind[i]];
+        }
+
+        public void add(int k, int s, int l, int lno) {
+            if (n == kind.length) {
+                int size = 2 * n + 16;
+                kind = Arrays.copyOf(kind, size);
+                start = Arrays.copyOf(start, size);
+                len = Arrays.copyOf(len, size);
+                line = Arrays.copyOf(line, size);
+            }
+            kind[n] = k;
+            start[n] = s;
+            len[n] = l;
+            line[n] = lno;
+            n++;
+        }
+    }
+
+    // scan all of the remaining input, without creating any Token objects
+    public Tokens tokenize() {
+        Tokens ts = new Tokens(1024);
+        if (tok != null) {
+            ts.add(tok.val.ordinal(), base + tok.pos, tok.len, tok.lno);
+            tok = null;
+        }
+        while (scan())
+            ts.add(scanVal.ordinal(), base + scanPos, start - scanPos, lno);
+        return ts;
+    }
+
+    public int count; // the number of tokens advanced past
+    public List<Token> record; // if not null, the tokens advanced past are added to it
+
     public void adv() {
         // if we have already advanced past the current token,
         // we'll have to do it again
         if (tok == null)
             cur();
+        if (record != null && tok != null)
+            record.add(tok);
+        tok = null;
+        count++;
+    }
+
+    // in buffer mode, continue scanning at offset pos of the input,
+    // which is on line lno
+    public void seek(int pos, int lno) {
+        if (buf == null)
+            throw new RuntimeException("Scan class: seek needs buffer mode");
+        bufPatterns();
+        s = buf;
+        end = buf.length();
+        start = pos;
+        lpos = pos;
+        this.lno = lno;
         tok = null;
     }
 
@@ -153,7 +490,36 @@ public class Scan implements IScan {
         }
     }
 
-    public static void main(String [] args) {
+    // report how many tokens per second are scanned in each file
+    // one token at a time (cur/adv) and in bulk (tokenize)
+    public static void rate(String fname) throws IOException {
+        int count = 0;
+        long t0 = System.nanoTime();
+        Scan scn = map(fname);
+        while (scn.cur() != null) {
+            count++;
+            scn.adv();
+        }
+        long t1 = System.nanoTime();
+        int n = map(fname).tokenize().n;
+        long t2 = System.nanoTime();
+        System.out.printf("%s: %d tokens; cur/adv %.0f tokens/sec; tokenize %.0f tokens/sec\n",
+                          fname, count, count / ((t1 - t0) / 1e9), n / ((t2 - t1) / 1e9));
+    }
+
+    // print the tokens in the files given on the command line (scanned
+    // in buffer mode), or on standard input if there are none;
+    // with a -r first arg, report the token rates for the files instead
+    public static void main(String [] args) throws IOException {
+        if (args.length > 0 && args[0].equals("-r")) {
+            for (int i=1 ; i<args.length ; i++)
+                rate(args[i]);
+            return;
+        }
+        for (String fname : args)
+            map(fname).printTokens();
+        if (args.length > 0)
+            return;
         BufferedReader rdr =
             new BufferedReader(new InputStreamReader(System.in));
         Scan scn = new Scan(rdr);
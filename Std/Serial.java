@@ -0,0 +1,111 @@
+import java.io.*;
+import java.nio.charset.StandardCharsets;
+import java.util.*;
+
+// Binary serialization of parse trees (see plcc's serial flag, which
+// gives each generated class a write(Serial.Out) method and a static
+// read(Serial.In) method, and generates PLCC$Serial to write and read
+// the nodes of a tree, without recursion, in the streams here).
+// Numbers are written as unsigned varints, and each distinct string is
+// written once per stream -- later occurrences refer back to it by
+// number, and are shared when the tree is read.
+// A Token is written as its Val ordinal, its text and its line number.
+// The stream begins with a magic number and the number of Vals, as a
+// check that it was written for the same grammar.
+public class Serial {
+
+    private static final int MAGIC = 0x504c4354; // "PLCT"
+    private static final Token.Val [] VALS = Token.Val.values();
+
+    public static class Out {
+        private DataOutputStream out;
+        private HashMap<String,Integer> strings = new HashMap<String,Integer>();
+
+        public Out(OutputStream os) throws IOException {
+            out = new DataOutputStream(new BufferedOutputStream(os));
+            out.writeInt(MAGIC);
+            writeInt(VALS.length);
+        }
+
+        // write the non-negative int n
+        public void writeInt(int n) throws IOException {
+            while ((n & ~0x7F) != 0) {
+                out.write((n & 0x7F) | 0x80);
+                n >>>= 7;
+            }
+            out.write(n);
+        }
+
+        public void writeString(String s) throws IOException {
+            Integer k = strings.get(s);
+            if (k != null) {
+                writeInt(k + 1);
+                return;
+            }
+            strings.put(s, strings.size());
+            byte [] b = s.getBytes(StandardCharsets.UTF_8);
+            writeInt(0);
+            writeInt(b.length);
+            out.write(b);
+        }
+
+        public void writeToken(Token t) throws IOException {
+            writeInt(t.val.ordinal());
+            writeString(t.toString());
+            writeInt(t.lno);
+        }
+
+        public void flush() throws IOException {
+            out.flush();
+        }
+
+        public void close() throws IOException {
+            out.close();
+        }
+    }
+
+    public static class In {
+        private DataInputStream in;
+        private ArrayList<String> strings = new ArrayList<String>();
+
+        public In(InputStream is) throws IOException {
+            in = new DataInputStream(new BufferedInputStream(is));
+            if (in.readInt() != MAGIC || readInt() != VALS.length)
+                throw new IOException("not a serialized parse tree for this grammar");
+        }
+
+        public int readInt() throws IOException {
+            int n = 0;
+            for (int shift=0 ; ; shift+=7) {
+                int b = in.read();
+                if (b < 0)
+                    throw new EOFException();
+                n |= (b & 0x7F) << shift;
+                if (b < 0x80)
+                    return n;
+            }
+        }
+
+        public String readString() throws IOException {
+            int k = readInt();
+            if (k > 0)
+                return strings.get(k - 1);
+            byte [] b = new byte[readInt()];
+            in.readFully(b);
+            String s = new String(b, StandardCharsets.UTF_8);
+            strings.add(s);
+            return s;
+        }
+
+        public Token readToken() throws IOException {
+            int k = readInt();
+            if (k >= VALS.length)
+                throw new IOException("bad token kind " + k);
+            return new Token(VALS[k], readString(), readInt());
+        }
+
+        public void close() throws IOException {
+            in.close();
+        }
+    }
+}
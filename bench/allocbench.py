@@ -0,0 +1,160 @@
+# -*-python-*-
+
+# Allocation benchmark for the generated scanner.
+#
+# Generates a grammar with keywords, identifiers, numbers, punctuation
+# and two skip patterns (whitespace and comments), and an input using
+# all of them, then scans the input with Scan's cur/adv loop, reporting
+# the bytes allocated per token (from the JVM's per-thread allocation
+# counter) and the tokens per second, in line mode and buffer mode, with
+# and without lazy token text.  With --base=REV, the same runs are made
+# with the Std/Scan.java of git revision REV in place of the current one,
+# to show the difference.  Needs javac and java (a HotSpot JVM, for
+# com.sun.management.ThreadMXBean) on the PATH.
+#
+# usage: python3 bench/allocbench.py [--lines=N] [--reps=N] [--base=REV]
+
+import sys
+import os
+import re
+import random
+import shutil
+import subprocess
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+WORDS = ['if', 'then', 'else', 'while', 'do', 'let', 'in', 'end', 'proc', 'return']
+
+GRAMMAR = """\
+skip WHITESPACE '\\s+'
+skip COMMENT '#[^\\n]*'
+%s
+token LP '\\('
+token RP '\\)'
+token SEMI ';'
+token EQUALS '='
+token PLUS '\\+'
+token NUM '\\d+'
+token ID '[A-Za-z_]\\w*'
+%%
+<prog> ::= <items>
+<items> **= <item>
+<item>:Word ::= <ID>
+%%
+""" % '\n'.join(["token %s '%s'" % (w.upper(), w) for w in WORDS])
+
+HARNESS = """\
+import java.lang.management.*;
+import java.nio.file.*;
+
+public class AllocBench {
+    public static void main(String [] args) throws Exception {
+        String text = new String(Files.readAllBytes(Paths.get(args[0])), "UTF-8");
+        boolean buffer = args[1].equals("buffer");
+        boolean lazy = args[2].equals("lazy");
+        int reps = Integer.parseInt(args[3]);
+        com.sun.management.ThreadMXBean mx =
+            (com.sun.management.ThreadMXBean)ManagementFactory.getThreadMXBean();
+        long tid = Thread.currentThread().getId();
+        long bytes = Long.MAX_VALUE;
+        long best = Long.MAX_VALUE;
+        int count = 0;
+        for (int r=0 ; r<reps ; r++) {
+            long a0 = mx.getThreadAllocatedBytes(tid);
+            long t0 = System.nanoTime();
+            Scan scn = buffer ? Scan.buffer(text) : new Scan(text);
+            scn.lazy = lazy;
+            count = 0;
+            while (scn.cur() != null) {
+                count++;
+                scn.adv();
+            }
+            best = Math.min(best, System.nanoTime() - t0);
+            bytes = Math.min(bytes, mx.getThreadAllocatedBytes(tid) - a0);
+        }
+        System.out.println(count + " " + bytes + " " + best);
+    }
+}
+"""
+
+def source(nlines):
+    rnd = random.Random(1)
+    out = []
+    for i in range(nlines):
+        items = []
+        for j in range(8):
+            r = rnd.random()
+            if r < 0.4:
+                items.append(rnd.choice(WORDS))
+            elif r < 0.7:
+                items.append('name%d' % rnd.randrange(1000))
+            elif r < 0.85:
+                items.append(str(rnd.randrange(100000)))
+            else:
+                items.append(rnd.choice(['( ; )', '=', '+']))
+        if rnd.random() < 0.2:
+            items.append('# a comment')
+        out.append(' '.join(items))
+    return '\n'.join(out) + '\n'
+
+def build(dir, name, scan=None):
+    # run plcc on the grammar in dir into the subdirectory name and compile
+    # the result, with the Std/Scan.java text scan if given
+    java = os.path.join(dir, name)
+    env = dict(os.environ, LIBPLCC=ROOT)
+    subprocess.run([sys.executable, os.path.join(ROOT, 'plcc.py'),
+                    '--destdir=' + name, 'grammar'],
+                   cwd=dir, env=env, check=True, stdout=subprocess.DEVNULL)
+    if scan != None:
+        with open(os.path.join(java, 'Scan.java'), 'w') as f:
+            f.write(scan)
+    with open(os.path.join(java, 'AllocBench.java'), 'w') as f:
+        f.write(HARNESS)
+    subprocess.run('javac -nowarn *.java', cwd=java, check=True, shell=True,
+                   stdout=subprocess.DEVNULL)
+    return java
+
+def main(argv):
+    opts = {'lines': 50000, 'reps': 5, 'base': None}
+    for arg in argv:
+        m = re.match(r'--(\w+)=(.+)$', arg)
+        if not m or m.group(1) not in opts or (m.group(1) != 'base' and not m.group(2).isdigit()):
+            print('usage: allocbench.py [--lines=N] [--reps=N] [--base=REV]', file=sys.stderr)
+            return 2
+        opts[m.group(1)] = m.group(2) if m.group(1) == 'base' else int(m.group(2))
+    if not shutil.which('javac') or not shutil.which('java'):
+        print('allocbench: javac and java are required', file=sys.stderr)
+        return 1
+    dir = tempfile.mkdtemp(prefix='allocbench')
+    try:
+        with open(os.path.join(dir, 'grammar'), 'w') as f:
+            f.write(GRAMMAR)
+        input = os.path.join(dir, 'input')
+        with open(input, 'w') as f:
+            f.write(source(opts['lines']))
+        builds = [('current', build(dir, 'current'))]
+        if opts['base']:
+            scan = subprocess.run(['git', 'show', '%s:Std/Scan.java' % opts['base']],
+                                  cwd=ROOT, check=True, stdout=subprocess.PIPE,
+                                  universal_newlines=True).stdout
+            builds.insert(0, (opts['base'], build(dir, 'base', scan)))
+        print('%10s %8s %6s %10s %12s %14s' % ('scan', 'mode', 'text', 'tokens',
+                                              'bytes/token', 'tokens/sec'))
+        for (name, java) in builds:
+            for mode in ['line', 'buffer']:
+                for text in ['eager', 'lazy']:
+                    out = subprocess.run(['java', '-cp', java, 'AllocBench', input,
+                                          mode, text, str(opts['reps'])],
+                                         check=True, stdout=subprocess.PIPE,
+                                         universal_newlines=True)
+                    (count, bytes, nanos) = [int(x) for x in out.stdout.split()]
+                    print('%10s %8s %6s %10d %12.1f %14.0f' % (name, mode, text, count,
+                                                              bytes / count,
+                                                              count / (nanos / 1e9)))
+    finally:
+        shutil.rmtree(dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,155 @@
+# -*-python-*-
+
+# Scanner benchmark for a grammar with many keyword tokens.
+#
+# Generates a grammar with a given number of keywords (plus identifiers,
+# numbers and punctuation) and an input file using all of them, runs plcc
+# on it, and times the generated Scan class over the input in four
+# variants: 'all' tries every token pattern at each token (the Token.first
+# and Token.keyword tables are replaced by nulls, so every pattern is a
+# candidate), 'nokw' tries the patterns of the candidates for the current
+# char, keywords included (only Token.keyword is replaced by nulls),
+# 'index' tries the candidates other than keywords and looks the keywords
+# up in the keyword table, and 'dfa' uses the --dfa scanner tables.
+# Needs javac and java on the PATH.
+#
+# usage: python3 bench/kwbench.py [--keywords=N] [--lines=N] [--reps=N]
+
+import sys
+import os
+import re
+import random
+import shutil
+import subprocess
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HARNESS = """\
+import java.nio.file.*;
+
+public class KwBench {
+    public static void main(String [] args) throws Exception {
+        String text = new String(Files.readAllBytes(Paths.get(args[0])), "UTF-8");
+        int reps = Integer.parseInt(args[1]);
+        long best = Long.MAX_VALUE;
+        int count = 0;
+        for (int r=0 ; r<reps ; r++) {
+            long t0 = System.nanoTime();
+            Scan scn = new Scan(text);
+            count = 0;
+            while (scn.cur() != null) {
+                count++;
+                scn.adv();
+            }
+            best = Math.min(best, System.nanoTime() - t0);
+        }
+        System.out.println(count + " " + best);
+    }
+}
+"""
+
+def keywords(n):
+    # return n distinct keyword spellings, some sharing prefixes
+    words = []
+    for i in range(n):
+        words.append('kw' + chr(ord('a') + i % 26) + str(i // 26))
+    return words
+
+def grammar(words):
+    lines = ['skip WHITESPACE \'\\s+\'']
+    lines += ['token K%d \'%s\'' % (i, w) for (i, w) in enumerate(words)]
+    lines += ['token LP \'\\(\'', 'token RP \'\\)\'', 'token SEMI \';\'']
+    lines += ['token NUM \'\\d+\'', 'token ID \'[A-Za-z_]\\w*\'']
+    lines += ['%', '<prog> ::= <items>', '<items> **= <item>']
+    lines += ['<item>:Kw%d ::= K%d' % (i, i) for i in range(len(words))]
+    lines += ['<item>:Id ::= <ID>', '<item>:Num ::= <NUM>']
+    lines += ['<item>:Punct ::= LP SEMI RP']
+    return '\n'.join(lines) + '\n'
+
+def source(words, nlines):
+    # return an input of nlines lines mixing keywords, identifiers
+    # (including ones with keyword prefixes), numbers and punctuation
+    rnd = random.Random(1)
+    out = []
+    for i in range(nlines):
+        items = []
+        for j in range(10):
+            r = rnd.random()
+            if r < 0.5:
+                items.append(rnd.choice(words))
+            elif r < 0.6:
+                items.append(rnd.choice(words) + 'x')
+            elif r < 0.8:
+                items.append('name%d' % rnd.randrange(1000))
+            elif r < 0.9:
+                items.append(str(rnd.randrange(100000)))
+            else:
+                items.append('( ; )')
+        out.append(' '.join(items))
+    return '\n'.join(out) + '\n'
+
+def nullTable(text, name):
+    # replace the entries of the String [] table name in text by nulls
+    def nulls(m):
+        return re.sub(r'^(        )".*", //', r'\1null, //', m.group(), flags=re.M)
+    return re.sub(r'String \[\] %s = \{.*?\};' % name, nulls, text, flags=re.S)
+
+def build(dir, args, tables=()):
+    # run plcc on the grammar in dir with args and compile the result,
+    # with the Token tables named in tables replaced by nulls
+    java = os.path.join(dir, 'Java')
+    shutil.rmtree(java, ignore_errors=True)
+    env = dict(os.environ, LIBPLCC=ROOT)
+    subprocess.run([sys.executable, os.path.join(ROOT, 'plcc.py')] + args + ['grammar'],
+                   cwd=dir, env=env, check=True, stdout=subprocess.DEVNULL)
+    if tables:
+        fname = os.path.join(java, 'Token.java')
+        with open(fname) as f:
+            text = f.read()
+        for name in tables:
+            text = nullTable(text, name)
+        with open(fname, 'w') as f:
+            f.write(text)
+    with open(os.path.join(java, 'KwBench.java'), 'w') as f:
+        f.write(HARNESS)
+    subprocess.run('javac -nowarn *.java', cwd=java, check=True, shell=True,
+                   stdout=subprocess.DEVNULL)
+    return java
+
+def main(argv):
+    opts = {'keywords': 100, 'lines': 20000, 'reps': 5}
+    for arg in argv:
+        m = re.match(r'--(\w+)=(\d+)$', arg)
+        if not m or m.group(1) not in opts:
+            print('usage: kwbench.py [--keywords=N] [--lines=N] [--reps=N]', file=sys.stderr)
+            return 2
+        opts[m.group(1)] = int(m.group(2))
+    if not shutil.which('javac') or not shutil.which('java'):
+        print('kwbench: javac and java are required', file=sys.stderr)
+        return 1
+    words = keywords(opts['keywords'])
+    dir = tempfile.mkdtemp(prefix='kwbench')
+    try:
+        with open(os.path.join(dir, 'grammar'), 'w') as f:
+            f.write(grammar(words))
+        input = os.path.join(dir, 'input')
+        with open(input, 'w') as f:
+            f.write(source(words, opts['lines']))
+        print('%8s %8s %10s %12s %14s' % ('variant', 'keywords', 'tokens', 'best(ms)', 'tokens/sec'))
+        for (variant, args, tables) in [('all', [], ['first', 'keyword']),
+                                        ('nokw', [], ['keyword']),
+                                        ('index', [], []),
+                                        ('dfa', ['--dfa'], [])]:
+            java = build(dir, args, tables)
+            out = subprocess.run(['java', '-cp', java, 'KwBench', input, str(opts['reps'])],
+                                 check=True, stdout=subprocess.PIPE, universal_newlines=True)
+            (count, nanos) = [int(x) for x in out.stdout.split()]
+            print('%8s %8d %10d %12.1f %14.0f' % (variant, len(words), count,
+                                                  nanos / 1e6, count / (nanos / 1e9)))
+    finally:
+        shutil.rmtree(dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,136 @@
+# -*-python-*-
+
+# Scaling benchmark for the LL(1) analysis in plcc.py (checkLL1).
+#
+# Builds synthetic LL(1) grammars with a given number of nonterminals,
+# times checkLL1 on each of them, and checks that its cases agree with
+# those of the original fixpoint-sweep algorithm (sweepLL1 below).
+#
+# usage: python3 bench/llbench.py [--nosweep] [size ...]
+
+import sys
+import os
+import io
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import plcc
+
+def grammar(n):
+    # return the text of a synthetic LL(1) grammar with about 3*n nonterms:
+    # a chain of leading nonterms <e0> ... <en> (the worst case for a
+    # sweep in rule order), each with a nullable tail <t..> so that
+    # follow sets propagate back down the chain, and arbno lists <l..>
+    # with and without separators that recurse back to the start
+    lines = ['skip WHITESPACE \'\\s+\'']
+    lines += ['token LP \'\\(\'', 'token RP \'\\)\'', 'token COMMA \',\'']
+    lines += ['token K%d \'k%d\'' % (i, i) for i in range(n)]
+    lines += ['token P%d \'p%d\'' % (i, i) for i in range(n)]
+    lines += ['%', '<prog> ::= <e0>']
+    for i in range(n):
+        if i + 1 < n:
+            lines.append('<e%d>:E%dx ::= <e%d> <t%d>' % (i, i, i + 1, i))
+        lines.append('<e%d>:E%dk ::= K%d <l%d>' % (i, i, i, i))
+        lines.append('<t%d>:T%dp ::= P%d' % (i, i, i))
+        lines.append('<t%d>:T%dn ::=' % (i, i))
+        if i % 2:
+            lines.append('<l%d> **= LP <prog> RP +COMMA' % i)
+        else:
+            lines.append('<l%d> **= LP <prog> RP' % i)
+    lines.append('%')
+    return '\n'.join(lines) + '\n'
+
+def load(text):
+    # reset plcc and run its lexical and grammar phases on the grammar text,
+    # without the LL(1) check; return the plcc module
+    plcc.plccInit()
+    plcc.Texts['<text>'] = text
+    plcc.argv = ['<text>']
+    plcc.flags['nowrite'] = True
+    plcc.flags['LL1'] = False
+    plcc.Out = io.StringIO()
+    nxt = plcc.nextLine()
+    plcc.lex(nxt)
+    plcc.par(nxt)
+    plcc.Out = None
+    return plcc
+
+def sweepLL1(rules, nonterms, isTerm):
+    # the original fixpoint-sweep computation of the switch sets,
+    # returning a map of each class and nonterm to its cases
+    first = {nt: set() for nt in nonterms}
+    follow = {nt: set() for nt in nonterms}
+    def getFirst(form):
+        if len(form) == 0:
+            return {'Null'}
+        tnt = form[0]
+        if isTerm(tnt):
+            return {tnt}
+        fst = set()
+        for t in first[tnt]:
+            if t != 'Null':
+                fst.add(t)
+            else:
+                fst.update(getFirst(form[1:]))
+        return fst
+    modified = True
+    while modified:
+        modified = False
+        for (nt, cls, rhs) in rules:
+            fst = first[nt]
+            fct = len(fst)
+            fst.update(getFirst(rhs))
+            if len(fst) != fct:
+                modified = True
+    modified = True
+    while modified:
+        modified = False
+        for (nt, cls, rhs) in rules:
+            rhs = rhs[:]
+            while rhs:
+                tnt = rhs.pop(0)
+                if not isTerm(tnt):
+                    fol = follow[tnt]
+                    fct = len(fol)
+                    for t in getFirst(rhs):
+                        if t == 'Null':
+                            fol.update(follow[nt])
+                        else:
+                            fol.add(t)
+                    if len(fol) != fct:
+                        modified = True
+    cases = {}
+    for (nt, cls, rhs) in rules:
+        fst = getFirst(rhs)
+        if 'Null' in fst:
+            fst = (fst - {'Null'}) | follow[nt]
+        if cls != None:
+            cases[cls] = fst
+        cases.setdefault(nt, set()).update(fst)
+    return cases
+
+def main(argv):
+    sweep = True
+    if argv and argv[0] == '--nosweep':
+        sweep = False
+        argv = argv[1:]
+    sizes = [int(a) for a in argv] or [100, 300, 1000, 3000]
+    print('%8s %8s %8s %12s %12s' % ('size', 'nonterms', 'rules', 'checkLL1(s)', 'sweep(s)'))
+    for n in sizes:
+        p = load(grammar(n))
+        t0 = time.perf_counter()
+        p.checkLL1()
+        t1 = time.perf_counter()
+        ts = '-'
+        if sweep:
+            ref = sweepLL1(p.rules, p.nonterms, p.isTerm)
+            ts = '%12.3f' % (time.perf_counter() - t1)
+            got = {k: set(p.termNames(v)) for (k, v) in p.cases.items()}
+            if got != ref:
+                print('size %d: cases differ from the sweep algorithm' % n)
+                return 1
+        print('%8d %8d %8d %12.3f %12s' % (n, len(p.nonterms), len(p.rules), t1 - t0, ts))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,130 @@
+# -*-python-*-
+
+# Parser benchmark: recursive-descent stubs versus the table-driven
+# parser generated with plcc's --table flag.
+#
+# Generates a small expression grammar and two inputs: a wide one with
+# many shallow expressions, timed in both parsers, and a deep one with
+# a single expression nested a given number of levels, which the
+# recursive parser can only handle if the Java stack is big enough.
+# Needs javac and java on the PATH.
+#
+# usage: python3 bench/parsebench.py [--lines=N] [--depth=N] [--reps=N]
+
+import sys
+import os
+import re
+import random
+import shutil
+import subprocess
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+GRAMMAR = """\
+skip WHITESPACE '\\s+'
+token LP '\\('
+token RP '\\)'
+token COMMA ','
+token NUM '\\d+'
+token ID '[a-z]\\w*'
+%
+<prog> ::= <exps>
+<exps> **= <exp>
+<exp>:Num ::= <NUM>
+<exp>:Var ::= <ID>
+<exp>:Call ::= LP <ID> <args> RP
+<args> **= <exp> +COMMA
+%
+"""
+
+HARNESS = """\
+import java.nio.file.*;
+
+public class ParseBench {
+    public static void main(String [] args) throws Exception {
+        String text = new String(Files.readAllBytes(Paths.get(args[0])), "UTF-8");
+        int reps = Integer.parseInt(args[1]);
+        long best = Long.MAX_VALUE;
+        String result = "ok";
+        for (int r=0 ; r<reps ; r++) {
+            long t0 = System.nanoTime();
+            try {
+                PLCC$Start.parse(Scan.buffer(text), null);
+            } catch (StackOverflowError e) {
+                result = "overflow";
+                break;
+            }
+            best = Math.min(best, System.nanoTime() - t0);
+        }
+        System.out.println(result + " " + best);
+    }
+}
+"""
+
+def exp(rnd, depth):
+    r = rnd.random()
+    if depth == 0 or r < 0.4:
+        return str(rnd.randrange(1000)) if r < 0.2 else 'x%d' % rnd.randrange(100)
+    n = rnd.randrange(1, 4)
+    return '(f ' + ', '.join([exp(rnd, depth - 1) for i in range(n)]) + ')'
+
+def wide(nlines):
+    # an input of nlines shallow expressions
+    rnd = random.Random(1)
+    return '\n'.join([exp(rnd, 4) for i in range(nlines)]) + '\n'
+
+def deep(depth):
+    # one expression nested depth levels deep
+    return '(f ' * depth + '1' + ')' * depth + '\n'
+
+def build(dir, args):
+    # run plcc on the grammar in dir with args and compile the result
+    java = os.path.join(dir, 'Java')
+    shutil.rmtree(java, ignore_errors=True)
+    env = dict(os.environ, LIBPLCC=ROOT)
+    subprocess.run([sys.executable, os.path.join(ROOT, 'plcc.py')] + args + ['grammar'],
+                   cwd=dir, env=env, check=True, stdout=subprocess.DEVNULL)
+    with open(os.path.join(java, 'ParseBench.java'), 'w') as f:
+        f.write(HARNESS)
+    subprocess.run('javac -nowarn *.java', cwd=java, check=True, shell=True,
+                   stdout=subprocess.DEVNULL)
+    return java
+
+def main(argv):
+    opts = {'lines': 20000, 'depth': 100000, 'reps': 5}
+    for arg in argv:
+        m = re.match(r'--(\w+)=(\d+)$', arg)
+        if not m or m.group(1) not in opts:
+            print('usage: parsebench.py [--lines=N] [--depth=N] [--reps=N]', file=sys.stderr)
+            return 2
+        opts[m.group(1)] = int(m.group(2))
+    if not shutil.which('javac') or not shutil.which('java'):
+        print('parsebench: javac and java are required', file=sys.stderr)
+        return 1
+    dir = tempfile.mkdtemp(prefix='parsebench')
+    try:
+        with open(os.path.join(dir, 'grammar'), 'w') as f:
+            f.write(GRAMMAR)
+        inputs = [('wide', wide(opts['lines']), opts['reps']),
+                  ('deep', deep(opts['depth']), 1)]
+        for (name, text, reps) in inputs:
+            with open(os.path.join(dir, name), 'w') as f:
+                f.write(text)
+        print('%10s %8s %10s %12s' % ('parser', 'input', 'result', 'best(ms)'))
+        for (parser, args) in [('recursive', []), ('table', ['--table'])]:
+            java = build(dir, args)
+            for (name, text, reps) in inputs:
+                out = subprocess.run(['java', '-cp', java, 'ParseBench',
+                                      os.path.join(dir, name), str(reps)],
+                                     check=True, stdout=subprocess.PIPE,
+                                     universal_newlines=True)
+                (result, nanos) = out.stdout.split()
+                ms = '-' if result != 'ok' else '%.1f' % (int(nanos) / 1e6)
+                print('%10s %8s %10s %12s' % (parser, name, result, ms))
+    finally:
+        shutil.rmtree(dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,226 @@
+# -*-python-*-
+
+# Benchmark suite for plcc.py on synthetic grammars.
+#
+# Generates LL(1) grammars of a configurable size -- tokens, plain rules,
+# arbno rules with and without +SEP separators, abstract classes and the
+# number of classes derived from each, and semantic sections -- and runs
+# the complete plcc pipeline on them (as main() does, but in-process) in
+# --nowrite mode and in writing mode (into a scratch directory).
+#
+# For each grammar and mode, wall is the best total time over --reps
+# runs, and phases holds the phase times and peak memory from one more
+# run with plcc's --profile flag (whose memory tracing makes those times
+# somewhat larger).  Results are JSON lines with sorted keys, one per
+# grammar and mode, written to standard output or to --out=FILE; compare
+# two such files (from different commits, say) with --compare.
+#
+# usage: python3 bench/plccbench.py [--preset=NAME] [--reps=N] [--out=FILE]
+#            [--tokens=N] [--rules=N] [--arbno=N] [--separbno=N]
+#            [--abstract=N] [--fanout=N] [--sem=N] [--semlines=N]
+#        python3 bench/plccbench.py --compare OLD NEW
+
+import sys
+import os
+import io
+import re
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import plcc
+
+FORMAT = 1   # the version of the output format
+
+PRESETS = {
+    'small':  {'tokens': 20, 'rules': 10, 'arbno': 2, 'separbno': 2,
+               'abstract': 2, 'fanout': 3, 'sem': 10, 'semlines': 5},
+    'medium': {'tokens': 200, 'rules': 100, 'arbno': 20, 'separbno': 20,
+               'abstract': 20, 'fanout': 5, 'sem': 100, 'semlines': 20},
+    'large':  {'tokens': 1000, 'rules': 1000, 'arbno': 200, 'separbno': 200,
+               'abstract': 100, 'fanout': 10, 'sem': 1000, 'semlines': 50},
+}
+
+def grammar(p):
+    """
+    return the text of a grammar with the parameters in p.  Every rule
+    (and every alternative of an abstract class) begins with a keyword
+    token of its own, so the grammar is LL(1) by construction; there are
+    at least p['tokens'] tokens, more if the rules need them
+    """
+    kw = []
+    def keyword():
+        kw.append('K%d' % len(kw))
+        return kw[-1]
+    rules = ['<prog> ::= <stmts>', '<stmts> **= <stmt>']
+    classes = []
+    nabs = max(1, p['abstract'])
+    for i in range(nabs):
+        for j in range(max(1, p['fanout'])):
+            cls = 'E%dx%d' % (i, j)
+            if j % 2:
+                rules.append('<exp%d>:%s ::= %s <NUM>' % (i, cls, keyword()))
+            else:
+                rules.append('<exp%d>:%s ::= %s <ID> <exp%d>' % (i, cls, keyword(), (i + 1) % nabs))
+            classes.append(cls)
+    for i in range(p['rules']):
+        cls = 'R%d' % i
+        rules.append('<stmt>:%s ::= %s <ID> EQUALS <exp%d> SEMI' % (cls, keyword(), i % nabs))
+        classes.append(cls)
+    for i in range(p['arbno']):
+        rules.append('<stmt>:A%d ::= %s LPAREN <list%d> RPAREN' % (i, keyword(), i))
+        rules.append('<list%d> **= %s <ID>' % (i, keyword()))
+        classes.append('A%d' % i)
+    for i in range(p['separbno']):
+        rules.append('<stmt>:S%d ::= %s LPAREN <slist%d> RPAREN' % (i, keyword(), i))
+        rules.append('<slist%d> **= <exp%d> +COMMA' % (i, i % nabs))
+        classes.append('S%d' % i)
+    while len(kw) < p['tokens']:
+        keyword()
+    lines = ['skip WHITESPACE \'\\s+\'', 'skip COMMENT \'#.*\'']
+    lines += ['token %s \'%s\'' % (k, k.lower()) for k in kw]
+    lines += ['token EQUALS \'=\'', 'token SEMI \';\'', 'token COMMA \',\'',
+              'token LPAREN \'\\(\'', 'token RPAREN \'\\)\'',
+              'token NUM \'\\d+\'', 'token ID \'[A-Za-z_]\\w*\'']
+    lines += ['%'] + rules + ['%']
+    for cls in classes[:p['sem']]:
+        lines += [cls, '%%%']
+        lines += ['    public int sem() {']
+        lines += ['        int x%d = %d; // line %d of %s' % (i, i, i, cls)
+                  for i in range(p['semlines'])]
+        lines += ['        return 0;', '    }', '%%%']
+    return '\n'.join(lines) + '\n'
+
+def run(fname, args, profile=None):
+    # run the plcc pipeline on the grammar file fname with the command
+    # line args, as main() does, returning the elapsed time
+    plcc.argv = args + [fname]
+    if profile:
+        plcc.argv.insert(0, '--profile=%s' % profile)
+    plcc.Out = io.StringIO()
+    t0 = time.perf_counter()
+    try:
+        plcc.plccInit()
+        plcc.processArgs()
+        plcc.plcc()
+    except plcc.PlccDone:
+        pass
+    t1 = time.perf_counter()
+    plcc.Out = None
+    return t1 - t0
+
+def measure(name, p, reps, dir):
+    # return the results for the grammar with parameters p
+    fname = os.path.join(dir, 'grammar')
+    with open(fname, 'w') as f:
+        f.write(grammar(p))
+    results = []
+    for mode in ['nowrite', 'write']:
+        dest = os.path.join(dir, 'Java')
+        args = ['--libplcc=' + os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'),
+                '--destdir=' + dest]
+        if mode == 'nowrite':
+            args.append('--nowrite')
+        walls = []
+        for i in range(reps):
+            shutil.rmtree(dest, ignore_errors=True)
+            walls.append(run(fname, args))
+        shutil.rmtree(dest, ignore_errors=True)
+        prof = os.path.join(dir, 'profile.json')
+        run(fname, args, profile=prof)
+        with open(prof) as f:
+            report = json.load(f)
+        phases = {}
+        for (phase, v) in report['phases'].items():
+            phases[phase] = {'wall': round(v['wall'], 6), 'peak': v['peak']}
+        results.append({
+            'format': FORMAT,
+            'commit': commit(),
+            'grammar': name,
+            'params': p,
+            'mode': mode,
+            'wall': round(min(walls), 6),
+            'peak': report['peak'],
+            'phases': phases,
+        })
+    return results
+
+def commit():
+    # the current git commit of plcc.py, if known
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                             cwd=os.path.dirname(os.path.abspath(plcc.__file__)),
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             universal_newlines=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(old, new):
+    # print the wall times of two result files side by side
+    def load(fname):
+        rows = {}
+        with open(fname) as f:
+            for line in f:
+                if line.strip():
+                    r = json.loads(line)
+                    rows[(r['grammar'], r['mode'])] = r
+        return rows
+    a = load(old)
+    b = load(new)
+    print('%-8s %-8s %-16s %12s %12s %8s' % ('grammar', 'mode', 'phase', 'old(s)', 'new(s)', 'ratio'))
+    for key in sorted(set(a) & set(b)):
+        pairs = [('total', a[key]['wall'], b[key]['wall'])]
+        for phase in sorted(set(a[key]['phases']) & set(b[key]['phases'])):
+            pairs.append((phase, a[key]['phases'][phase]['wall'], b[key]['phases'][phase]['wall']))
+        for (phase, x, y) in pairs:
+            ratio = '%8.2f' % (y / x) if x > 0 else '%8s' % '-'
+            print('%-8s %-8s %-16s %12.6f %12.6f %s' % (key[0], key[1], phase, x, y, ratio))
+    return 0
+
+def main(argv):
+    if argv and argv[0] == '--compare':
+        if len(argv) != 3:
+            print('usage: plccbench.py --compare OLD NEW', file=sys.stderr)
+            return 2
+        return compare(argv[1], argv[2])
+    opts = {'preset': None, 'reps': '3', 'out': None}
+    params = {}
+    for arg in argv:
+        m = re.match(r'--(\w+)=(.+)$', arg)
+        if m and m.group(1) in opts:
+            opts[m.group(1)] = m.group(2)
+        elif m and m.group(1) in PRESETS['small'] and m.group(2).isdigit():
+            params[m.group(1)] = int(m.group(2))
+        else:
+            print('plccbench: bad argument %s' % arg, file=sys.stderr)
+            return 2
+    if opts['preset'] and opts['preset'] not in PRESETS:
+        print('plccbench: presets are %s' % ', '.join(sorted(PRESETS)), file=sys.stderr)
+        return 2
+    if params:
+        p = dict(PRESETS[opts['preset'] or 'small'])
+        p.update(params)
+        configs = [('custom', p)]
+    elif opts['preset']:
+        configs = [(opts['preset'], PRESETS[opts['preset']])]
+    else:
+        configs = [(name, PRESETS[name]) for name in ['small', 'medium', 'large']]
+    out = open(opts['out'], 'w') if opts['out'] else sys.stdout
+    dir = tempfile.mkdtemp(prefix='plccbench')
+    try:
+        for (name, p) in configs:
+            for r in measure(name, p, int(opts['reps']), dir):
+                print(json.dumps(r, sort_keys=True), file=out)
+                out.flush()
+    finally:
+        shutil.rmtree(dir)
+        if out != sys.stdout:
+            out.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
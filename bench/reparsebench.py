@@ -0,0 +1,179 @@
+# -*-python-*-
+
+# Incremental reparse benchmark for plcc's --reparse flag.
+#
+# Generates a statement grammar and a large input, then times a full
+# parse against PLCC$Reparse.edit for random small edits (changing a
+# number, inserting a statement, deleting one), checking after each
+# edit that the tree equals the one from a full parse of the new input.
+# Needs javac and java on the PATH.
+#
+# usage: python3 bench/reparsebench.py [--stmts=N] [--edits=N]
+
+import sys
+import os
+import re
+import random
+import shutil
+import subprocess
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+GRAMMAR = """\
+skip WHITESPACE '\\s+'
+token EQUALS '='
+token SEMI ';'
+token LBRACE '\\{'
+token RBRACE '\\}'
+token PLUS '\\+'
+token NUM '\\d+'
+token ID '[a-z]\\w*'
+%
+<prog> ::= <stmts>
+<stmts> **= <stmt>
+<stmt>:Assign ::= <ID> EQUALS <exp> SEMI
+<stmt>:Block ::= LBRACE <stmts> RBRACE
+<exp> ::= <term> <terms>
+<terms> **= PLUS <term>
+<term>:Num ::= <NUM>
+<term>:Var ::= <ID>
+%
+"""
+
+HARNESS = """\
+import java.lang.reflect.*;
+import java.nio.file.*;
+import java.util.*;
+
+public class ReparseBench {
+
+    // structural equality of trees, with tokens compared by value,
+    // text and line number
+    static boolean same(Object a, Object b) throws Exception {
+        if (a == null || b == null)
+            return a == b;
+        if (a.getClass() != b.getClass())
+            return false;
+        if (a instanceof Token) {
+            Token s = (Token)a, t = (Token)b;
+            return s.val == t.val && s.toString().equals(t.toString()) && s.lno == t.lno;
+        }
+        if (a instanceof List) {
+            List<?> s = (List<?>)a, t = (List<?>)b;
+            if (s.size() != t.size())
+                return false;
+            for (int i=0 ; i<s.size() ; i++)
+                if (!same(s.get(i), t.get(i)))
+                    return false;
+            return true;
+        }
+        for (Field f : a.getClass().getFields())
+            if (!Modifier.isStatic(f.getModifiers()) && !same(f.get(a), f.get(b)))
+                return false;
+        return true;
+    }
+
+    public static void main(String [] args) throws Exception {
+        String text = new String(Files.readAllBytes(Paths.get(args[0])), "UTF-8");
+        int edits = Integer.parseInt(args[1]);
+        Random rnd = new Random(1);
+        long t0 = System.nanoTime();
+        PLCC$Reparse rp = new PLCC$Reparse();
+        rp.parse(text);
+        long full = System.nanoTime() - t0;
+        long total = 0;
+        long parsed = 0;
+        int done = 0;
+        for (int e=0 ; e<edits ; e++) {
+            String s = rp.text();
+            int pos, len;
+            String repl;
+            int k = rnd.nextInt(3);
+            if (k == 0) {
+                // change a digit
+                do pos = rnd.nextInt(s.length()); while (!Character.isDigit(s.charAt(pos)));
+                len = 1;
+                repl = "" + rnd.nextInt(10);
+            } else if (k == 1) {
+                // insert a statement after a semicolon
+                pos = s.indexOf(';', rnd.nextInt(s.length())) + 1;
+                len = 0;
+                repl = " q = 1 + r;";
+            } else {
+                // delete a simple statement
+                pos = s.indexOf(';', rnd.nextInt(s.length())) + 1;
+                int end = s.indexOf(';', pos) + 1;
+                int brace = s.indexOf('{', pos);
+                int close = s.indexOf('}', pos);
+                if (pos == 0 || end == 0 || (brace >= 0 && brace < end) || (close >= 0 && close < end))
+                    continue;
+                len = end - pos;
+                repl = "";
+            }
+            long t1 = System.nanoTime();
+            Object tree = rp.edit(pos, len, repl);
+            total += System.nanoTime() - t1;
+            parsed += rp.parsed;
+            done++;
+            Object want = PLCC$Start.parse(Scan.buffer(rp.text()), null);
+            if (!same(tree, want)) {
+                System.out.println("MISMATCH after edit " + e);
+                System.exit(1);
+            }
+        }
+        System.out.println(full + " " + total + " " + parsed + " " + done);
+    }
+}
+"""
+
+def stmt(rnd, depth):
+    if depth < 2 and rnd.random() < 0.1:
+        return '{ ' + ' '.join([stmt(rnd, depth + 1) for i in range(rnd.randrange(1, 5))]) + ' }'
+    terms = [str(rnd.randrange(1000)) if rnd.random() < 0.5 else 'v%d' % rnd.randrange(50)
+             for i in range(rnd.randrange(1, 4))]
+    return 'v%d = %s;' % (rnd.randrange(50), ' + '.join(terms))
+
+def source(nstmts):
+    rnd = random.Random(1)
+    return '\n'.join([stmt(rnd, 0) for i in range(nstmts)]) + '\n'
+
+def main(argv):
+    opts = {'stmts': 100000, 'edits': 200}
+    for arg in argv:
+        m = re.match(r'--(\w+)=(\d+)$', arg)
+        if not m or m.group(1) not in opts:
+            print('usage: reparsebench.py [--stmts=N] [--edits=N]', file=sys.stderr)
+            return 2
+        opts[m.group(1)] = int(m.group(2))
+    if not shutil.which('javac') or not shutil.which('java'):
+        print('reparsebench: javac and java are required', file=sys.stderr)
+        return 1
+    dir = tempfile.mkdtemp(prefix='reparsebench')
+    try:
+        with open(os.path.join(dir, 'grammar'), 'w') as f:
+            f.write(GRAMMAR)
+        input = os.path.join(dir, 'input')
+        with open(input, 'w') as f:
+            f.write(source(opts['stmts']))
+        env = dict(os.environ, LIBPLCC=ROOT)
+        subprocess.run([sys.executable, os.path.join(ROOT, 'plcc.py'), '--reparse', 'grammar'],
+                       cwd=dir, env=env, check=True, stdout=subprocess.DEVNULL)
+        java = os.path.join(dir, 'Java')
+        with open(os.path.join(java, 'ReparseBench.java'), 'w') as f:
+            f.write(HARNESS)
+        subprocess.run('javac -nowarn *.java', cwd=java, check=True, shell=True,
+                       stdout=subprocess.DEVNULL)
+        out = subprocess.run(['java', '-cp', java, 'ReparseBench', input, str(opts['edits'])],
+                             check=True, stdout=subprocess.PIPE, universal_newlines=True)
+        (full, total, parsed, edits) = [int(x) for x in out.stdout.split()]
+        print('%8s %8s %14s %16s %18s' % ('stmts', 'edits', 'full parse(ms)',
+                                          'mean edit(ms)', 'stmts parsed/edit'))
+        print('%8d %8d %14.1f %16.3f %18.2f' % (opts['stmts'], edits, full / 1e6,
+                                                total / edits / 1e6, parsed / edits))
+    finally:
+        shutil.rmtree(dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,278 @@
+# -*-python-*-
+
+# Round-trip test and benchmark for plcc's --serial flag.
+#
+# Generates a grammar with abstract classes and arbno rules with and
+# without separators, and runs plcc on it.  First, without a JDK, it
+# checks the generated Java: each class's write and read methods only
+# call PLCC$Serial, and for each class, PLCC$Serial reads back the
+# fields that it writes, in the same order, and pops the children that
+# it pushes, in the reverse order (see check).  Then it makes a large
+# input, parses it, writes the tree with Serial.Out, reads it back with
+# Serial.In and checks that the tree read equals the tree parsed.  It
+# reports the time to parse, to write and to read, the size of the
+# serialized tree against the size of the input, and the speedup of
+# reading over re-parsing.  That part needs javac and java on the PATH;
+# --check does only the first part.
+#
+# usage: python3 bench/serialbench.py [--stmts=N] [--reps=N] [--check]
+
+import sys
+import os
+import re
+import random
+import shutil
+import subprocess
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+GRAMMAR = """\
+skip WHITESPACE '\\s+'
+skip COMMENT '#[^\\n]*'
+token EQUALS '='
+token SEMI ';'
+token COMMA ','
+token LBRACE '\\{'
+token RBRACE '\\}'
+token LPAREN '\\('
+token RPAREN '\\)'
+token PLUS '\\+'
+token NUM '\\d+'
+token CALL 'call'
+token ID '[a-z]\\w*'
+%
+<prog> ::= <stmts>
+<stmts> **= <stmt>
+<stmt>:Assign ::= <ID> EQUALS <exp> SEMI
+<stmt>:Call ::= CALL <ID> LPAREN <args> RPAREN SEMI
+<stmt>:Block ::= LBRACE <stmts> RBRACE
+<args> **= <exp> +COMMA
+<exp> ::= <term> <terms>
+<terms> **= PLUS <term>
+<term>:Num ::= <NUM>
+<term>:Var ::= <ID>
+<term>:Paren ::= LPAREN <exp> RPAREN
+%
+"""
+
+HARNESS = """\
+import java.io.*;
+import java.lang.reflect.*;
+import java.nio.file.*;
+import java.util.*;
+
+public class SerialBench {
+
+    // structural equality of trees, with tokens compared by value,
+    // text and line number
+    static boolean same(Object a, Object b) throws Exception {
+        if (a == null || b == null)
+            return a == b;
+        if (a.getClass() != b.getClass())
+            return false;
+        if (a instanceof Token) {
+            Token s = (Token)a, t = (Token)b;
+            return s.val == t.val && s.toString().equals(t.toString()) && s.lno == t.lno;
+        }
+        if (a instanceof String)
+            return a.equals(b);
+        if (a instanceof List) {
+            List<?> s = (List<?>)a, t = (List<?>)b;
+            if (s.size() != t.size())
+                return false;
+            for (int i=0 ; i<s.size() ; i++)
+                if (!same(s.get(i), t.get(i)))
+                    return false;
+            return true;
+        }
+        for (Field f : a.getClass().getFields())
+            if (!Modifier.isStatic(f.getModifiers()) && !same(f.get(a), f.get(b)))
+                return false;
+        return true;
+    }
+
+    public static void main(String [] args) throws Exception {
+        String text = new String(Files.readAllBytes(Paths.get(args[0])), "UTF-8");
+        File out = new File(args[1]);
+        int reps = Integer.parseInt(args[2]);
+        long parse = Long.MAX_VALUE, write = Long.MAX_VALUE, read = Long.MAX_VALUE;
+        Prog tree = null, back = null;
+        for (int r=0 ; r<reps ; r++) {
+            long t0 = System.nanoTime();
+            tree = Prog.parse(Scan.buffer(text), null);
+            long t1 = System.nanoTime();
+            Serial.Out so = new Serial.Out(new FileOutputStream(out));
+            tree.write(so);
+            so.close();
+            long t2 = System.nanoTime();
+            Serial.In si = new Serial.In(new FileInputStream(out));
+            back = Prog.read(si);
+            si.close();
+            long t3 = System.nanoTime();
+            parse = Math.min(parse, t1 - t0);
+            write = Math.min(write, t2 - t1);
+            read = Math.min(read, t3 - t2);
+        }
+        if (!same(tree, back)) {
+            System.out.println("MISMATCH");
+            System.exit(1);
+        }
+        System.out.println(parse + " " + write + " " + read + " " + out.length());
+    }
+}
+"""
+
+def exp(rnd, depth):
+    terms = []
+    for i in range(rnd.randrange(1, 4)):
+        r = rnd.random()
+        if depth < 2 and r < 0.1:
+            terms.append('(' + exp(rnd, depth + 1) + ')')
+        elif r < 0.55:
+            terms.append(str(rnd.randrange(1000)))
+        else:
+            terms.append('v%d' % rnd.randrange(50))
+    return ' + '.join(terms)
+
+def stmt(rnd, depth):
+    r = rnd.random()
+    if depth < 2 and r < 0.1:
+        return '{ ' + ' '.join([stmt(rnd, depth + 1) for i in range(rnd.randrange(1, 5))]) + ' }'
+    if r < 0.3:
+        args = [exp(rnd, 1) for i in range(rnd.randrange(0, 4))]
+        return 'call f%d(%s);' % (rnd.randrange(20), ', '.join(args))
+    return 'v%d = %s;' % (rnd.randrange(50), exp(rnd, 0))
+
+def source(nstmts):
+    rnd = random.Random(1)
+    lines = []
+    for i in range(nstmts):
+        lines.append(stmt(rnd, 0))
+        if rnd.random() < 0.05:
+            lines.append('# a comment')
+    return '\n'.join(lines) + '\n'
+
+def cases(text, kind):
+    # return a map from class name to the lines of each '// kind Cls'
+    # case in the PLCC$Serial source text
+    found = {}
+    for m in re.finditer(r'case -?\d+: \{ // %s (\w+)\n(.*?)\n        \}' % kind, text, re.S):
+        found[m.group(1)] = m.group(2).split('\n')
+    return found
+
+def check(java):
+    # return a list of the problems found in the Java files that plcc
+    # generated in the directory java with the serial flag
+    problems = []
+    def read(name):
+        with open(os.path.join(java, name + '.java')) as f:
+            return f.read()
+    serial = read('PLCC$Serial')
+    enters = cases(serial, 'enter')
+    writes = cases(serial, 'write')
+    reads = cases(serial, 'read')
+    classes = sorted(reads)
+    for cls in re.findall(r'^<\w+>:(\w+)', GRAMMAR, re.M) + ['Prog', 'Stmts', 'Args', 'Exp', 'Terms']:
+        if not cls in reads or not cls in writes:
+            problems.append('%s: no PLCC$Serial cases' % cls)
+    for cls in classes:
+        text = read(cls)
+        # the class's methods must not recurse through other classes
+        for m in re.finditer(r'(?<![\w$])(\w+)\.(write|read)\((out|in)\$\)', text):
+            problems.append('%s: calls %s.%s' % (cls, m.group(1), m.group(2)))
+        for method in ['write', 'read']:
+            if not re.search(r'PLCC\$Serial\.%s\(' % method, text) and \
+               not (method == 'write' and re.search(r' extends \w+', text)):
+                problems.append('%s: %s does not use PLCC$Serial' % (cls, method))
+        # the fields, in constructor order
+        m = re.search(r'public %s\(([^)]+)\)' % cls, text)
+        fields = [p.split()[-1] for p in m.group(1).split(',') if p.strip()] if m else []
+        # the written fields (and list sizes) must be the ones read, in order
+        written = [m.group(1) for m in re.finditer(r'out\.write\w+\(n\.(\w+)', '\n'.join(writes[cls]))]
+        got = [m.group(1) for m in re.finditer(r'(\w+?)(?:\$n)? = in\$\.read', '\n'.join(reads[cls]))]
+        if written != got:
+            problems.append('%s: writes %s but reads %s' % (cls, written, got))
+        # the children pushed (last field first) must be the ones popped
+        pushed = [m.group(1) for m in re.finditer(r'n\.(\w+)', '\n'.join(enters.get(cls, [])))]
+        pushed = [f for (i, f) in enumerate(pushed) if f not in pushed[:i]]
+        popped = [m.group(1) for m in re.finditer(r'(\w+) = (?:\(\w+\)pop|popList)\(', '\n'.join(reads[cls]))]
+        if pushed != popped:
+            problems.append('%s: pushes %s but pops %s' % (cls, pushed, popped))
+        if [f for f in fields if f in pushed] != pushed[::-1]:
+            problems.append('%s: children %s not in field order %s' % (cls, pushed[::-1], fields))
+        if not 'push(new %s(%s), 0);' % (cls, ', '.join(fields)) in serial:
+            problems.append('%s: not built from its fields %s' % (cls, fields))
+        if set(fields) != set(written) | set(popped):
+            problems.append('%s: fields %s are not all serialized' % (cls, fields))
+        # a derived class's number must match its cases
+        m = re.search(r'int kind\$\(\) \{\s*return (\d+);', text)
+        if m and not re.search(r'case %s: \{ // (enter|write) %s\n' % (m.group(1), cls), serial):
+            problems.append('%s: kind$ %s has no case' % (cls, m.group(1)))
+    for base in ['Stmt', 'Term']:
+        if not 'public abstract int kind$();' in read(base):
+            problems.append('%s: no abstract kind$' % base)
+    # the separator is not part of the record of the list
+    if 'COMMA' in '\n'.join(writes.get('Args', [])):
+        problems.append('Args: writes its separator')
+    return problems
+
+def main(argv):
+    opts = {'stmts': 100000, 'reps': 5}
+    checkOnly = False
+    for arg in argv:
+        m = re.match(r'--(\w+)=(\d+)$', arg)
+        if arg == '--check':
+            checkOnly = True
+        elif not m or m.group(1) not in opts:
+            print('usage: serialbench.py [--stmts=N] [--reps=N] [--check]', file=sys.stderr)
+            return 2
+        else:
+            opts[m.group(1)] = int(m.group(2))
+    dir = tempfile.mkdtemp(prefix='serialbench')
+    try:
+        with open(os.path.join(dir, 'grammar'), 'w') as f:
+            f.write(GRAMMAR)
+        env = dict(os.environ, LIBPLCC=ROOT)
+        subprocess.run([sys.executable, os.path.join(ROOT, 'plcc.py'), '--serial', 'grammar'],
+                       cwd=dir, env=env, check=True, stdout=subprocess.DEVNULL)
+        java = os.path.join(dir, 'Java')
+        problems = check(java)
+        for p in problems:
+            print('serialbench: %s' % p, file=sys.stderr)
+        if problems:
+            return 1
+        print('serialbench: generated code checked')
+        if checkOnly:
+            return 0
+        if not shutil.which('javac') or not shutil.which('java'):
+            print('serialbench: javac and java are required', file=sys.stderr)
+            return 1
+        input = os.path.join(dir, 'input')
+        with open(input, 'w') as f:
+            f.write(source(opts['stmts']))
+        with open(os.path.join(java, 'SerialBench.java'), 'w') as f:
+            f.write(HARNESS)
+        subprocess.run('javac -nowarn *.java', cwd=java, check=True, shell=True,
+                       stdout=subprocess.DEVNULL)
+        out = subprocess.run(['java', '-Xss64m', '-cp', java, 'SerialBench', input,
+                              os.path.join(dir, 'tree.bin'), str(opts['reps'])],
+                             stdout=subprocess.PIPE, universal_newlines=True)
+        if out.returncode != 0:
+            print('serialbench: round trip failed: %s' % out.stdout.strip(), file=sys.stderr)
+            return 1
+        (parse, write, read, size) = [int(x) for x in out.stdout.split()]
+        print('%8s %10s %10s %10s %10s %12s %8s' % ('stmts', 'input(KB)', 'tree(KB)',
+                                                   'parse(ms)', 'write(ms)', 'read(ms)',
+                                                   'speedup'))
+        print('%8d %10.0f %10.0f %10.1f %10.1f %12.1f %8.2f' % (opts['stmts'],
+                                                               os.path.getsize(input) / 1024,
+                                                               size / 1024, parse / 1e6,
+                                                               write / 1e6, read / 1e6,
+                                                               parse / read))
+    finally:
+        shutil.rmtree(dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,195 @@
+# -*-python-*-
+
+# Benchmark for plcc's --visitor flag.
+#
+# Generates an expression grammar and two inputs, one wide (many short
+# statements) and one deep (an expression nested --depth parentheses
+# deep), parses each with the table-driven parser (which does not
+# recurse either), then counts the nodes of the tree with PLCC$Walk and
+# with a recursive count method in the semantic section, reporting the
+# time of each.  The recursive count is expected to overflow the Java
+# stack on the deep input, where the walk must not.  Needs javac and
+# java on the PATH.
+#
+# usage: python3 bench/walkbench.py [--stmts=N] [--depth=N] [--reps=N]
+
+import sys
+import os
+import re
+import random
+import shutil
+import subprocess
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+GRAMMAR = """\
+skip WHITESPACE '\\s+'
+token EQUALS '='
+token SEMI ';'
+token LPAREN '\\('
+token RPAREN '\\)'
+token PLUS '\\+'
+token NUM '\\d+'
+token ID '[a-z]\\w*'
+%
+<prog> ::= <stmts>
+<stmts> **= <stmt>
+<stmt> ::= <ID> EQUALS <exp> SEMI
+<exp> ::= <term> <terms>
+<terms> **= PLUS <term>
+<term>:Num ::= <NUM>
+<term>:Var ::= <ID>
+<term>:Paren ::= LPAREN <exp> RPAREN
+%
+Prog
+%%%
+    public int count() { return 1 + stmts.count(); }
+%%%
+Stmts
+%%%
+    public int count() {
+        int n = 1;
+        for (Stmt s : stmtList)
+            n += s.count();
+        return n;
+    }
+%%%
+Stmt
+%%%
+    public int count() { return 1 + exp.count(); }
+%%%
+Exp
+%%%
+    public int count() { return 1 + term.count() + terms.count(); }
+%%%
+Terms
+%%%
+    public int count() {
+        int n = 1;
+        for (Term t : termList)
+            n += t.count();
+        return n;
+    }
+%%%
+Term
+%%%
+    public abstract int count();
+%%%
+Num
+%%%
+    public int count() { return 1; }
+%%%
+Var
+%%%
+    public int count() { return 1; }
+%%%
+Paren
+%%%
+    public int count() { return 1 + exp.count(); }
+%%%
+"""
+
+HARNESS = """\
+import java.nio.file.*;
+
+public class WalkBench {
+
+    static class Counter implements PLCC$Visitor {
+        int n = 0;
+        public boolean enter(Prog x) { n++; return true; }
+        public boolean enter(Stmts x) { n++; return true; }
+        public boolean enter(Stmt x) { n++; return true; }
+        public boolean enter(Exp x) { n++; return true; }
+        public boolean enter(Terms x) { n++; return true; }
+        public boolean enter(Term x) { n++; return true; }
+    }
+
+    public static void main(String [] args) throws Exception {
+        String text = new String(Files.readAllBytes(Paths.get(args[0])), "UTF-8");
+        int reps = Integer.parseInt(args[1]);
+        Prog tree = Prog.parse(Scan.buffer(text), null);
+        long walk = Long.MAX_VALUE;
+        int nodes = 0;
+        for (int r=0 ; r<reps ; r++) {
+            long t0 = System.nanoTime();
+            Counter c = new Counter();
+            tree.walk(c);
+            walk = Math.min(walk, System.nanoTime() - t0);
+            nodes = c.n;
+        }
+        long rec = -1;
+        try {
+            for (int r=0 ; r<reps ; r++) {
+                long t0 = System.nanoTime();
+                int n = tree.count();
+                long t = System.nanoTime() - t0;
+                rec = (rec < 0) ? t : Math.min(rec, t);
+                if (n != nodes) {
+                    System.out.println("MISMATCH " + n + " " + nodes);
+                    System.exit(1);
+                }
+            }
+        } catch (StackOverflowError e) {
+            rec = -1;
+        }
+        System.out.println(nodes + " " + walk + " " + rec);
+    }
+}
+"""
+
+def wide(nstmts):
+    rnd = random.Random(1)
+    lines = []
+    for i in range(nstmts):
+        terms = [str(rnd.randrange(1000)) if rnd.random() < 0.5 else 'v%d' % rnd.randrange(50)
+                 for j in range(rnd.randrange(1, 5))]
+        lines.append('v%d = %s;' % (rnd.randrange(50), ' + '.join(terms)))
+    return '\n'.join(lines) + '\n'
+
+def deep(depth):
+    return 'v = %s1%s;\n' % ('(' * depth, ')' * depth)
+
+def main(argv):
+    opts = {'stmts': 500000, 'depth': 200000, 'reps': 5}
+    for arg in argv:
+        m = re.match(r'--(\w+)=(\d+)$', arg)
+        if not m or m.group(1) not in opts:
+            print('usage: walkbench.py [--stmts=N] [--depth=N] [--reps=N]', file=sys.stderr)
+            return 2
+        opts[m.group(1)] = int(m.group(2))
+    if not shutil.which('javac') or not shutil.which('java'):
+        print('walkbench: javac and java are required', file=sys.stderr)
+        return 1
+    dir = tempfile.mkdtemp(prefix='walkbench')
+    try:
+        with open(os.path.join(dir, 'grammar'), 'w') as f:
+            f.write(GRAMMAR)
+        env = dict(os.environ, LIBPLCC=ROOT)
+        subprocess.run([sys.executable, os.path.join(ROOT, 'plcc.py'), '--visitor', '--table',
+                        'grammar'],
+                       cwd=dir, env=env, check=True, stdout=subprocess.DEVNULL)
+        java = os.path.join(dir, 'Java')
+        with open(os.path.join(java, 'WalkBench.java'), 'w') as f:
+            f.write(HARNESS)
+        subprocess.run('javac -nowarn *.java', cwd=java, check=True, shell=True,
+                       stdout=subprocess.DEVNULL)
+        print('%6s %10s %10s %14s' % ('input', 'nodes', 'walk(ms)', 'recursive(ms)'))
+        for (name, text) in [('wide', wide(opts['stmts'])), ('deep', deep(opts['depth']))]:
+            input = os.path.join(dir, name)
+            with open(input, 'w') as f:
+                f.write(text)
+            out = subprocess.run(['java', '-cp', java, 'WalkBench', input, str(opts['reps'])],
+                                 stdout=subprocess.PIPE, universal_newlines=True)
+            if out.returncode != 0:
+                print('walkbench: %s: %s' % (name, out.stdout.strip()), file=sys.stderr)
+                return 1
+            (nodes, walk, rec) = [int(x) for x in out.stdout.split()]
+            recString = '%14.1f' % (rec / 1e6) if rec >= 0 else '%14s' % 'overflow'
+            print('%6s %10d %10.1f %s' % (name, nodes, walk / 1e6, recString))
+    finally:
+        shutil.rmtree(dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -3,7 +3,17 @@
 import sys
 import re
 import os
-import shutil
+import hashlib
+import json
+import io
+import copy
+import time
+import shlex
+import threading
+import atexit
+import tracemalloc
+import zipfile
+import concurrent.futures
 
 argv = sys.argv[1:] # skip over the command-line argument
 
@@ -14,6 +24,7 @@ Line = ''           # current line in the file
 STD = []            # reserved names from Std library classes
 STDT = []           # token-related files in the Std library directory
 STDP = []           # parse-related files in the Std library directory
+STDF = {}           # maps a flag to the Std library file copied when it is set
 
 flags = {}          # processing flags (dictionary)
 
@@ -22,15 +33,93 @@ skip = set()        # set of skip names
 term = set()        # set of term (token) names
 skipSpecs = []      # skip specifications for generating the Token file
 termSpecs = []      # term (token) specifications for generating the Token file
+termList = []       # term (token) names in declaration order
+termBits = {}       # maps a term name to its bit in a terminal set (an int bitmask)
+skipPats = {}       # maps a skip name to its (Java) regular expression
+termPats = {}       # maps a term name to its (Java) regular expression
+NULL = 1            # the bit for Null (the empty string) in a terminal set
 
 nonterms = set()    # set of all nonterms
 fields = {}         # maps a non-abstract class name to its list of fields
 rules = []          # list of items  of the form (nt, cls, rhs), one for each grammar rule
 extends = {}        # maps a derived class to its abstract base class
-derives = {}        # maps an abstract class to a list of its derived classes
-cases = {}          # maps a non-abstract class to its set of case terminals for use in a switch
+derives = {}        # maps an abstract class to a list of its derived classes (in rule order)
+cases = {}          # maps a non-abstract class to its terminal set of cases for use in a switch
 arbno = {}          # maps an arbno class name to its separator string (or None)
 stubs = {}          # maps a class name to its parser stub file
+tableIndex = {}     # maps a class name to its number in the parse tables (table flag)
+fieldTypes = {}     # maps a non-abstract class name to its (field, fieldType) list
+
+Inputs = {}         # maps each input file read to its content hash
+Outputs = {}        # maps each file written to destdir to its content hash
+Profile = None      # phase timings and counters (when profiling)
+Sink = None         # when a map, maps each generated file name to its contents
+Disk = True         # when False, generated files are not written to destdir
+Texts = {}          # maps pseudo file names to grammar text (for Compiler)
+Out = None          # stream for progress messages (None: standard output)
+Snapshot = None     # the saved state after the par phase (see saveState)
+Archive = None      # the archive being written, when generating into one
+Record = None       # when a list, the (fname, text) of each file written (see cacheSave)
+
+class PlccError(Exception):
+    # raised by death() and deathLNO() with the error message
+    pass
+
+class PlccDone(Exception):
+    # raised by done() when processing finishes normally
+    pass
+
+class Compiler:
+    """
+    In-process interface to plcc.
+
+        c = Compiler(destdir='Java', LL1=False)
+        sources = c.compile(text=grammarText)   # or files=['grammar', ...]
+
+    Each call to compile processes one grammar from scratch, using the
+    given flags (as Python values, e.g. debug=2 or nowrite=True) on top of
+    the usual defaults, and returns a map from generated file names
+    (e.g. 'Token.java') to their contents, including the copied Std files.
+    Nothing is written to disk unless write=True, in which case the files
+    are also written to destdir as usual.  Errors raise PlccError instead
+    of exiting, and the progress messages of the run are left in log.
+    plcc's state is module-wide, so compile calls are serialized.
+    """
+
+    lock = threading.Lock()
+
+    def __init__(self, flags=None, **kw):
+        self.flags = dict(flags or {})
+        self.flags.update(kw)
+        self.log = ''
+
+    def compile(self, text=None, files=(), write=False):
+        global argv, Sink, Disk, Texts, Out
+        with Compiler.lock:
+            # the module-wide settings to put back afterwards, even on error
+            saved = (argv, Sink, Disk, Out)
+            self.log = ''
+            try:
+                plccInit()
+                flags.update(self.flags)
+                argv = list(files)
+                if text != None:
+                    Texts['<text>'] = text
+                    argv.insert(0, '<text>')
+                if not argv:
+                    raise PlccError('no grammar text or files given')
+                Sink = {}
+                Disk = write
+                Out = io.StringIO()
+                try:
+                    plcc()
+                except PlccDone:
+                    pass
+                return Sink
+            finally:
+                if Out != saved[3]:
+                    self.log = Out.getvalue()
+                (argv, Sink, Disk, Out) = saved
 
 
 def debug(msg, level=1):
@@ -51,7 +140,31 @@ def LIBPLCC():
 
 def main():
     global argv
-    plccInit()
+    try:
+        plccInit()
+        args = argv[:]
+        processArgs()
+        if getFlag('batch'):
+            # pass the other command line flags on to every job (but not
+            # a '--' that ends them, which would make the job's own flags
+            # into file names)
+            args = args[:len(args) - len(argv)]
+            common = [a for a in args if a != '--' and not re.match(r'--(batch|jobs)(=|$)', a)]
+            batch(getFlag('batch'), common)
+        if getFlag('watch'):
+            watch()
+        plcc()
+    except PlccDone as msg:
+        if str(msg):
+            print(msg, file=sys.stderr)
+        sys.exit(0)
+    except PlccError as msg:
+        print(msg, file=sys.stderr)
+        sys.exit(1)
+
+def processArgs():
+    # process the --flag command line arguments, leaving the file names in argv
+    global argv
     while argv:
         if argv[0] == '--':
             # just continue with the rest of the command line
@@ -77,17 +190,87 @@ def main():
             argv = argv[1:]
         else:
             break
+
+def plcc(state=None):
+    # process the grammar files in argv.  If state is given, it is the
+    # saved state (see saveState) after the lex and par phases for grammar
+    # files with the same lexical and grammar sections as these, so those
+    # phases are skipped
+    global Snapshot
+    profiling()
     nxt = nextLine()     # nxt is the next line generator
-    lex(nxt)    # lexical analyzer generation
-    par(nxt)    # LL(1) check and parser generation
-    sem(nxt)    # semantic actions
+    try:
+        if state:
+            restoreState(state)
+            for line in nxt:
+                if line == '%':
+                    break    # end of the lexical section
+            for line in nxt:
+                if line == '%':
+                    break    # end of the grammar section
+        elif not cacheLoad(nxt):
+            cmdFlags = cacheStart()
+            profStart('lex')
+            lex(nxt)    # lexical analyzer generation
+            profStop('lex')
+            profStart('par')
+            par(nxt)    # LL(1) check and parser generation
+            profStop('par')
+            cacheSave(cmdFlags)
+            if getFlag('watch'):
+                Snapshot = saveState()
+        profStart('sem')
+        sem(nxt)    # semantic actions
+    except PlccDone:
+        raise
+    except BaseException:
+        archiveAbort()
+        raise
 
 def plccInit():
-    global flags, STD, STDT, STDP
+    # (re)initialize all of the plcc state
+    global flags, STD, STDT, STDP, STDF, Lno, Fname, Line
+    global startSymbol, skip, term, skipSpecs, termSpecs, termList, termBits
+    global skipPats, termPats
+    global nonterms, fields, rules, extends, derives, cases, arbno, stubs, tableIndex, fieldTypes
+    global Inputs, Outputs, Profile, Sink, Disk, Texts, Archive, Record
+    Lno = 0
+    Fname = ''
+    Line = ''
+    flags = {}
+    startSymbol = ''
+    skip = set()
+    term = set()
+    skipSpecs = []
+    termSpecs = []
+    termList = []
+    termBits = {}
+    skipPats = {}
+    termPats = {}
+    nonterms = set()
+    fields = {}
+    rules = []
+    extends = {}
+    derives = {}
+    cases = {}
+    arbno = {}
+    stubs = {}
+    tableIndex = {}
+    fieldTypes = {}
+    Inputs = {}
+    Outputs = {}
+    Profile = None
+    Sink = None
+    Disk = True
+    Texts = {}
+    Archive = None
+    Record = None
     STDT = ['ILazy','IMatch','ITrace','IScan','Trace','Scan']
     STDP = ['Parser','Rep']
     STD = STDT + STDP
     STD.append('Token')
+    STDF = {'parseprof': 'ParseProf', 'reparse': 'Reparse', 'serial': 'Serial',
+            'batchparse': 'Batch'}
     # file-related flags -- can be overwritten
     # by a grammar file '!flag=...' spec
     # or by a '--flag=...' command line argument
@@ -103,6 +286,22 @@ def plccInit():
     flags['parser'] = True        # create a parser
     flags['semantics'] = True     # create semantics routines
     flags['nowrite'] = False      # when True, produce *no* file output
+    flags['incremental'] = False  # when True, leave unchanged output files alone
+    flags['manifest'] = '.plcc-manifest' # incremental build manifest (in destdir)
+    flags['profile'] = False      # when True (or a file name), report a JSON profile
+    flags['batch'] = False        # a file listing grammar jobs to compile in parallel
+    flags['jobs'] = False         # number of batch worker processes (default: all CPUs)
+    flags['watch'] = False        # when True (or a poll interval), regenerate on change
+    flags['archive'] = False      # when a file name, write all output files into it
+    flags['dfa'] = False          # create a scanner that uses a DFA for all patterns
+    flags['table'] = False        # create a table-driven (explicit stack) parser
+    flags['parseprof'] = False    # profile the generated parse methods (see Std/ParseProf)
+    flags['reparse'] = False      # create an incremental reparser (see Std/Reparse)
+    flags['cache'] = False        # when True (or a file name), cache the lex and par results
+    flags['compact'] = False      # generate lean AST classes (see compact)
+    flags['serial'] = False       # generate binary write/read methods (see Std/Serial)
+    flags['visitor'] = False      # create a visitor interface and an explicit-stack walker
+    flags['batchparse'] = False   # copy the parallel parse driver (see Std/Batch)
     
 def lex(nxt):
     # print('=== lexical specification')
@@ -174,14 +373,18 @@ def lex(nxt):
             skip.update({name})
             if pFlag:
                 push(skipSpecs, '%s (%s)' % (name, jpat))
+                skipPats[name] = javaUnescape(jpat[1:-1])
             else:
                 push(skipSpecs, name)
         elif what == 'token':
             if name in term:
                 deathLNO('Duplicate token name: ' + name)
             term.update({name})
+            termList.append(name)
+            termBits[name] = 1 << len(termList) # bit 0 is NULL
             if pFlag:
                 push(termSpecs, '%s (%s)' % (name, jpat))
+                termPats[name] = javaUnescape(jpat[1:-1])
             else:
                 push(termSpecs, name)
         else:
@@ -196,16 +399,8 @@ def lexFinishUp():
     if getFlag('nowrite'):
         # don't write any files
         return
+    makeDestdir()
     dst = getFlag('destdir')
-    if not dst:
-        death('illegal destdir flag value')
-    try:
-        os.mkdir(dst)
-        debug('[lexFinishUp] ' + dst + ': destination subdirectory created')
-    except FileExistsError:
-        debug('[lexFinishUp] ' + dst + ': destination subdirectory exists')
-    except:
-        death(dst + ': error creating destination subdirectory')
     if not getFlag('Token'):
         return # do not create any automatically generated scanner-related files
     libplcc = getFlag('libplcc')
@@ -213,69 +408,778 @@ def lexFinishUp():
         death('illegal libplcc flag value')
     std = libplcc + '/Std'
     try:
-        os.mkdir(std)
+        if Disk:
+            os.mkdir(std)
     except FileExistsError:
         pass
     except:
         death(std + ': cannot access directory') 
-    fname = '%s/%s' % (dst, 'Token.java')
-    try:
-        tokenFile = open(fname, 'w')
-    except:
-        death('Cannot open ' + fname + ' for writing')
+    tok = [] # the lines of the Token.java file
     if getFlag('pattern'):
         # use the Token.pattern library file to create Token.java
         fname = 'Token.pattern'
-        try:
-            tokenTemplate = open('%s/%s' % (std, fname))
-        except:
-            death(fname + ': cannot read library file')
+        tokenTemplate = readStd(std, fname)
         if len(skipSpecs) == 0:
             skipSpecs = ['NULL ("")']
-        for line in tokenTemplate:
+        for line in io.StringIO(tokenTemplate):
             # note that line keeps its trailing newline
             if re.match('^\s*%%Vals%%', line):
-                tssep = ''
-                for ts in termSpecs:
-                    print(tssep + '        ' + ts, file=tokenFile, end='')
-                    tssep = ',\n'
-                print(';', file=tokenFile)
+                tok.append(',\n'.join(['        ' + ts for ts in termSpecs]) + ';\n')
             elif re.match('^\s*%%Skips%%', line):
-                sssep = ''
-                for ss in skipSpecs:
-                    print(sssep + '        ' + ss, file=tokenFile, end='')
-                    sssep = ',\n'
-                print(';', file=tokenFile)
+                tok.append(',\n'.join(['        ' + ss for ss in skipSpecs]) + ';\n')
+            elif re.match('^\s*%%Tables%%', line):
+                tok.append(dfaTables() + '\n' + firstTables() + keywordTables())
             else:
-                print(line, file=tokenFile, end='')
-        tokenTemplate.close()
+                tok.append(line)
     else:
         # use the Token.template file to create Token.java
         fname = 'Token.template'
-        try:
-            tokenTemplate = open('%s/%s' % (std, fname))
-        except:
-            death(fname + ': cannot read library file')
-        for line in tokenTemplate:
+        tokenTemplate = readStd(std, fname)
+        for line in io.StringIO(tokenTemplate):
             # note that line keeps its trailing newline
             if re.match('^\s*%%Vals%%', line):
-                tssep = ''
-                for ts in termSpecs:
-                    print(tssep + '        ' + ts, file=tokenFile, end='')
-                    tssep = ',\n'
-                print(';', file=tokenFile)
+                tok.append(',\n'.join(['        ' + ts for ts in termSpecs]) + ';\n')
             else:
-                print(line, file=tokenFile, end='')
-        tokenTemplate.close()
-    tokenFile.close()
+                tok.append(line)
+    writeFile('Token.java', ''.join(tok))
     # copy the Std token-related library files to the destination directory
     for fname in STDT:
         if getFlag(fname):
             debug('[lexFinishUp] copying %s from %s to %s ...' % (fname, std, dst))
-            try:
-                shutil.copy('%s/%s.java' % (std, fname), '%s/%s.java' % (dst, fname))
-            except:
-                death('Failure copying %s from %s to %s' % (fname, std, dst))
+            copyStd(std, fname)
+
+def makeDestdir():
+    # create the destination (Java) directory if it does not exist
+    dst = getFlag('destdir')
+    if not dst:
+        death('illegal destdir flag value')
+    try:
+        if Disk and not getFlag('archive'):
+            os.mkdir(dst)
+            debug('[makeDestdir] ' + dst + ': destination subdirectory created')
+    except FileExistsError:
+        debug('[makeDestdir] ' + dst + ': destination subdirectory exists')
+    except:
+        death(dst + ': error creating destination subdirectory')
+
+#################################
+# regular expressions and DFAs  #
+#################################
+
+# The dfa flag compiles the skip and token patterns into one table-driven
+# DFA, emitted into Token.java, so that Scan finds the longest match in
+# time linear in the input no matter how many tokens there are.
+# Patterns are Java regular expressions (compiled with DOTALL); regexParse
+# handles the subset of them without anchors, lookaround, backreferences,
+# lazy/possessive quantifiers or inline flags, and raises RegexError for
+# anything else.  The DFA takes the longest match for each pattern, but
+# Java's matcher takes the first branch of an alternation that matches,
+# so '=|==' matches only '=' of '=='.  dfaBuild also raises RegexError for
+# an alternation in which a string of one branch is a proper prefix of a
+# string of another (see altCheck), where the two can differ.
+# Without the dfa flag, the same parse gives the set of chars that can
+# begin each token (firstChars), so Scan only tries the token patterns
+# that can match at the current char.
+
+MAXCHAR = 0xFFFF    # Java chars are 16-bit
+
+class RegexError(Exception):
+    # an unsupported (or malformed) regular expression
+    pass
+
+def javaUnescape(s):
+    # return the string denoted by the body s of a Java string literal
+    def unesc(m):
+        e = m.group(1)
+        if e[0] == 'u':
+            return chr(int(e.lstrip('u'), 16))
+        if e[0] in '01234567':
+            return chr(int(e, 8))
+        return {'b': '\b', 't': '\t', 'n': '\n', 'f': '\f', 'r': '\r'}.get(e, e)
+    return re.sub(r'\\(u+[0-9a-fA-F]{4}|[0-3][0-7]{0,2}|[4-7][0-7]?|.)', unesc, s)
+
+def javaString(s):
+    # return the Java string literal for the string s
+    # (octal escapes are used for control characters, since \u escapes
+    # for characters like newline are processed before the Java lexer)
+    out = ['"']
+    for ch in s:
+        c = ord(ch)
+        if ch == '"' or ch == '\\':
+            out.append('\\' + ch)
+        elif 32 <= c < 127:
+            out.append(ch)
+        elif c < 256:
+            out.append('\\%03o' % c)
+        else:
+            out.append('\\u%04x' % c)
+    out.append('"')
+    return ''.join(out)
+
+def charSet(intervals, negate=False):
+    # return the ('set', intervals) node for a list of (lo, hi) char ranges,
+    # sorted and merged (and complemented if negate is True)
+    merged = []
+    for (lo, hi) in sorted(intervals):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(hi, merged[-1][1]))
+        else:
+            merged.append((lo, hi))
+    if negate:
+        comp = []
+        nxt = 0
+        for (lo, hi) in merged:
+            if lo > nxt:
+                comp.append((nxt, lo - 1))
+            nxt = hi + 1
+        if nxt <= MAXCHAR:
+            comp.append((nxt, MAXCHAR))
+        merged = comp
+    return ('set', tuple(merged))
+
+DIGIT = [(ord('0'), ord('9'))]
+SPACE = [(ord(' '), ord(' ')), (9, 13)]   # space \t \n \x0B \f \r
+WORD = [(ord('a'), ord('z')), (ord('A'), ord('Z')), (ord('_'), ord('_'))] + DIGIT
+
+def regexParse(pat):
+    """
+    parse the Java regular expression pat into a tree of tuples:
+        ('set', ((lo, hi), ...))     one char in any of the ranges
+        ('cat', [node, ...])         concatenation
+        ('alt', [node, ...])         alternation
+        ('rep', node, m, n)          node{m,n}, with n None if unbounded
+    """
+    pos = 0
+    n = len(pat)
+
+    def unsupported(what):
+        raise RegexError('%s at offset %d in %s' % (what, pos, pat))
+
+    def escape(inClass):
+        # parse the escape after a backslash, returning either a char code
+        # or a list of ranges (for \d and friends)
+        nonlocal pos
+        if pos >= n:
+            unsupported('trailing backslash')
+        c = pat[pos]
+        pos += 1
+        if c in 'dDsSwW':
+            ranges = {'d': DIGIT, 's': SPACE, 'w': WORD}[c.lower()]
+            if c.isupper():
+                return list(charSet(ranges, negate=True)[1])
+            return ranges
+        simple = {'t': 9, 'n': 10, 'r': 13, 'f': 12, 'a': 7, 'e': 27}
+        if c in simple:
+            return simple[c]
+        if c == '0':
+            m = re.match('[0-3][0-7]{0,2}|[0-7]{1,2}', pat[pos:])
+            if not m:
+                unsupported('illegal octal escape')
+            pos += len(m.group())
+            return int(m.group(), 8)
+        if c == 'x':
+            m = re.match(r'[0-9a-fA-F]{2}|\{([0-9a-fA-F]+)\}', pat[pos:])
+            if not m:
+                unsupported('illegal hex escape')
+            pos += len(m.group())
+            return int(m.group(1) or m.group(), 16)
+        if c == 'u':
+            m = re.match('[0-9a-fA-F]{4}', pat[pos:])
+            if not m:
+                unsupported('illegal unicode escape')
+            pos += 4
+            return int(m.group(), 16)
+        if c == 'c':
+            if pos >= n:
+                unsupported('illegal control escape')
+            pos += 1
+            return ord(pat[pos-1]) ^ 64
+        if c.isalnum():
+            unsupported('escape \\' + c)
+        return ord(c)
+
+    def charClass():
+        # parse a [...] class (after the '[')
+        nonlocal pos
+        negate = False
+        if pos < n and pat[pos] == '^':
+            negate = True
+            pos += 1
+        if pos < n and pat[pos] == ']':
+            unsupported('leading ] in class')
+        ranges = []
+        while True:
+            if pos >= n:
+                unsupported('unterminated class')
+            c = pat[pos]
+            if c == ']':
+                pos += 1
+                break
+            if c == '[' or pat.startswith('&&', pos):
+                unsupported('nested or intersected class')
+            pos += 1
+            if c == '\\':
+                lo = escape(True)
+                if isinstance(lo, list):
+                    ranges.extend(lo)
+                    continue
+            else:
+                lo = ord(c)
+            if pos + 1 < n and pat[pos] == '-' and pat[pos+1] != ']':
+                pos += 1
+                c = pat[pos]
+                pos += 1
+                if c == '\\':
+                    hi = escape(True)
+                    if isinstance(hi, list):
+                        unsupported('class escape in a range')
+                elif c == '[':
+                    unsupported('nested class')
+                else:
+                    hi = ord(c)
+                if hi < lo:
+                    unsupported('illegal character range')
+                ranges.append((lo, hi))
+            else:
+                ranges.append((lo, lo))
+        return charSet(ranges, negate)
+
+    def atom():
+        nonlocal pos
+        c = pat[pos]
+        pos += 1
+        if c == '(':
+            if pat.startswith('?:', pos):
+                pos += 2
+            elif pat.startswith('?<', pos) and re.match(r'\?<[a-zA-Z]', pat[pos:]):
+                pos = pat.index('>', pos) + 1  # a named group
+            elif pat.startswith('?', pos):
+                unsupported('special group')
+            node = alt()
+            if pos >= n or pat[pos] != ')':
+                unsupported('unbalanced (')
+            pos += 1
+            return node
+        if c == '[':
+            return charClass()
+        if c == '.':
+            return charSet([(0, MAXCHAR)])
+        if c == '\\':
+            if pat.startswith('Q', pos):
+                end = pat.find('\\E', pos)
+                if end < 0:
+                    end = n
+                lit = pat[pos+1:end]
+                pos = min(end + 2, n)
+                return ('cat', [charSet([(ord(ch), ord(ch))]) for ch in lit])
+            e = escape(False)
+            if isinstance(e, list):
+                return charSet(e)
+            return charSet([(e, e)])
+        if c in '^$':
+            unsupported('anchor')
+        if c in '*+?{)':
+            unsupported('dangling metacharacter')
+        if ord(c) > MAXCHAR:
+            unsupported('supplementary character')
+        return charSet([(ord(c), ord(c))])
+
+    def repeat():
+        nonlocal pos
+        node = atom()
+        if pos < n and pat[pos] in '*+?{':
+            c = pat[pos]
+            pos += 1
+            if c == '*':
+                node = ('rep', node, 0, None)
+            elif c == '+':
+                node = ('rep', node, 1, None)
+            elif c == '?':
+                node = ('rep', node, 0, 1)
+            else:
+                m = re.match(r'(\d+)(,(\d*))?\}', pat[pos:])
+                if not m:
+                    unsupported('illegal repetition')
+                pos += len(m.group())
+                lo = int(m.group(1))
+                if m.group(2) == None:
+                    hi = lo
+                elif m.group(3) == '':
+                    hi = None
+                else:
+                    hi = int(m.group(3))
+                if lo > 1000 or (hi != None and (hi < lo or hi > 1000)):
+                    unsupported('repetition bounds')
+                node = ('rep', node, lo, hi)
+            if pos < n and pat[pos] in '?+':
+                unsupported('lazy or possessive quantifier')
+        return node
+
+    def cat():
+        items = []
+        while pos < n and pat[pos] not in '|)':
+            items.append(repeat())
+        if len(items) == 1:
+            return items[0]
+        return ('cat', items)
+
+    def alt():
+        nonlocal pos
+        branches = [cat()]
+        while pos < n and pat[pos] == '|':
+            pos += 1
+            branches.append(cat())
+        if len(branches) == 1:
+            return branches[0]
+        return ('alt', branches)
+
+    node = alt()
+    if pos < n:
+        unsupported('unbalanced )')
+    return node
+
+def nfaBuild(node, nfa, accept):
+    # add the Thompson NFA for the regex tree node to nfa, a list of states,
+    # each a pair (eps, edges) of epsilon targets and (lo, hi, target) edges;
+    # the final state accepts with label accept.  Return the start state.
+    def new():
+        nfa.append(([], []))
+        return len(nfa) - 1
+    def build(node, s):
+        # build node from state s, returning its end state
+        kind = node[0]
+        if kind == 'set':
+            t = new()
+            for (lo, hi) in node[1]:
+                nfa[s][1].append((lo, hi, t))
+            return t
+        if kind == 'cat':
+            for item in node[1]:
+                s = build(item, s)
+            return s
+        if kind == 'alt':
+            t = new()
+            for item in node[1]:
+                b = new()
+                nfa[s][0].append(b)
+                nfa[build(item, b)][0].append(t)
+            return t
+        # ('rep', item, lo, hi)
+        (item, lo, hi) = node[1:]
+        for i in range(lo):
+            s = build(item, s)
+        if hi == None:
+            b = new()
+            nfa[s][0].append(b)
+            e = build(item, b)
+            nfa[e][0].append(b)
+            return b
+        t = new()
+        nfa[s][0].append(t)
+        for i in range(hi - lo):
+            s = build(item, s)
+            nfa[s][0].append(t)
+        return t
+    start = new()
+    end = build(node, start)
+    nfa.append(([], [], accept))
+    nfa[end][0].append(len(nfa) - 1)
+    return start
+
+def prefixFree(a, b, both):
+    # return True if no string matched by the regex tree a is a proper
+    # prefix of a string matched by the regex tree b (nor the reverse, if
+    # both is True)
+    nfa = []
+    starts = [nfaBuild(a, nfa, 0), nfaBuild(b, nfa, 1)]
+    # live[s] is True if an accepting state can be reached from state s
+    live = [len(state) == 3 for state in nfa]
+    changed = True
+    while changed:
+        changed = False
+        for (s, state) in enumerate(nfa):
+            if not live[s] and any([live[t] for t in state[0]] + [live[t] for (lo, hi, t) in state[1]]):
+                live[s] = changed = True
+    def closure(states):
+        todo = list(states)
+        seen = set(states)
+        while todo:
+            for t in nfa[todo.pop()][0]:
+                if not t in seen:
+                    seen.add(t)
+                    todo.append(t)
+        return frozenset(seen)
+    def accepts(ss):
+        return any([len(nfa[s]) == 3 for s in ss])
+    def more(ss):
+        # can ss match at least one more char and then accept?
+        return any([live[t] for s in ss for (lo, hi, t) in nfa[s][1]])
+    points = {0, MAXCHAR + 1}
+    for state in nfa:
+        for (lo, hi, t) in state[1]:
+            points.update((lo, hi + 1))
+    points = sorted(points)
+    pair = (closure([starts[0]]), closure([starts[1]]))
+    seen = {pair}
+    todo = [pair]
+    while todo:
+        (sa, sb) = todo.pop()
+        if (accepts(sa) and more(sb)) or (both and accepts(sb) and more(sa)):
+            return False
+        for (lo, hi) in zip(points, points[1:]):
+            na = closure([t for s in sa for (l, h, t) in nfa[s][1] if l <= lo < h + 1])
+            nb = closure([t for s in sb for (l, h, t) in nfa[s][1] if l <= lo < h + 1])
+            if na and nb and not (na, nb) in seen:
+                seen.add((na, nb))
+                todo.append((na, nb))
+    return True
+
+def altCheck(node, pat, tail=True):
+    # raise RegexError if the regex tree node (of the pattern pat) has an
+    # alternation whose branches are not prefix-free: the DFA would take
+    # the longest match where Java takes the first branch that matches.
+    # If nothing follows node in the pattern (tail is True), a later
+    # branch may match a prefix of an earlier one ('\+\+|\+'), since
+    # Java then also takes the longer match.
+    kind = node[0]
+    if kind == 'alt':
+        branches = node[1]
+        for i in range(len(branches)):
+            for j in range(i + 1, len(branches)):
+                if not prefixFree(branches[i], branches[j], not tail):
+                    raise RegexError('alternation whose branches are not prefix-free in %s' % pat)
+        for item in branches:
+            altCheck(item, pat, tail)
+    elif kind == 'cat':
+        for (i, item) in enumerate(node[1]):
+            altCheck(item, pat, tail and i == len(node[1]) - 1)
+    elif kind == 'rep':
+        altCheck(node[1], pat, False)
+
+def dfaBuild(patterns, groups):
+    """
+    build a minimal DFA for the regular expressions in patterns, a list of
+    (pattern, label) pairs, with one start state for each group, a list
+    of lists of indices into patterns.  In a group's DFA, a state accepts
+    with the smallest label of the patterns it matches (so the first one
+    declared wins ties).  Return (nclass, cmap, trans, accept, starts):
+    cmap is a list of (lo, hi, class) char ranges, trans[s*nclass+c] is
+    the next state (-1 for none), accept[s] is a label or -1, and starts
+    lists the start state of each group.  Raises RegexError.
+    """
+    nfa = []
+    pstarts = []
+    for (pat, label) in patterns:
+        node = regexParse(pat)
+        altCheck(node, pat)
+        pstarts.append(nfaBuild(node, nfa, label))
+    # partition the chars into classes that no edge distinguishes
+    points = {0, MAXCHAR + 1}
+    for state in nfa:
+        for (lo, hi, t) in state[1]:
+            points.update((lo, hi + 1))
+    points = sorted(points)
+    index = {}
+    for i, p in enumerate(points):
+        index[p] = i
+    nclass = len(points) - 1
+    # closure[s] is the set of NFA states reachable from s by epsilon moves
+    def closure(states):
+        todo = list(states)
+        seen = set(states)
+        while todo:
+            for t in nfa[todo.pop()][0]:
+                if not t in seen:
+                    seen.add(t)
+                    todo.append(t)
+        return frozenset(seen)
+    dstates = {}     # maps an NFA state set to its DFA state
+    dsets = []       # the NFA state set of each DFA state
+    rows = []        # maps each DFA state to its {class: NFA state set} moves
+    def dstate(ss):
+        if not ss in dstates:
+            dstates[ss] = len(dsets)
+            dsets.append(ss)
+            if len(dsets) > 0xFFFE:
+                raise RegexError('too many DFA states')
+        return dstates[ss]
+    starts = [dstate(closure([pstarts[i] for i in group])) for group in groups]
+    trans = []
+    accept = []
+    d = 0
+    while d < len(dsets):
+        moves = {}
+        label = -1
+        for s in dsets[d]:
+            state = nfa[s]
+            if len(state) == 3 and (label < 0 or state[2] < label):
+                label = state[2]
+            for (lo, hi, t) in state[1]:
+                for c in range(index[lo], index[hi + 1]):
+                    moves.setdefault(c, set()).add(t)
+        row = [-1] * nclass
+        for c in moves:
+            row[c] = dstate(closure(moves[c]))
+        trans.append(row)
+        accept.append(label)
+        d += 1
+    # minimize (Moore): split blocks of states until their rows agree
+    block = accept[:]
+    while True:
+        sigs = {}
+        nblock = []
+        for (row, b) in zip(trans, block):
+            sig = (b, tuple([block[t] if t >= 0 else None for t in row]))
+            nblock.append(sigs.setdefault(sig, len(sigs)))
+        if len(sigs) == len(set(block)):
+            break
+        block = nblock
+    block = nblock
+    nstate = len(set(block))
+    mtrans = [None] * nstate
+    maccept = [None] * nstate
+    for (s, b) in enumerate(block):
+        if mtrans[b] == None:
+            mtrans[b] = [block[t] if t >= 0 else -1 for t in trans[s]]
+            maccept[b] = accept[s]
+    starts = [block[s] for s in starts]
+    # merge the char classes with identical columns
+    cols = {}
+    cnew = []
+    for c in range(nclass):
+        col = tuple([row[c] for row in mtrans])
+        cnew.append(cols.setdefault(col, len(cols)))
+    ntrans = []
+    for row in mtrans:
+        nrow = [-1] * len(cols)
+        for c in range(nclass):
+            nrow[cnew[c]] = row[c]
+        ntrans.extend(nrow)
+    cmap = []
+    for c in range(nclass):
+        (lo, hi) = (points[c], points[c + 1] - 1)
+        if cmap and cmap[-1][2] == cnew[c]:
+            cmap[-1] = (cmap[-1][0], hi, cnew[c])
+        else:
+            cmap.append((lo, hi, cnew[c]))
+    return (len(cols), cmap, ntrans, maccept, starts)
+
+def rlePack(values):
+    # run-length encode a list of ints in -1..0xFFFE as a string of
+    # (count, value+1) char pairs
+    out = []
+    i = 0
+    while i < len(values):
+        v = values[i]
+        j = i
+        while j < len(values) and values[j] == v and j - i < 0xFFFF:
+            j += 1
+        out.append(chr(j - i) + chr(v + 1))
+        i = j
+    return ''.join(out)
+
+def javaStrings(s, indent, size=2048):
+    # return Java source for a String[] holding s in chunks
+    # (a single string constant is limited to 64K bytes)
+    parts = [s[i:i+size] for i in range(0, len(s), size)] or ['']
+    lines = []
+    for part in parts:
+        lits = [javaString(part[i:i+24]) for i in range(0, len(part), 24)] or ['""']
+        lines.append(indent + '    ' + ('\n' + indent + '    + ').join(lits))
+    return 'new String[] {\n' + ',\n'.join(lines) + '\n' + indent + '}'
+
+def dfaTables():
+    # return the Java declaration of Token.dfa (see Token.pattern):
+    # the DFA for the skip and token patterns when the dfa flag is set,
+    # and null otherwise (or if some pattern is not supported)
+    none = '    public static final Dfa dfa = null; // see plcc\'s dfa flag\n'
+    if not getFlag('dfa'):
+        return none
+    patterns = [(termPats[name], i) for (i, name) in enumerate(termList)]
+    groups = [list(range(len(termList)))]
+    for (k, name) in enumerate(skipPats):
+        groups.append([len(patterns)])
+        patterns.append((skipPats[name], k))
+    try:
+        (nclass, cmap, trans, accept, starts) = dfaBuild(patterns, groups)
+    except RegexError as msg:
+        print('dfa: %s -- using pattern matching instead' % msg, file=sys.stderr)
+        return none
+    debug('[dfaTables] %d states, %d classes' % (len(accept), nclass))
+    cmapList = []
+    for (lo, hi, c) in cmap:
+        cmapList.extend([c] * (hi - lo + 1))
+    ind = '        '
+    return """\
+    // the DFA for the skip and token patterns: {states} states, {nclass} char classes
+    public static final Dfa dfa = new Dfa(
+        {nclass}, // char classes
+        {start}, // token start state
+        new int[] {{{skips}}}, // skip start states
+        {cmap},
+        {trans},
+        {accept});
+""".format(states=len(accept), nclass=nclass, start=starts[0],
+           skips=', '.join([str(s) for s in starts[1:]]),
+           cmap=javaStrings(rlePack(cmapList), ind),
+           trans=javaStrings(rlePack(trans), ind),
+           accept=javaStrings(rlePack(accept), ind))
+
+def firstChars(node):
+    # return (first, nullable) for the regex tree node: the sorted list of
+    # (lo, hi) ranges of the chars that can begin a non-empty match of node,
+    # and whether node can match the empty string
+    kind = node[0]
+    if kind == 'set':
+        return (list(node[1]), False)
+    if kind == 'cat':
+        ranges = []
+        for item in node[1]:
+            (fst, nullable) = firstChars(item)
+            ranges.extend(fst)
+            if not nullable:
+                return (charSet(ranges)[1], False)
+        return (charSet(ranges)[1], True)
+    if kind == 'alt':
+        ranges = []
+        nullable = False
+        for item in node[1]:
+            (fst, n) = firstChars(item)
+            ranges.extend(fst)
+            nullable = nullable or n
+        return (charSet(ranges)[1], nullable)
+    # ('rep', item, lo, hi)
+    (item, lo, hi) = node[1:]
+    if hi == 0:
+        return ([], True)
+    (fst, nullable) = firstChars(item)
+    return (fst, nullable or lo == 0)
+
+def firstTables():
+    # return the Java declaration of Token.first (see Token.pattern): for
+    # each token, a string of (lo, hi) char pairs giving the chars that can
+    # begin one of its matches, or null if its pattern cannot be analyzed
+    entries = []
+    for name in termList:
+        try:
+            (fst, nullable) = firstChars(regexParse(termPats[name]))
+            ranges = ''.join([chr(lo) + chr(hi) for (lo, hi) in fst])
+            entries.append('        %s, // %s' % (javaString(ranges), name))
+        except RegexError as msg:
+            debug('[firstTables] %s: %s' % (name, msg))
+            entries.append('        null, // %s' % name)
+    return """    // the (lo, hi) ranges of the chars that can begin each token
+    private static final String [] first = {
+%s
+    };
+
+""" % '\n'.join(entries)
+
+# Keyword tokens: a token whose pattern is a plain string (like 'if')
+# that the pattern of some general token (like an identifier pattern
+# '[a-z]\w*') also matches is not tried by Scan.  Instead, Scan
+# looks up the text of the longest match of the other tokens in a hash
+# table of these strings, and takes the keyword if it is declared before
+# the token found.  Since the general token matches at least as much as
+# the keyword wherever the keyword matches, this gives the same token as
+# trying the keyword's pattern.  To be sure that Java's matcher finds
+# the longest match of the general token, its pattern must be a run of
+# single chars (from char sets) followed by at most one unbounded repeat
+# of a char set.
+
+def literal(node):
+    # return the string matched by the regex tree node if it matches
+    # exactly one string, otherwise None
+    kind = node[0]
+    if kind == 'set':
+        if len(node[1]) == 1 and node[1][0][0] == node[1][0][1]:
+            return chr(node[1][0][0])
+        return None
+    if kind == 'cat':
+        parts = [literal(item) for item in node[1]]
+        if None in parts:
+            return None
+        return ''.join(parts)
+    if kind == 'rep' and node[2] == node[3]:
+        part = literal(node[1])
+        if part == None:
+            return None
+        return part * node[2]
+    return None
+
+def simpleMatch(node, text):
+    # return whether the regex tree node is a run of char sets followed by
+    # at most one unbounded repeat of a char set (so that Java's greedy
+    # match of it is the longest one) and matches the string text
+    items = node[1] if node[0] == 'cat' else [node]
+    if not items:
+        return False
+    last = items[-1]
+    rep = None
+    if last[0] == 'rep' and last[1][0] == 'set' and last[3] == None:
+        rep = last
+        items = items[:-1]
+    for item in items:
+        if item[0] != 'set':
+            return False
+    def member(ch, ranges):
+        for (lo, hi) in ranges:
+            if lo <= ord(ch) <= hi:
+                return True
+        return False
+    n = len(items)
+    if len(text) < n or (rep == None and len(text) != n):
+        return False
+    for (ch, item) in zip(text, items):
+        if not member(ch, item[1]):
+            return False
+    if rep != None:
+        if len(text) - n < rep[2]:
+            return False
+        for ch in text[n:]:
+            if not member(ch, rep[1][1]):
+                return False
+    return True
+
+def keywordTexts():
+    # return a map from each token found by keyword lookup to its text
+    lits = {}
+    general = []
+    for name in termList:
+        try:
+            node = regexParse(termPats[name])
+        except RegexError:
+            continue
+        text = literal(node)
+        if text == None:
+            general.append(node)
+        elif text and not re.search('[\r\n\x85\u2028\u2029]', text):
+            lits[name] = text  # (a line terminator could end a match in buffer mode)
+    kws = {}
+    for name in lits:
+        for node in general:
+            if simpleMatch(node, lits[name]):
+                kws[name] = lits[name]
+                break
+    return kws
+
+def keywordTables():
+    # return the Java declaration of Token.keyword (see Token.pattern): for
+    # each token, its text if it is found by keyword lookup, or null
+    kws = keywordTexts()
+    entries = []
+    for name in termList:
+        if name in kws:
+            entries.append('        %s, // %s' % (javaString(kws[name]), name))
+        else:
+            entries.append('        null, // %s' % name)
+    profCount('keywords', len(kws))
+    return """    // the text of each token found by keyword lookup, or null
+    private static final String [] keyword = {
+%s
+    };
+
+""" % '\n'.join(entries)
 
 def par(nxt):
     debug('[par] processing grammar rule lines')
@@ -320,26 +1224,13 @@ def parFinishUp():
         debug('[parFinishUp] class %s extends %s' % (cls, extends[cls]))
     for base in derives:
         debug('[parFinishUp] base class %s derives %s' % (base, derives[base]))
-    # print the nonterminals
-    print('Nonterminals (* indicates start symbol):')
-    for nt in sorted(nonterms):
-        if re.search('_', nt):
-            continue           # ignore automatically generated arbno names
-        if nt == startSymbol:
-            ss = ' *<%s>' % nt
-        else:
-            ss = '  <%s>' % nt
-        print(ss)
-    print()
-
-    # print abstract classes
-    print('Abstract classes:')
-    for cls in sorted(derives):
-        print('  %s' % cls)
+    parReport()
 
     # check for LL1
     if getFlag('LL1'):
+        profStart('checkLL1')
         checkLL1()
+        profStop('checkLL1')
 
     if getFlag('nowrite'):
         return
@@ -350,18 +1241,57 @@ def parFinishUp():
     for fname in STDP:
         if getFlag(fname):
             debug('[parFinishUp] copying %s from %s to %s ...' % (fname, std, dst))
-            try:
-                shutil.copy('%s/%s.java' % (std, fname), '%s/%s.java' % (dst, fname))
-            except:
-                death('Failure copying %s from %s to %s' % (fname, std, dst))
+            copyStd(std, fname)
+    for flag in sorted(STDF):
+        if getFlag(flag):
+            copyStd(std, STDF[flag])
     
     # build parser stub classes
+    profStart('buildStubs')
     buildStubs()
+    profStop('buildStubs')
     # build the PLCC$Start.java file from the start symbol
     buildStart()
+    # build the PLCC$Table.java parse tables and driver if asked to
+    buildTable()
+    # build the PLCC$Reparse.java incremental reparser if asked to
+    buildReparse()
+    # build the PLCC$Visitor.java and PLCC$Walk.java files if asked to
+    buildWalk()
+    # build the PLCC$Serial.java tree reader and writer if asked to
+    buildSerial()
+
+def parReport():
+    # print the nonterminals and abstract classes
+    print('Nonterminals (* indicates start symbol):', file=Out)
+    for nt in sorted(nonterms):
+        if re.search('_', nt):
+            continue           # ignore automatically generated arbno names
+        if nt == startSymbol:
+            ss = ' *<%s>' % nt
+        else:
+            ss = '  <%s>' % nt
+        print(ss, file=Out)
+    print(file=Out)
+
+    # print abstract classes
+    print('Abstract classes:', file=Out)
+    for cls in sorted(derives):
+        print('  %s' % cls, file=Out)
+
+def reserved(cls):
+    # return an error message if cls is the name of a Std library class
+    # that is (or, with the flags set, will be) in destdir, else None
+    if cls in STD:
+        return '%s: reserved class name' % cls
+    for flag in STDF:
+        if cls == STDF[flag] and getFlag(flag):
+            return '%s: reserved class name (the %s flag copies Std/%s.java)' % (cls, flag, cls)
+    return None
 
 def processRule(line, rno):
     global STD, startSymbol, fields, rules, arbno, nonterm, extends, derives
+    profCount('rules')
     if rno:
         debug('[processRule] rule %3d: %s' % (rno, line))
     tnt = line.split()     # LHS ruleType RHS
@@ -370,10 +1300,10 @@ def processRule(line, rno):
     lhs = tnt.pop(0)       # the LHS of this rule
     nt, cls = partitionLHS(lhs)
     base = nt2cls(nt)      # turn the nonterminal name into its (base) class name
-    if base in STD:
-        deathLNO('%s: reserved class name' % base)
-    if cls in STD:
-        deathLNO('%s: reserved class name' % cls)
+    for name in [base, cls]:
+        msg = reserved(name)
+        if msg:
+            deathLNO(msg)
     if base == cls:
         deathLNO('base class and derived class names cannot be the same!')
     ruleType = tnt.pop(0)  # either '**=' or '::='
@@ -436,9 +1366,9 @@ def processRule(line, rno):
     saveRule(nt, lhs, cls, rhs)
     extends[cls] = base
     if base in derives:
-        derives[base].update({cls})
+        derives[base].append(cls)
     else:
-        derives[base] = {cls}
+        derives[base] = [cls]
 
 # def saveFields(cls, lhs, rhs):
 #     global fields
@@ -491,107 +1421,195 @@ def partitionLHS(lhs):
 
 def checkLL1():
     global rules, nonterms, cases
-    first = {}
-    follow = {}
-    switch = {}
-
-    def getFirst(form):
-        nonlocal first
-        # return the first set (of terminals) of this sentential form
-        fst = set()
-        if len(form) == 0:         # the form is empty, so it only derives Null
-            return {'Null'}
-        tnt = form[0]              # get the item at the start of the sentential form
-        if isTerm(tnt): 
-            return {tnt}           # the form starts with a terminal, which is clearly its only first set item
-        # tnt must be a nonterm -- get the first set for this and add it to our current set
-        f = first[tnt]             # get the current first set for tnt (=form[0])
-        for t in f:
-            # add all non-null stuff from first[tnt] to the current first set
-            if t != 'Null':
-                fst.update({t})
-            else:
-                # Null is in the first set for f, so recursively add the nonterms from getFirst(form[1:])
-                fst.update(getFirst(form[1:]))
-        # debug('first set for %s: %s' % (form, fst))
-        return fst
+    # all of the terminal sets here are int bitmasks (see termBits),
+    # with the NULL bit indicating that the empty string can be derived
+    first = {}     # maps each nonterm to its first set
+    follow = {}    # maps each nonterm to its follow set
+    switch = {}    # maps each nonterm to a list of its (switch set, rhs) pairs
+    suffix = []    # suffix[r][i] is the first set of rhs[i:] for rule r
 
+    profStart('checkLL1/first')
+    # determine the nullable nonterms with a worklist:
+    # count[r] is the number of items in rule r not yet known to be nullable,
+    # and users[nt] lists the rules with an occurrence of nt in their rhs
+    nullable = set()
+    count = []
+    users = {}
+    work = []
     for nt in nonterms:
-        first[nt] = set()        # initialize all of the first sets
-        follow[nt] = set()       # initialize all of the follow sets
-        switch[nt] = []          # maps each nonterm to a list of its first sets
+        users[nt] = []
+    for r, (nt, cls, rhs) in enumerate(rules):
+        if any(tnt in termBits for tnt in rhs):
+            count.append(None) # this rule can never derive the empty string
+            continue
+        count.append(len(rhs))
+        for tnt in rhs:
+            users[tnt].append(r)
+        if not rhs:
+            work.append(nt)
+    while work:
+        nt = work.pop()
+        profCount('worklistSteps')
+        if nt in nullable:
+            continue
+        nullable.add(nt)
+        for r in users[nt]:
+            count[r] -= 1
+            if count[r] == 0:
+                work.append(rules[r][0])
 
-    # determine the first sets
-    modified = True
-    while modified:
-        modified = False  # assume innocent
-        for (nt, cls, rhs) in rules:
-            fst = first[nt]      # the current first set for this nonterminal
-            fct = len(fst)       # see if the first set changes
-            fst.update(getFirst(rhs))   # add any new terminals to the set
-            if len(fst) != fct:
-                modified = True
+    # determine the first sets: first[nt] is the set of terminals that can
+    # begin some rhs of nt, along with the first sets of the nonterms that
+    # can begin a rhs after a (possibly empty) nullable prefix
+    fdirect = {}
+    fsucc = {}
+    for nt in nonterms:
+        fdirect[nt] = 0
+        fsucc[nt] = []
+    for (nt, cls, rhs) in rules:
+        for tnt in rhs:
+            if tnt in termBits:
+                fdirect[nt] |= termBits[tnt]
+                break
+            fsucc[nt].append(tnt)
+            if not tnt in nullable:
+                break
+    first = digraph(nonterms, fsucc, fdirect)
+    for nt in nullable:
+        first[nt] |= NULL
     if debug('[checkLL1] First sets:'):
         for nt in nonterms:
-            debug('[checkLL1] %s -> %s' % (nt, first[nt]))
-
-    # determine the follow sets
-    modified = True
-    while modified:
-        modified = False
-        for (nt, cls, rhs) in rules:
-            rhs = rhs[:]         # make a copy
-            debug('[checkLL1] examining rule %s ::= %s' % (nt, ' '.join(rhs)))
-            while rhs:
-                tnt = rhs.pop(0) # remove the first element of the list
-                if isNonterm(tnt):
-                    # only nonterminals count for determining follow sets
-                    fol = follow[tnt]              # the current follow set for tnt
-                    fct = len(fol)
-                    for t in getFirst(rhs):        # look at the first set of what follows tnt (the current rhs)
-                        if t == 'Null':
-                            fol.update(follow[nt]) # if the rhs derives the empty string, what follows nt must follow tnt
-                        else:
-                            fol.update({t})        # otherwise, what the rhs derives must follow tnt
-                    if len(fol) != fct:
-                        modified = True
+            debug('[checkLL1] %s -> %s' % (nt, termNames(first[nt])))
+
+    # memoize the first sets of all of the rule suffixes, from right to left
+    for (nt, cls, rhs) in rules:
+        suf = [None] * len(rhs) + [NULL]
+        for i in range(len(rhs) - 1, -1, -1):
+            tnt = rhs[i]
+            if tnt in termBits:
+                suf[i] = termBits[tnt]
+            elif tnt in nullable:
+                suf[i] = (first[tnt] & ~NULL) | suf[i+1]
+            else:
+                suf[i] = first[tnt]
+        suffix.append(suf)
+    profStop('checkLL1/first')
+
+    # determine the follow sets: what can begin the rest of a rhs after
+    # a nonterm must follow it, and if the rest of the rhs can derive the
+    # empty string, whatever follows the LHS nonterm must also follow it
+    profStart('checkLL1/follow')
+    fdirect = {}
+    fsucc = {}
+    for nt in nonterms:
+        fdirect[nt] = 0
+        fsucc[nt] = []
+    for r, (nt, cls, rhs) in enumerate(rules):
+        debug('[checkLL1] examining rule %s ::= %s' % (nt, ' '.join(rhs)))
+        for i, tnt in enumerate(rhs):
+            if not tnt in termBits:
+                # only nonterminals count for determining follow sets
+                fst = suffix[r][i+1]
+                fdirect[tnt] |= fst & ~NULL
+                if fst & NULL:
+                    fsucc[tnt].append(nt)
+    follow = digraph(nonterms, fsucc, fdirect)
     if debug('[checkLL1] Follow sets:'):
         for nt in nonterms:
-            debug('[checkLL1]   %s: %s' % (nt, ' '.join(follow[nt])))
+            debug('[checkLL1]   %s: %s' % (nt, ' '.join(termNames(follow[nt]))))
+
+    profStop('checkLL1/follow')
 
     # determine the switch sets for each nonterm and corresponding rhs
-    for (nt, cls, rhs) in rules:
+    profStart('checkLL1/switch')
+    for nt in nonterms:
+        switch[nt] = []          # maps each nonterm to a list of its first sets
+    for r, (nt, cls, rhs) in enumerate(rules):
         # print('### nt=%s cls=%s rhs= %s' % (nt, cls, ' '.join(rhs)))
-        fst = getFirst(rhs)
-        if 'Null' in fst:
+        fst = suffix[r][0]
+        if fst & NULL:
             # the rhs can derive the empty string, so remove Null from the set
-            fst -= {'Null'}
-            # add all of the terminals in follow[nt] to this switch set
-            fst.update(follow[nt])
+            # and add all of the terminals in follow[nt] to this switch set
+            fst = (fst & ~NULL) | follow[nt]
         switch[nt].append((fst, rhs))
         if cls != None:
             saveCases(cls, fst)
     if debug('[checkLL1] nonterm switch sets:'):
         for nt in switch:
-            debug('[checkLL1] %s => %s' % (nt, switch[nt]))
+            debug('[checkLL1] %s => %s' %
+                  (nt, [(termNames(fst), rhs) for (fst, rhs) in switch[nt]]))
     
     # finally check for LL(1)
     for nt in switch:
-        allTerms = set()
+        allTerms = 0
         for (fst, rhs) in switch[nt]:
-            debug('[checkLL1] nt=%s fst=%s rhs=%s' % (nt, fst, rhs))
-            s = allTerms & fst   # check to see if fst has any tokens already in allTerms
-            if s:
+            if getFlag('debug'):
+                debug('[checkLL1] nt=%s fst=%s rhs=%s' % (nt, termNames(fst), rhs))
+            if allTerms & fst:   # check to see if fst has any tokens already in allTerms
                 death('''\
 not LL(1):
 terms %s appear in first sets for more than one rule starting with nonterm %s
-''' % (' '.join(fst), nt))
+''' % (' '.join(termNames(fst)), nt))
             else:
-                allTerms.update(fst)
+                allTerms |= fst
         if not allTerms:
             death('possibly useless or left-recursive grammar rule for nonterm %s' % nt)
         cases[nt] = allTerms
-    pass
+    profStop('checkLL1/switch')
+
+def digraph(nodes, succ, init):
+    # return a map F from nodes to terminal sets with F(x) the union of init[x]
+    # and F(y) for every y in succ[x] (DeRemer and Pennello's digraph algorithm).
+    # This is a Tarjan strongly-connected-component traversal: all of
+    # the nodes in a component share the same F set, and each component is
+    # finished (in reverse topological order) before any node that reaches it,
+    # so every set is computed in one pass over the edges.
+    # The traversal uses an explicit stack rather than recursion
+    # so that long chains of nonterms cannot overflow the Python stack.
+    F = {}
+    N = {}         # 0 = unvisited, stack depth while active, -1 = finished
+    for x in nodes:
+        N[x] = 0
+    stack = []     # Tarjan's stack of nodes in the current search
+    for x in nodes:
+        if N[x] != 0:
+            continue
+        stack.append(x)
+        N[x] = len(stack)
+        F[x] = init[x]
+        calls = [(x, iter(succ[x]), N[x])]
+        while calls:
+            (x, ys, d) = calls[-1]
+            for y in ys:
+                profCount('digraphEdges')
+                if N[y] == 0:
+                    # visit y before continuing with the rest of succ[x]
+                    stack.append(y)
+                    N[y] = len(stack)
+                    F[y] = init[y]
+                    calls.append((y, iter(succ[y]), N[y]))
+                    break
+                if N[y] > 0:
+                    N[x] = min(N[x], N[y])
+                F[x] |= F[y]
+            else:
+                # all of succ[x] is done: if x is the root of its component,
+                # pop the component off the stack
+                calls.pop()
+                if N[x] == d:
+                    while True:
+                        y = stack.pop()
+                        N[y] = -1
+                        F[y] = F[x]
+                        if y == x:
+                            break
+                if calls:
+                    # finish the edge from the caller to x
+                    z = calls[-1][0]
+                    if N[x] > 0:
+                        N[z] = min(N[z], N[x])
+                    F[z] |= F[x]
+    return F
 
 def saveCases(cls, fst):
     global cases, derives
@@ -599,55 +1617,125 @@ def saveCases(cls, fst):
         death('cases for class %s already accounted for' % cls)
     if cls in derives:
         death('%s is an abstract class' % cls)
-    # print('### class=%s cases=%s' % (cls, ' '.join(fst)))
+    # print('### class=%s cases=%s' % (cls, ' '.join(termNames(fst))))
     cases[cls] = fst
 
+def termNames(bits):
+    # return the list of term names in the terminal set bits, in declaration order
+    names = []
+    bits &= ~NULL
+    while bits:
+        low = bits & -bits
+        names.append(termList[low.bit_length() - 2])
+        bits ^= low
+    return names
+
 def buildStubs():
-    global fields, derives, stubs
+    global fields, derives, stubs, tableIndex, fieldTypes
+    tableIndex = {}
+    fieldTypes = {}
+    for (k, cls) in enumerate(tableClasses()):
+        tableIndex[cls] = k
     for cls in derives:
         # make parser stubs for all abstract classes
         if cls in stubs:
             death('duplicate stub for abstract class %s' % cls)
         debug('[buildStubs] making stub for abstract class %s' % cls)
-        stubs[cls] = makeAbstractStub(cls)
+        stubs[cls] = template(makeAbstractStub(cls))
     for cls in fields:
         # make parser stubs for all non-abstract classes
         if cls in stubs:
             death('duplicate stub for class %s' % cls)
         debug('[buildStubs] making stub for non-abstract class %s' % cls)
-        stubs[cls] = makeStub(cls)
+        stubs[cls] = template(makeStub(cls))
+
+# The stubs are kept as templates, so that attaching a semantic section
+# takes time proportional to its code rather than to the whole stub, and
+# each file is only put together as it is written.  A template is a pair
+# (parts, hooks): parts is a list of strings and, where attached code has
+# hooks of its own, nested parts lists; hooks maps each hook name (Cls or
+# Cls:mod, from a //Cls// or //Cls:mod// comment) to the (parts, index)
+# slots where that hook is still unfilled.  As with plain text
+# replacement, mod can be anything on one line up to the next //,
+# spaces and single slashes included.
+
+HOOK = re.compile(r'//((?:void|[A-Z][\$\w]*)(?::[^\n]*?)?)//')
+
+def template(text):
+    # return the template for the string text
+    hooks = {}
+    return (templateParts(text, hooks), hooks)
+
+def templateParts(text, hooks):
+    # return the parts list for the string text, adding its hooks to hooks
+    parts = []
+    pos = 0
+    for m in HOOK.finditer(text):
+        parts.append(text[pos:m.start()])
+        hooks.setdefault(m.group(1), []).append((parts, len(parts)))
+        parts.append(m.group(0))
+        pos = m.end()
+    parts.append(text[pos:] if pos else text)
+    return parts
+
+def templateFill(tpl, name, code):
+    # replace each unfilled //name// hook in the template tpl with the
+    # string code (whose own hooks can be filled later)
+    (parts, hooks) = tpl
+    slots = hooks.pop(name, None)
+    if not slots:
+        return
+    sub = templateParts(code, hooks)
+    for (p, i) in slots:
+        p[i] = sub
+
+def templateText(parts, out=None):
+    # return the list of strings in the template parts list, in order
+    if out == None:
+        out = []
+    for p in parts:
+        if isinstance(p, list):
+            templateText(p, out)
+        else:
+            out.append(p)
+    return out
 
 def makeAbstractStub(base):
     global cases
     caseList = []    # a list of strings, either 'case XXX:' or '    return Cls.parse(...);'
     for cls in derives[base]:
-        for tok in cases[cls]:
+        for tok in termNames(cases[cls]):
             caseList.append('case %s:' % tok)
         caseList.append('    return %s.parse(scn$,trace$);' % cls)
     if base == nt2cls(startSymbol):
         dummy = '\n    public %s() { } // dummy constructor\n' % base
     else:
         dummy = ''
-    stubString = """\
-import java.util.*;
-//{base}:import//
-
-public abstract class {base} {{
-{dummy}
-    public static {base} parse(Scan scn$, Trace trace$) {{
+    if getFlag('table'):
+        parseString = tableParse(base)
+    else:
+        parseString = """\
         Token t$ = scn$.cur();
         Token.Val v$ = t$.val;
         switch(v$) {{
 {cases}
         default:
             throw new RuntimeException("{base} cannot begin with " + v$);
-        }}
-    }}
+        }}""".format(base=base, cases='\n'.join(indent(2, caseList)))
+    stubString = """\
+import java.util.*;
+//{base}:import//
+
+public abstract class {base} {{
+{dummy}
+{parse}
 
 //{base}//
 
 }}
-""".format(cls=cls, base=base, dummy=dummy, cases='\n'.join(indent(2, caseList)))
+""".format(base=base, dummy=dummy,
+           parse=(parseMethod(base, parseString) + kindAbstract(base) +
+                  serialAbstract(base) + walkAbstract(base)))
     return stubString
 
 def makeStub(cls):
@@ -681,12 +1769,20 @@ def makeStub(cls):
         decls.append('public %s %s;' % (fieldType, field))
         inits.append('this.%s = %s;' % (field, field))
         params.append('%s %s' % (fieldType, field))
+    fieldTypes[cls] = fieldVars
     debug('[makeStub] cls=%s decls=%s params=%s inits=%s' % (cls, decls, params, inits))
     debug('[makeStub] rule: %s' % ruleString)
     if cls == nt2cls(startSymbol) and params:
         dummy = '\n    public %s() { } // dummy constructor\n' % cls
     else:
         dummy = ''
+    if getFlag('table'):
+        parseString = tableParse(cls)
+    else:
+        parseString = """\
+        if (trace$ != null)
+            trace$ = trace$.nonterm("{lhs}", scn$.lno);
+{parse}""".format(lhs=lhs, parse=parseString)
     stubString = """\
 import java.util.*;
 //{cls}:import//
@@ -700,11 +1796,7 @@ public class {cls}{ext} {{
 {inits}
     }}
 
-    public static {cls} parse(Scan scn$, Trace trace$) {{
-        if (trace$ != null)
-            trace$ = trace$.nonterm("{lhs}", scn$.lno);
 {parse}
-    }}
 
 //{cls}//
 
@@ -717,9 +1809,73 @@ public class {cls}{ext} {{
            dummy=dummy,
            params=', '.join(params),
            inits='\n'.join(indent(2, inits)),
-           parse=parseString)
+           parse=(parseMethod(cls, parseString) + kindMethod(cls) +
+                  serialMethods(cls) + walkMethods(cls)))
     return stubString
 
+def parseMethod(cls, body):
+    # return the parse method for cls with the given body; with the
+    # parseprof flag, the body goes in a parse$ method that parse calls
+    # between the enter and exit calls of the class's ParseProf counters
+    if not getFlag('parseprof'):
+        return """\
+    public static {cls} parse(Scan scn$, Trace trace$) {{
+{body}
+    }}""".format(cls=cls, body=body)
+    return """\
+    private static final ParseProf prof$ = ParseProf.entry("{cls}");
+
+    public static {cls} parse(Scan scn$, Trace trace$) {{
+        long t$ = prof$.enter(scn$);
+        try {{
+            return parse$(scn$, trace$);
+        }} finally {{
+            prof$.exit(scn$, t$);
+        }}
+    }}
+
+    private static {cls} parse$(Scan scn$, Trace trace$) {{
+{body}
+    }}""".format(cls=cls, body=body)
+
+# The serial flag gives each class a write(Serial.Out) method and a
+# static read(Serial.In) method, which write and read a tree with the
+# PLCC$Serial class (see buildSerial and Std/Serial.java).
+
+def serialAbstract(base):
+    # return the serial methods for the abstract class base, or '' if
+    # the serial flag is not set
+    if not getFlag('serial'):
+        return ''
+    return """
+
+    public void write(Serial.Out out$) throws java.io.IOException {{
+        PLCC$Serial.write(this, kind$(), out$);
+    }}
+
+    public static {base} read(Serial.In in$) throws java.io.IOException {{
+        return ({base})PLCC$Serial.read(in$);
+    }}""".format(base=base)
+
+def serialMethods(cls):
+    # return the serial methods for the non-abstract class cls, or '' if
+    # the serial flag is not set
+    if not getFlag('serial'):
+        return ''
+    if cls in extends:
+        write = ''  # from the base class
+    else:
+        write = """
+
+    public void write(Serial.Out out$) throws java.io.IOException {{
+        PLCC$Serial.write(this, {k}, out$);
+    }}""".format(k=tableIndex[cls])
+    return write + """
+
+    public static {cls} read(Serial.In in$) throws java.io.IOException {{
+        return ({cls})PLCC$Serial.read(in$);
+    }}""".format(cls=cls)
+
 def indent(n, iList):
     ### make a new list with the old list items prepended with 4*n spaces
     indentString = '    '*n
@@ -729,13 +1885,59 @@ def indent(n, iList):
     # print('### str=%s' % str)
     return newList
     
+# The compact flag generates AST classes that use less memory.  Its value
+# is True, meaning 'lists', or a comma-separated list of these options:
+#   lists     the List fields of arbno classes are trimmed to size
+#   tokens    token fields hold the (interned) token text as a String
+#             instead of the Token, since the token kind is fixed by the
+#             grammar rule (so semantic code cannot use their line numbers)
+#   literals  the fields for tokens whose patterns are plain strings are
+#             left out of non-arbno classes, since the text is always the
+#             same (the token is still matched, but not kept)
+
+COMPACT = ['lists', 'tokens', 'literals']
+
+def compact(opt):
+    # is the compact flag option opt on?
+    c = getFlag('compact')
+    if not c:
+        return False
+    if c == True:
+        return opt == 'lists'
+    opts = [o.strip() for o in c.split(',')]
+    for o in opts:
+        if not o in COMPACT:
+            death('improper compact flag value %s' % c)
+    return opt in opts
+
+def ruleField(cls, item):
+    # return (tnt, field) for the RHS item of the rule for cls, as defangg
+    # does, but with field None if it is left out (see compact)
+    (tnt, field) = defangg(item)
+    if field != None and isTerm(tnt) and not cls in arbno and compact('literals'):
+        try:
+            if literal(regexParse(termPats[tnt])) != None:
+                return (tnt, None)
+        except (RegexError, KeyError):
+            pass
+    return (tnt, field)
+
+def tokenType():
+    # return the Java type of token fields
+    return 'String' if compact('tokens') else 'Token'
+
+def tokenValue(expr):
+    # return the Java expression for the value of a token field, given
+    # the expression expr for the matched Token
+    return '%s.toString().intern()' % expr if compact('tokens') else expr
+
 def makeParse(cls, rhs):
     args = []
     parseList = []
     fieldVars = []
     fieldSet = set()
     for item in rhs:
-        (tnt, field) = defangg(item)
+        (tnt, field) = ruleField(cls, item)
         if field == None:
             parseList.append('scn$.match(Token.Val.%s, trace$);' % tnt)
             continue
@@ -744,8 +1946,9 @@ def makeParse(cls, rhs):
         fieldSet.update({field})
         args.append(field)
         if isTerm(tnt):
-            fieldType = 'Token'
-            parseList.append('Token %s = scn$.match(Token.Val.%s, trace$);' % (field, tnt))
+            fieldType = tokenType()
+            parseList.append('%s %s = %s;' % (fieldType, field,
+                             tokenValue('scn$.match(Token.Val.%s, trace$)' % tnt)))
         else:
             fieldType = nt2cls(tnt)
             parseList.append('%s %s = %s.parse(scn$, trace$);' % (fieldType, field, fieldType))
@@ -759,6 +1962,7 @@ def makeArbnoParse(cls, rhs, sep):
     # print('%%%%%% cls=%s rhs="%s" sep=%s' % (cls, ' '.join(rhs), sep))
     global cases
     inits = []       # initializes the List fields
+    trims = []       # trims the List fields to size (compact flag)
     args = []        # the arguments to pass to the constructor
     loopList = []    # the match/parse code in the Arbno loop
     fieldVars = []   # the field variable names (all Lists), to be returned
@@ -779,19 +1983,24 @@ def makeArbnoParse(cls, rhs, sep):
         args.append(field)
         if isTerm(tnt):
             # a term (token)
-            baseType = 'Token'
-            loopList.append('%s.add(scn$.match(Token.Val.%s, trace$));' % (field, tnt))
+            baseType = tokenType()
+            loopList.append('%s.add(%s);' % (field,
+                            tokenValue('scn$.match(Token.Val.%s, trace$)' % tnt)))
         else:
             # a nonterm
             baseType = nt2cls(tnt)
             loopList.append('%s.add(%s.parse(scn$, trace$));' % (field, baseType))
         fieldType = 'List<%s>' % baseType
         fieldVars.append((field, fieldType))
-        inits.append('%s %s = new ArrayList<%s>();' % (fieldType, field, baseType))
+        if compact('lists'):
+            inits.append('ArrayList<%s> %s = new ArrayList<%s>();' % (baseType, field, baseType))
+            trims.append('%s.trimToSize();' % field)
+        else:
+            inits.append('%s %s = new ArrayList<%s>();' % (fieldType, field, baseType))
     switchCases = []
-    for item in cases[cls]:
+    for item in termNames(cases[cls]):
         switchCases.append('case %s:' % item)
-    returnItem = 'return new %s(%s);' % (cls, ', '.join(args))
+    returnList = trims + ['return new %s(%s);' % (cls, ', '.join(args))]
     if sep == None:
         # no separator
         parseString = """\
@@ -804,13 +2013,13 @@ def makeArbnoParse(cls, rhs, sep):
 {loopList}
                 continue;
             default:
-                {returnItem}
+{returnList}
             }}
         }}
 """.format(inits='\n'.join(indent(2, inits)),
            switchCases='\n'.join(indent(3, switchCases)),
            loopList='\n'.join(indent(4, loopList)),
-           returnItem=returnItem)
+           returnList='\n'.join(indent(4, returnList)))
     else:
         # there's a separator
         parseString = """\
@@ -829,11 +2038,11 @@ def makeArbnoParse(cls, rhs, sep):
                 scn$.match(v$, trace$);
             }}
         }} // end of switch
-        {returnItem}
+{returnList}
 """.format(inits='\n'.join(indent(2, inits)),
            switchCases='\n'.join(indent(2, switchCases)),
            loopList='\n'.join(indent(4, loopList)),
-           returnItem=returnItem,
+           returnList='\n'.join(indent(2, returnList)),
            sep=sep)
     debug('[makeArbnoParse] fieldVars=%s' % fieldVars)
     return (fieldVars, parseString)
@@ -846,22 +2055,791 @@ def buildStart():
     dst = getFlag('destdir')
     if dst == None or getFlag('nowrite'):
         return
-    file = 'PLCC$Start.java'
-    try:
-        startFile = open('%s/%s' % (dst, file), 'w')
-    except:
-        death('failure opening %s for writing' % file)
+    # Rep and Batch open their input files with scan$ and count their
+    # tokens with count$, which use the buffer mode and the token count
+    # of the Std Scan only when plcc copies it, so that a grammar with
+    # its own Scan can still use them
+    if getFlag('Token') and getFlag('pattern') and getFlag('Scan'):
+        scan = """\
+        if (mapped)
+            return Scan.map(fname);"""
+        count = """\
+    // return the number of tokens that scn has advanced past
+    public static int count$(Scan scn) {
+        return scn.count;
+    }"""
+    else:
+        scan = """\
+        if (mapped)
+            throw new java.io.IOException(fname + ": cannot map files without plcc's Scan");"""
+        count = """\
+    // return -1: only plcc's Scan counts its tokens
+    public static int count$(Scan scn) {
+        return -1;
+    }"""
     startString = """\
-public class PLCC$Start extends {start} {{ }}
-""".format(start=nt2cls(startSymbol))
-    print(startString, file=startFile)
-    startFile.close()
+public class PLCC$Start extends {start} {{
+
+    // return a scanner on the named file, which is memory-mapped and
+    // scanned in buffer mode if mapped
+    public static Scan scan$(String fname, boolean mapped) throws java.io.IOException {{
+{scan}
+        return new Scan(new java.io.BufferedReader(new java.io.FileReader(fname)));
+    }}
+
+{count}
+}}
+""".format(start=nt2cls(startSymbol), scan=scan, count=count)
+    writeFile('PLCC$Start.java', startString)
+
+def tableClasses():
+    # return the list of all stub classes, whose positions are their
+    # class numbers in the PLCC$Table parse tables
+    return sorted(set(derives) | set(fields))
+
+def tableParse(cls):
+    # return the body of the parse method for cls with the table flag
+    return '''\
+        return (%s)PLCC$Table.parse(%d, scn$, trace$);''' % (cls, tableIndex[cls])
+
+def buildTable():
+    # build the PLCC$Table.java file: an LL(1) parse table for all of the
+    # stub classes, driven by an explicit stack so that deeply nested
+    # input does not overflow the Java stack
+    if not getFlag('table') or getFlag('nowrite'):
+        return
+    if not cases:
+        death('the table flag requires the LL1 check')
+    if getFlag('parseprof'):
+        print('parseprof: with the table flag, only the outermost parse calls are profiled',
+              file=sys.stderr)
+    classes = tableClasses()
+    ntok = len(termList)
+    lhsList = []    # the LHS nonterm of each class, for tracing
+    kinds = []      # ABSTRACT, PLAIN, ARBNO or SEP
+    nslots = []     # the number of constructor args of each class
+    seps = []       # the separator token of each SEP class, or -1
+    progs = []      # the (op, arg, slot) item triples of each class
+    selects = []    # the (token, target) pairs of each class
+    builds = []     # the cases of the build method
+    for (k, cls) in enumerate(classes):
+        sel = []
+        prog = []
+        if cls in derives:
+            lhsList.append('')
+            kinds.append('ABSTRACT')
+            nslots.append(0)
+            seps.append(-1)
+            for sub in derives[cls]:
+                for tok in termNames(cases[sub]):
+                    sel.append((termList.index(tok), tableIndex[sub]))
+            progs.append('')
+            selects.append(sel)
+            continue
+        (lhs, rhs) = fields[cls]
+        lhsList.append(lhs)
+        sep = -1
+        if not cls in arbno:
+            kinds.append('PLAIN')
+        elif arbno[cls] == None:
+            kinds.append('ARBNO')
+        else:
+            kinds.append('SEP')
+            sep = termList.index(arbno[cls])
+        if cls in arbno:
+            for tok in termNames(cases[cls]):
+                sel.append((termList.index(tok), 1))
+        args = []
+        for item in rhs:
+            (tnt, field) = ruleField(cls, item)
+            if field == None:
+                prog.append((0, termList.index(tnt), 0))
+                continue
+            if isTerm(tnt):
+                prog.append((1, termList.index(tnt), len(args)))
+                fieldType = tokenType()
+            else:
+                prog.append((2, tableIndex[nt2cls(tnt)], len(args)))
+                fieldType = nt2cls(tnt)
+            if cls in arbno:
+                fieldType = 'List<%s>' % fieldType
+            args.append('(%s)a[%d]' % (fieldType, len(args)))
+        nslots.append(len(args))
+        seps.append(sep)
+        progs.append(''.join([chr(op) + chr(arg) + chr(slot) for (op, arg, slot) in prog]))
+        selects.append(sel)
+        builds.append((k, 'case %d: return new %s(%s);' % (k, cls, ', '.join(args))))
+    # the tables are packed into string constants, which (unlike array
+    # initializers) add no code to the static initializer, and build is
+    # split into methods of WALKCHUNK classes, to keep each method under
+    # the JVM's size limit
+    def strings(items):
+        return javaStrings(''.join([chr(len(item)) + item for item in items]), '    ')
+    def ints(items):
+        return javaStrings(''.join([chr(item + 1) for item in items]), '    ')
+    buildSteps = []
+    buildChunks = []
+    for c in range(0, len(classes), WALKCHUNK):
+        n = len(buildSteps)
+        buildChunks.append('case %d: return build%d(k, a);' % (n, n))
+        buildSteps.append("""    @SuppressWarnings("unchecked")
+    private static Object build{n}(int k, Object [] a) {{
+        switch(k) {{
+{cases}
+        default:
+            throw new RuntimeException(names[k] + ": no constructor");
+        }}
+    }}
+""".format(n=n, cases='\n'.join(indent(2, [b for (k, b) in builds if k < c + WALKCHUNK and k >= c]))))
+    trim = ''
+    if compact('lists'):
+        trim = """\
+                if (kind[k] != PLAIN)
+                    for (Object list : vals[sp])
+                        ((ArrayList<?>)list).trimToSize();
+"""
+    tableString = """\
+import java.util.*;
+
+// LL(1) parse tables and an explicit-stack parse driver for all of the
+// classes generated by plcc (see its table flag); class k is names[k]
+public class PLCC$Table {{
+
+    private static final int ABSTRACT = 0, PLAIN = 1, ARBNO = 2, SEP = 3;
+    private static final int MATCH = 0, KEEP = 1, PARSE = 2;
+
+    private static final Token.Val [] VALS = Token.Val.values();
+
+    // The tables are packed into strings (see strings and ints below),
+    // since an array initializer adds code to the static initializer
+    // for each element.
+
+    private static final String [] names = strings({names});
+
+    private static final String [] lhs = strings({lhs});
+
+    private static final int [] kind = ints({kinds});
+
+    // the number of constructor args of each class
+    private static final int [] nslot = ints({nslots});
+
+    // the separator token of each SEP class (or -1)
+    private static final int [] sep = ints({seps});
+
+    // the RHS items of each class, as (op, arg, slot) char triples:
+    // MATCH token arg, KEEP token arg in slot, or PARSE class arg into slot
+    private static final String [] prog = strings({progs});
+
+    // select[k][token] is the class an ABSTRACT class k parses for the
+    // token, and is non-negative if the token can begin an ARBNO or SEP
+    // class k; it is made from (token, target) char pairs
+    private static final int [][] select = unpack(strings({selects}));
+
+    // return the strings packed in parts, each as a char giving its
+    // length followed by its chars
+    private static String [] strings(String [] parts) {{
+        StringBuilder sb = new StringBuilder();
+        for (String part : parts)
+            sb.append(part);
+        ArrayList<String> list = new ArrayList<String>();
+        int i = 0;
+        while (i < sb.length()) {{
+            int n = sb.charAt(i++);
+            list.add(sb.substring(i, i + n));
+            i += n;
+        }}
+        return list.toArray(new String[list.size()]);
+    }}
+
+    // return the ints packed in parts, each as a char one greater
+    private static int [] ints(String [] parts) {{
+        StringBuilder sb = new StringBuilder();
+        for (String part : parts)
+            sb.append(part);
+        int [] a = new int[sb.length()];
+        for (int i=0 ; i<a.length ; i++)
+            a[i] = sb.charAt(i) - 1;
+        return a;
+    }}
+
+    private static int [][] unpack(String [] pairs) {{
+        int [][] sel = new int[pairs.length][];
+        for (int k=0 ; k<pairs.length ; k++) {{
+            sel[k] = new int[{ntok}];
+            Arrays.fill(sel[k], -1);
+            String p = pairs[k];
+            for (int i=0 ; i<p.length() ; i+=2)
+                sel[k][p.charAt(i)] = p.charAt(i+1);
+        }}
+        return sel;
+    }}
+
+    // build an instance of class k from its constructor args a, in the
+    // method for its chunk of {chunk} classes
+    private static Object build(int k, Object [] a) {{
+        switch(k / {chunk}) {{
+{buildChunks}
+        default:
+            throw new RuntimeException(names[k] + ": no constructor");
+        }}
+    }}
+
+{buildSteps}
+    @SuppressWarnings("unchecked")
+    private static void put(int k, Object [] a, int slot, Object x) {{
+        if (kind[k] == PLAIN)
+            a[slot] = x;
+        else
+            ((List<Object>)a[slot]).add(x);
+    }}
+
+    // parse an instance of class start, building the same AST as the
+    // recursive-descent parse methods, but with an explicit stack of
+    // partially parsed classes instead of the Java call stack
+    public static Object parse(int start, Scan scn, Trace trace) {{
+        int [] cls = new int[64];          // the class of each stack entry
+        int [] pos = new int[64];          // the next item in its prog, or -1
+        Object [][] vals = new Object[64][]; // its constructor args
+        Trace [] traces = new Trace[64];   // its trace
+        int sp = -1;                       // the top of the stack
+        int c = start;                     // a class to push, or -1
+        while (true) {{
+            if (c >= 0) {{
+                // an abstract class parses as one of its subclasses
+                while (kind[c] == ABSTRACT) {{
+                    Token.Val v = scn.cur().val;
+                    int d = select[c][v.ordinal()];
+                    if (d < 0)
+                        throw new RuntimeException(names[c] + " cannot begin with " + v);
+                    c = d;
+                }}
+                if (++sp == cls.length) {{
+                    int size = 2 * sp;
+                    cls = Arrays.copyOf(cls, size);
+                    pos = Arrays.copyOf(pos, size);
+                    vals = Arrays.copyOf(vals, size);
+                    traces = Arrays.copyOf(traces, size);
+                }}
+                Trace t = (sp == 0) ? trace : traces[sp-1];
+                if (t != null)
+                    t = t.nonterm(lhs[c], scn.lno);
+                Object [] a = new Object[nslot[c]];
+                if (kind[c] != PLAIN)
+                    for (int i=0 ; i<a.length ; i++)
+                        a[i] = new ArrayList<Object>();
+                cls[sp] = c;
+                pos[sp] = (kind[c] == PLAIN) ? 0 : -1;
+                vals[sp] = a;
+                traces[sp] = t;
+                c = -1;
+            }}
+            int k = cls[sp];
+            String p = prog[k];
+            int i = pos[sp];
+            if (i < 0 || i == p.length()) {{
+                // at the start of an arbno class or the end of its items,
+                // decide whether there is another trip through them
+                boolean more = false;
+                if (i < 0 || kind[k] == ARBNO) {{
+                    more = select[k][scn.cur().val.ordinal()] >= 0;
+                }} else if (kind[k] == SEP) {{
+                    Token.Val v = scn.cur().val;
+                    if (v.ordinal() == sep[k]) {{
+                        scn.match(v, traces[sp]);
+                        more = true;
+                    }}
+                }}
+                if (more) {{
+                    pos[sp] = 0;
+                    continue;
+                }}
+                // class k is done: pop it and give it to its parent
+{trim}                Object x = build(k, vals[sp]);
+                vals[sp] = null;
+                traces[sp] = null;
+                if (--sp < 0)
+                    return x;
+                k = cls[sp];
+                put(k, vals[sp], prog[k].charAt(pos[sp] - 1), x);
+                continue;
+            }}
+            int op = p.charAt(i);
+            int arg = p.charAt(i+1);
+            pos[sp] = i + 3;
+            if (op == PARSE) {{
+                c = arg;
+                continue;
+            }}
+            Token tok = scn.match(VALS[arg], traces[sp]);
+            if (op == KEEP)
+                put(k, vals[sp], p.charAt(i+2), {keep});
+        }}
+    }}
+}}
+""".format(names=strings(classes), lhs=strings(lhsList),
+           kinds=ints([['ABSTRACT', 'PLAIN', 'ARBNO', 'SEP'].index(kd) for kd in kinds]), nslots=ints(nslots), seps=ints(seps),
+           progs=strings(progs), ntok=ntok, keep=tokenValue('tok'),
+           trim=trim,
+           selects=strings([''.join([chr(t) + chr(d) for (t, d) in sel]) for sel in selects]),
+           chunk=WALKCHUNK, buildChunks='\n'.join(indent(2, buildChunks)),
+           buildSteps='\n'.join(buildSteps))
+    writeFile('PLCC$Table.java', tableString)
+
+def buildReparse():
+    # build the PLCC$Reparse.java file (see Std/Reparse.java), whose
+    # elements are the trips through the arbno loop of the start rule
+    # <start> ::= <list>
+    if not getFlag('reparse') or getFlag('nowrite'):
+        return
+    start = nt2cls(startSymbol)
+    if start in derives or len(fields[start][1]) != 1:
+        death('the reparse flag needs a start rule of the form <%s> ::= <list>' % startSymbol)
+    (listNt, field) = defangg(fields[start][1][0])
+    cls = nt2cls(listNt)
+    if isTerm(listNt) or not cls in arbno or arbno[cls] != None:
+        death('the reparse flag needs <%s> to be an arbno rule without a separator' % listNt)
+    if not cases:
+        death('the reparse flag requires the LL1 check')
+    parseList = []  # the parse code for one element
+    inits = []      # the List declarations in build
+    adds = []       # adds an element's values to the Lists
+    args = []       # the List args of the cls constructor
+    for item in fields[cls][1]:
+        (tnt, field) = defangg(item)
+        if field == None:
+            parseList.append('scn$.match(Token.Val.%s, trace$);' % tnt)
+            continue
+        n = len(args)
+        if isTerm(tnt):
+            baseType = tokenType()
+            parseList.append('a$[%d] = %s;' % (n, tokenValue('scn$.match(Token.Val.%s, trace$)' % tnt)))
+        else:
+            baseType = nt2cls(tnt)
+            parseList.append('a$[%d] = %s.parse(scn$, trace$);' % (n, baseType))
+        field += 'List'
+        if compact('lists'):
+            inits.append('ArrayList<%s> %s = new ArrayList<%s>(items.size());' % (baseType, field, baseType))
+        else:
+            inits.append('List<%s> %s = new ArrayList<%s>();' % (baseType, field, baseType))
+        adds.append('%s.add((%s)a$[%d]);' % (field, baseType, n))
+        args.append(field)
+    reparseString = """\
+import java.util.*;
+
+// an incremental reparser for <{nt}> (see Reparse.java), whose elements
+// are the trips through the arbno loop of <{list}>
+public class PLCC$Reparse extends Reparse<{start}> {{
+
+    protected Object [] item(Scan scn$) {{
+        Trace trace$ = null;
+        Token t$ = scn$.cur();
+        if (t$ == null)
+            return null;
+        switch(t$.val) {{
+{cases}
+            break;
+        default:
+            return null;
+        }}
+        Object [] a$ = new Object[{n}];
+{parse}
+        return a$;
+    }}
+
+    protected {start} build(List<Object[]> items) {{
+{inits}
+        for (Object [] a$ : items) {{
+{adds}
+        }}
+        return new {start}(new {cls}({args}));
+    }}
+}}
+""".format(nt=startSymbol, list=listNt, start=start, cls=cls, n=len(args),
+           cases='\n'.join(indent(2, ['case %s:' % tok for tok in termNames(cases[cls])])),
+           parse='\n'.join(indent(2, parseList)),
+           inits='\n'.join(indent(2, inits)),
+           adds='\n'.join(indent(3, adds)),
+           args=', '.join(args))
+    writeFile('PLCC$Reparse.java', reparseString)
+
+# The visitor flag generates a PLCC$Visitor interface, with an enter and
+# a leave method for each class, and a PLCC$Walk class that walks a tree
+# with an explicit stack of nodes, so that no tree is too deep to walk.
+# Each class gets a walk(PLCC$Visitor) method that starts a walk at its
+# instance.  Classes are numbered as in the parse tables (see tableIndex),
+# and with the visitor or serial flag, a class derived from an abstract
+# class has a kind$ method that returns its number, for walking the
+# fields whose type is the base class.
+
+WALKCHUNK = 256     # the number of classes in each step method
+
+def kindAbstract(base):
+    # return the kind$ declaration for the abstract class base, or '' if
+    # neither the visitor nor the serial flag is set
+    if not getFlag('visitor') and not getFlag('serial'):
+        return ''
+    return """
+
+    // the class number of this instance (see PLCC$Table)
+    public abstract int kind$();"""
+
+def kindMethod(cls):
+    # return the kind$ method for the non-abstract class cls, or '' if it
+    # is not derived from an abstract class or neither the visitor nor the
+    # serial flag is set
+    if not cls in extends or (not getFlag('visitor') and not getFlag('serial')):
+        return ''
+    return """
+
+    public int kind$() {{
+        return {k};
+    }}""".format(k=tableIndex[cls])
+
+def walkAbstract(base):
+    # return the walk methods for the abstract class base, or '' if the
+    # visitor flag is not set
+    if not getFlag('visitor'):
+        return ''
+    return """
+
+    public void walk(PLCC$Visitor v$) {
+        PLCC$Walk.walk(this, kind$(), v$);
+    }"""
+
+def walkMethods(cls):
+    # return the walk methods for the non-abstract class cls, or '' if
+    # the visitor flag is not set or it inherits them
+    if not getFlag('visitor') or cls in extends:
+        return ''
+    return """
+
+    public void walk(PLCC$Visitor v$) {{
+        PLCC$Walk.walk(this, {k}, v$);
+    }}""".format(k=tableIndex[cls])
+
+def walkPushes(cls):
+    # return the lines that push the children of the node n of class cls
+    # (its fields that are, or are lists of, generated classes) in reverse
+    # order, so that they are popped in field order
+    pushes = []
+    for (field, fieldType) in reversed(fieldTypes[cls]):
+        m = re.match(r'List<(.*)>$', fieldType)
+        elemType = m.group(1) if m else fieldType
+        if not elemType in tableIndex:
+            continue   # a Token or String field
+        if elemType in derives:
+            push = '{ %s y$ = %%s; push(y$, y$.kind$()); }' % elemType
+        else:
+            push = 'push(%%s, %d);' % tableIndex[elemType]
+        if m:
+            pushes.append('for (int i$=n.%s.size()-1 ; i$>=0 ; i$--)' % field)
+            pushes.append('    ' + push % ('n.%s.get(i$)' % field))
+        else:
+            pushes.append(push % ('n.%s' % field))
+    return pushes
+
+def walkCase(cls):
+    # return the lines of the PLCC$Walk step cases for the class cls: the
+    # enter case pushes the leave entry for the node and then, if the
+    # visitor's enter method returns true, its children; a class without
+    # children is left as soon as it is entered
+    k = tableIndex[cls]
+    pushes = walkPushes(cls)
+    lines = ['case %d: { // enter %s' % (k, cls),
+             '    %s n = (%s)x;' % (cls, cls)]
+    if not pushes:
+        return lines + ['    v.enter(n);',
+                        '    v.leave(n);',
+                        '    break;',
+                        '}']
+    lines.append('    push(n, %d);' % ~k)
+    lines.append('    if (v.enter(n)) {')
+    lines += indent(2, pushes)
+    return lines + ['    }',
+                    '    break;',
+                    '}',
+                    'case %d: // leave %s' % (~k, cls),
+                    '    v.leave((%s)x);' % cls,
+                    '    break;']
+
+def buildWalk():
+    # build the PLCC$Visitor.java and PLCC$Walk.java files
+    if not getFlag('visitor') or getFlag('nowrite'):
+        return
+    classes = tableClasses()
+    methods = []
+    for cls in classes:
+        if cls in derives:
+            methods.append('default boolean enter(%s n) { return true; }' % cls)
+            methods.append('default void leave(%s n) { }' % cls)
+        elif cls in extends:
+            methods.append('default boolean enter(%s n) { return enter((%s)n); }' % (cls, extends[cls]))
+            methods.append('default void leave(%s n) { leave((%s)n); }' % (cls, extends[cls]))
+        else:
+            methods.append('default boolean enter(%s n) { return true; }' % cls)
+            methods.append('default void leave(%s n) { }' % cls)
+    visitorString = """// a visitor for PLCC$Walk (see plcc's visitor flag).  The walk calls
+// enter(n) for each node n of a tree before its children, and leave(n)
+// after them, and only visits the children if enter(n) returns true.
+// The methods for a class derived from an abstract class call the ones
+// for the abstract class, so a visitor can handle all of them at once.
+public interface PLCC$Visitor {{
+
+{methods}
+}}
+""".format(methods='\n'.join(indent(1, methods)))
+    writeFile('PLCC$Visitor.java', visitorString)
+    # the step cases, in chunks of WALKCHUNK classes per method to keep
+    # each method under the JVM's size limit
+    steps = []
+    chunks = []
+    for c in range(0, len(classes), WALKCHUNK):
+        caseList = []
+        for cls in classes[c:c+WALKCHUNK]:
+            if not cls in derives:
+                caseList += walkCase(cls)
+        n = len(steps)
+        chunks.append('case %d: w.step%d(x, k, v); break;' % (n, n))
+        steps.append("""    private void step{n}(Object x, int k, PLCC$Visitor v) {{
+        switch(k) {{
+{cases}
+        }}
+    }}
+""".format(n=n, cases='\n'.join(indent(2, caseList))))
+    walkString = """import java.util.*;
+
+// an explicit-stack walk of the trees of the classes generated by plcc
+// (see its visitor flag), calling the methods of a PLCC$Visitor for
+// each node in depth-first order; class k is the class whose number
+// is k in PLCC$Table
+public class PLCC$Walk {{
+
+    private Object [] nodes = new Object[64];
+    private int [] kinds = new int[64];  // the class of each node, or ~class to leave it
+    private int sp = 0;                  // the number of stack entries
+
+    private void push(Object x, int k) {{
+        if (sp == nodes.length) {{
+            nodes = Arrays.copyOf(nodes, 2 * sp);
+            kinds = Arrays.copyOf(kinds, 2 * sp);
+        }}
+        nodes[sp] = x;
+        kinds[sp++] = k;
+    }}
+
+    // walk the tree rooted at x, an instance of class k, with the visitor v
+    public static void walk(Object x, int k, PLCC$Visitor v) {{
+        PLCC$Walk w = new PLCC$Walk();
+        w.push(x, k);
+        while (w.sp > 0) {{
+            int i = --w.sp;
+            x = w.nodes[i];
+            k = w.kinds[i];
+            w.nodes[i] = null;
+            switch((k < 0 ? ~k : k) / {chunk}) {{
+{chunks}
+            }}
+        }}
+    }}
+
+{steps}}}
+""".format(chunk=WALKCHUNK, chunks='\n'.join(indent(3, chunks)),
+           steps='\n'.join(steps))
+    writeFile('PLCC$Walk.java', walkString)
+
+# With the serial flag, PLCC$Serial writes a tree in post-order, each
+# node as a record after the records of its children, and reads it back
+# with a stack of the nodes read so far, so that neither direction
+# recurses.  A record is the node's class number plus one, then its
+# Token and String fields, and the sizes of its List fields (followed by
+# their elements, for a List of tokens), in field order.  Reading a
+# record pops the node's children from the stack, in reverse field
+# order, and pushes the node.  A 0 ends the tree.
+
+def serialCases(cls):
+    # return the lines of the PLCC$Serial write step cases and of its
+    # read step case for the class cls (whose locals are named for its
+    # fields, so the read step's parameters end in $)
+    k = tableIndex[cls]
+    record = ['out.writeInt(%d);' % (k + 1)]
+    reads = []    # read the record's fields
+    pops = []     # pop the children, last field first
+    for (field, fieldType) in fieldTypes[cls]:
+        m = re.match(r'List<(.*)>$', fieldType)
+        elemType = m.group(1) if m else fieldType
+        if elemType in tableIndex:
+            if m:
+                record.append('out.writeInt(n.%s.size());' % field)
+                reads.append('int %s$n = in$.readInt();' % field)
+                pops.insert(0, '%s %s = popList(%s$n, %s.class);' % (fieldType, field, field, elemType))
+            else:
+                pops.insert(0, '%s %s = (%s)pop();' % (fieldType, field, fieldType))
+            continue
+        (write, read) = ('writeToken', 'readToken') if elemType == 'Token' else ('writeString', 'readString')
+        if m:
+            record.append('out.writeInt(n.%s.size());' % field)
+            record.append('for (%s t$ : n.%s)' % (elemType, field))
+            record.append('    out.%s(t$);' % write)
+            reads.append('int %s$n = in$.readInt();' % field)
+            reads.append('%s %s = new ArrayList<%s>(%s$n);' % (fieldType, field, elemType, field))
+            reads.append('for (int i$=0 ; i$<%s$n ; i$++)' % field)
+            reads.append('    %s.add(in$.%s());' % (field, read))
+        else:
+            record.append('out.%s(n.%s);' % (write, field))
+            reads.append('%s %s = in$.%s();' % (fieldType, field, read))
+    pushes = walkPushes(cls)
+    if len(record) > 1:
+        record.insert(0, '%s n = (%s)x;' % (cls, cls))
+    record.append('break;')
+    if pushes:
+        writeLines = ['case %d: { // enter %s' % (k, cls),
+                      '    %s n = (%s)x;' % (cls, cls),
+                      '    push(n, %d);' % ~k]
+        writeLines += indent(1, pushes)
+        writeLines += ['    break;', '}',
+                       'case %d: { // write %s' % (~k, cls)]
+    else:
+        writeLines = ['case %d: { // write %s' % (k, cls)]
+    writeLines += indent(1, record) + ['}']
+    readLines = ['case %d: { // read %s' % (k, cls)]
+    readLines += indent(1, reads + pops)
+    readLines += ['    push(new %s(%s), 0);' % (cls, ', '.join([f for (f, t) in fieldTypes[cls]])),
+                  '    break;',
+                  '}']
+    return (writeLines, readLines)
+
+def buildSerial():
+    # build the PLCC$Serial.java file
+    if not getFlag('serial') or getFlag('nowrite'):
+        return
+    classes = tableClasses()
+    steps = []
+    writeChunks = []
+    readChunks = []
+    for c in range(0, len(classes), WALKCHUNK):
+        writeList = []
+        readList = []
+        for cls in classes[c:c+WALKCHUNK]:
+            if not cls in derives:
+                (w, r) = serialCases(cls)
+                writeList += w
+                readList += r
+        n = len(writeChunks)
+        writeChunks.append('case %d: w.write%d(x, k, out); break;' % (n, n))
+        readChunks.append('case %d: r.read%d(k, in); break;' % (n, n))
+        steps.append("""\
+    private void write{n}(Object x, int k, Serial.Out out) throws IOException {{
+        switch(k) {{
+{writes}
+        }}
+    }}
+
+    private void read{n}(int k$, Serial.In in$) throws IOException {{
+        switch(k$) {{
+{reads}
+        default:
+            throw new IOException("bad class number " + k$);
+        }}
+    }}
+""".format(n=n, writes='\n'.join(indent(2, writeList)),
+           reads='\n'.join(indent(2, readList))))
+    serialString = """\
+import java.io.*;
+import java.util.*;
+
+// binary serialization of the trees of the classes generated by plcc
+// (see its serial flag, and Serial.java for the encoding of numbers,
+// strings and tokens).  A tree is written in post-order, each node as a
+// record -- its class number plus one, then its Token and String fields
+// and the sizes of its List fields, in field order -- after the records
+// of its children, and a 0 ends the tree.  Writing and reading both use
+// an explicit stack, so no tree is too deep for them.  Class k is the
+// class whose number is k in PLCC$Table
+public class PLCC$Serial {{
+
+    private Object [] nodes = new Object[64];
+    private int [] kinds = new int[64];  // writing: the class of each node, or ~class to write it
+    private int sp = 0;                  // the number of stack entries
+
+    private void push(Object x, int k) {{
+        if (sp == nodes.length) {{
+            nodes = Arrays.copyOf(nodes, 2 * sp);
+            kinds = Arrays.copyOf(kinds, 2 * sp);
+        }}
+        nodes[sp] = x;
+        kinds[sp++] = k;
+    }}
+
+    private Object pop() throws IOException {{
+        if (sp == 0)
+            throw new IOException("bad serialized tree");
+        Object x = nodes[--sp];
+        nodes[sp] = null;
+        return x;
+    }}
+
+    // pop the top n nodes, which must be of class c, into a List
+    private <T> List<T> popList(int n, Class<T> c) throws IOException {{
+        if (n < 0 || n > sp)
+            throw new IOException("bad serialized tree");
+        ArrayList<T> list = new ArrayList<T>(n);
+        for (int i=sp-n ; i<sp ; i++) {{
+            list.add(c.cast(nodes[i]));
+            nodes[i] = null;
+        }}
+        sp -= n;
+        return list;
+    }}
+
+    // write the tree rooted at x, an instance of class k, to out
+    public static void write(Object x, int k, Serial.Out out) throws IOException {{
+        PLCC$Serial w = new PLCC$Serial();
+        w.push(x, k);
+        while (w.sp > 0) {{
+            int i = --w.sp;
+            x = w.nodes[i];
+            k = w.kinds[i];
+            w.nodes[i] = null;
+            switch((k < 0 ? ~k : k) / {chunk}) {{
+{writeChunks}
+            }}
+        }}
+        out.writeInt(0);
+    }}
+
+    // read a tree written by write from in
+    public static Object read(Serial.In in) throws IOException {{
+        PLCC$Serial r = new PLCC$Serial();
+        try {{
+            for (int k = in.readInt() ; k != 0 ; k = in.readInt()) {{
+                k--;
+                switch(k / {chunk}) {{
+{readChunks}
+                default:
+                    throw new IOException("bad class number " + k);
+                }}
+            }}
+        }} catch (ClassCastException e) {{
+            throw new IOException("bad serialized tree", e);
+        }}
+        if (r.sp != 1)
+            throw new IOException("bad serialized tree");
+        return r.nodes[0];
+    }}
+
+{steps}}}
+""".format(chunk=WALKCHUNK, writeChunks='\n'.join(indent(3, writeChunks)),
+           readChunks='\n'.join(indent(4, readChunks)),
+           steps='\n'.join(steps))
+    writeFile('PLCC$Serial.java', serialString)
 
 def sem(nxt):
     global stubs, argv
     # print('=== semantic routines')
     if not getFlag('semantics'):
+        profStart('semFinishUp')
         semFinishUp()
+        profStop('semFinishUp')
         done()
     for line in nxt:
         line = line.strip()
@@ -885,19 +2863,20 @@ def sem(nxt):
         if mod == 'ignore!':
             continue
         if cls in stubs:
-            stub = stubs[cls]
             if mod:
                 clsmod = '%s:%s' % (cls, mod)
             else:
                 clsmod = cls
-            stub = stub.replace('//%s//' % clsmod, codeString)
-            debug('class %s:\n%s\n' % (cls, stub))
-            stubs[cls] = stub
+            templateFill(stubs[cls], clsmod, codeString)
+            if getFlag('debug'):
+                debug('class %s:\n%s\n' % (cls, ''.join(templateText(stubs[cls][0]))))
         else:
             if mod:
                 deathLNO('no stub for class %s -- cannot replace //%s:%s//' % (cls, cls, mod))
-            stubs[cls] = codeString
+            stubs[cls] = template(codeString)
+    profStart('semFinishUp')
     semFinishUp()
+    profStop('semFinishUp')
     done()
 
 def getCode(nxt):
@@ -929,46 +2908,719 @@ def semFinishUp():
     if getFlag('nowrite'):
         return
     global stubs, STD
-    dst = flags['destdir']
-    print('\nJava source files created:')
+    print('\nJava source files created:', file=Out)
     for cls in sorted(stubs):
-        if cls in STD:
-            death('%s: reserved class name' % cls)
+        msg = reserved(cls)
+        if msg:
+            death(msg)
+        if writeFile('%s.java' % cls, templateText(stubs[cls][0])):
+            print('  %s.java' % cls, file=Out)
+        else:
+            print('  %s.java (unchanged)' % cls, file=Out)
+
+def writeFile(fname, text):
+    # write text -- a string, or a list of strings written one after the
+    # other -- to the file fname in the destination directory, recording
+    # its content hash for the manifest.
+    # In incremental mode, a file whose content is unchanged is not touched
+    # (so its mtime is preserved).  Returns True if the file was written.
+    global Outputs
+    if isinstance(text, str):
+        text = [text]
+    h = hashlib.sha1()
+    for chunk in text:
+        h.update(chunk.encode())
+    Outputs[fname] = h.hexdigest()
+    if Record != None:
+        Record.append((fname, ''.join(text)))
+    if Sink != None:
+        Sink[fname] = ''.join(text)
+    if not Disk:
+        return True
+    if getFlag('archive'):
+        archiveWrite(fname, ''.join(text))
+        return True
+    path = '%s/%s' % (getFlag('destdir'), fname)
+    if getFlag('incremental'):
         try:
-            fname = '%s/%s.java' % (dst, cls)
-            f = open(fname, 'w')
+            f = open(path)
+            old = f.read()
+            f.close()
+            if hashlib.sha1(old.encode()).hexdigest() == Outputs[fname]:
+                debug('[writeFile] %s: unchanged' % path)
+                profCount('filesUnchanged')
+                return False
         except:
-            death('cannot write to file %s' % fname)
-        print(stubs[cls], end='', file=f)
-        print('  %s.java' % cls)
+            pass # missing or unreadable, so (re)write it
+    try:
+        f = open(path, 'w')
+    except:
+        death('cannot write to file %s' % path)
+    f.writelines(text)
+    f.close()
+    profCount('filesWritten')
+    if Profile != None:
+        profCount('bytesWritten', sum([len(chunk.encode()) for chunk in text]))
+    return True
+
+def readStd(std, fname):
+    # return the contents of the library file fname in the std directory
+    global Inputs
+    path = '%s/%s' % (std, fname)
+    try:
+        f = open(path)
+        text = f.read()
         f.close()
+    except:
+        death(fname + ': cannot read library file')
+    Inputs[path] = hashlib.sha1(text.encode()).hexdigest()
+    return text
+
+def copyStd(std, fname):
+    # copy the Std library file fname.java to the destination directory
+    writeFile('%s.java' % fname, readStd(std, '%s.java' % fname))
+
+def archiveWrite(fname, text):
+    # add the file fname with contents text to the output archive.
+    # If the archive flag names a .zip or .jar file, the archive is a zip
+    # file (with fixed timestamps, so the same sources give the same bytes).
+    # Otherwise it is a single stream ('-' for standard output) in which
+    # each file is a line '%%file NAME LENGTH' followed by LENGTH bytes
+    # of UTF-8 contents.
+    # The archive is written to a temporary file and renamed by
+    # archiveFinishUp, so a failed run leaves any previous archive alone.
+    global Archive, Out
+    if Archive == None:
+        path = getFlag('archive')
+        Archive = {'path': path, 'zip': None}
+        Archive['out'] = Out  # restored when the archive is finished
+        if path == '-':
+            Archive['file'] = sys.stdout.buffer
+            if Out == None:
+                Out = sys.stderr # keep messages out of the stream
+        else:
+            try:
+                Archive['file'] = open(path + '.tmp', 'wb')
+            except:
+                death('cannot write to file %s' % path)
+            if re.search(r'\.(zip|jar)$', path, re.I):
+                Archive['zip'] = zipfile.ZipFile(Archive['file'], 'w')
+    data = text.encode()
+    if Archive['zip']:
+        info = zipfile.ZipInfo(fname, date_time=(1980, 1, 1, 0, 0, 0))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        Archive['zip'].writestr(info, data)
+    else:
+        Archive['file'].write(b'%%%%file %s %d\n' % (fname.encode(), len(data)))
+        Archive['file'].write(data)
+    profCount('filesWritten')
+    profCount('bytesWritten', len(data))
+
+def archiveFinishUp():
+    # close the output archive, if any, and move it into place
+    # (in incremental mode, an archive whose bytes are unchanged is not touched)
+    global Archive, Out
+    if Archive == None:
+        return
+    if Archive['zip']:
+        Archive['zip'].close()
+    path = Archive['path']
+    Archive['file'].flush()
+    if path != '-':
+        Archive['file'].close()
+        tmp = path + '.tmp'
+        try:
+            if getFlag('incremental') and os.path.isfile(path):
+                f = open(path, 'rb')
+                old = f.read()
+                f.close()
+                f = open(tmp, 'rb')
+                new = f.read()
+                f.close()
+                if old == new:
+                    os.remove(tmp)
+                    tmp = None
+            if tmp:
+                os.replace(tmp, path)
+        except OSError:
+            death('cannot write to file %s' % path)
+        print('\nArchive %s written' % path, file=Out)
+    Out = Archive['out']
+    Archive = None
+
+def archiveAbort():
+    # close the output archive of a failed run, if any, removing its
+    # temporary file
+    global Archive, Out
+    if Archive == None:
+        return
+    try:
+        if Archive['zip']:
+            Archive['zip'].close()
+        if Archive['path'] == '-':
+            Archive['file'].flush()
+        else:
+            Archive['file'].close()
+            os.remove(Archive['path'] + '.tmp')
+    except OSError:
+        pass
+    Out = Archive['out']
+    Archive = None
+
+def manifestFinishUp():
+    # write the incremental build manifest to the destination directory,
+    # and deal with stale generated files from the previous run:
+    # a stale file is removed if it is exactly as we generated it,
+    # and is otherwise just reported
+    if getFlag('nowrite') or not getFlag('incremental') or not Disk:
+        return
+    if getFlag('archive'):
+        return
+    dst = getFlag('destdir')
+    mname = '%s/%s' % (dst, getFlag('manifest'))
+    try:
+        f = open(mname)
+        old = json.load(f)['outputs']
+        f.close()
+    except:
+        old = {} # no previous (legal) manifest
+    for fname in sorted(old):
+        if fname in Outputs:
+            continue
+        path = '%s/%s' % (dst, fname)
+        try:
+            f = open(path, 'rb')
+            digest = hashlib.sha1(f.read()).hexdigest()
+            f.close()
+        except:
+            continue # already gone
+        if digest == old[fname]:
+            os.remove(path)
+            print('stale file %s removed' % path, file=sys.stderr)
+        else:
+            print('stale file %s modified since generated -- not removed' % path,
+                  file=sys.stderr)
+    try:
+        f = open(mname, 'w')
+        json.dump({'inputs': Inputs, 'outputs': Outputs}, f, indent=1, sort_keys=True)
+        print(file=f)
+        f.close()
+    except:
+        death('cannot write to file %s' % mname)
 
 #####################
 # utility functions #
 #####################
 
 def done(msg=''):
-    if msg:
-        print(msg, file=sys.stderr)
-    exit(0)
+    archiveFinishUp()
+    manifestFinishUp()
+    profFinishUp()
+    raise PlccDone(msg)
+
+def batch(jobFile, common=[]):
+    # compile each of the grammar jobs listed in jobFile ('-' for standard
+    # input) on a pool of worker processes.  Each job line is a plcc command
+    # line -- flags followed by grammar files -- optionally preceded by
+    # '-C dir' to run the job in directory dir, as in
+    #     -C calc --destdir=Java --LL1= grammar
+    # Blank lines and '#' comments are ignored.  The flags in common apply
+    # to every job, before its own flags.  A failing job does not stop
+    # the others; each job is reported and done() (or death()) reports
+    # the total.
+    if argv:
+        death('grammar files cannot be given with the batch flag')
+    try:
+        if jobFile == '-':
+            text = sys.stdin.read()
+        else:
+            f = open(jobFile)
+            text = f.read()
+            f.close()
+    except:
+        death(jobFile + ': error opening batch file')
+    jobs = []
+    lno = 0
+    for line in io.StringIO(text):
+        lno += 1
+        try:
+            words = shlex.split(line, comments=True)
+        except ValueError as msg:
+            death('%s:%d: %s' % (jobFile, lno, msg))
+        if not words:
+            continue
+        dir = '.'
+        if words[0] == '-C':
+            if len(words) < 2:
+                death('%s:%d: -C requires a directory' % (jobFile, lno))
+            dir = words[1]
+            words = words[2:]
+        jobs.append((dir, common + words))
+    workers = getFlag('jobs')
+    if workers:
+        try:
+            workers = int(workers)
+            if workers < 1:
+                raise ValueError
+        except:
+            death('improper jobs flag value')
+    else:
+        workers = None
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(batchJob, dir, args) for (dir, args) in jobs]
+        for ((dir, args), future) in zip(jobs, futures):
+            try:
+                (ok, msg, log) = future.result()
+            except Exception as e:
+                (ok, msg, log) = (False, 'worker failure: %s' % e, '')
+            job = ' '.join(args)
+            if dir != '.':
+                job = '-C %s %s' % (dir, job)
+            if ok:
+                print('ok      %s' % job, file=Out)
+            else:
+                failed += 1
+                print('FAILED  %s' % job, file=Out)
+            if log and getFlag('debug'):
+                print(log, end='', file=Out)
+            if msg:
+                for line in str(msg).rstrip().splitlines():
+                    print('        %s' % line, file=Out)
+    summary = '%d of %d grammars compiled' % (len(jobs) - failed, len(jobs))
+    if failed:
+        death(summary)
+    done(summary)
+
+def batchJob(dir, args):
+    # run one batch job in a worker process, with args as its command line
+    # (flags and grammar files) and dir as the current directory;
+    # return a tuple (ok, msg, log) with log the job's progress messages
+    global argv, Out
+    cwd = os.getcwd()
+    Out = io.StringIO()
+    try:
+        try:
+            os.chdir(dir)
+        except OSError:
+            death(dir + ': cannot change to directory')
+        plccInit()
+        argv = args[:]
+        processArgs()
+        plcc()
+        return (True, '', Out.getvalue())
+    except PlccDone as msg:
+        return (True, str(msg), Out.getvalue())
+    except PlccError as msg:
+        return (False, str(msg), Out.getvalue())
+    except Exception as e:
+        return (False, 'internal error: %r' % e, Out.getvalue())
+    finally:
+        Out = None
+        os.chdir(cwd)
+
+def saveState():
+    # return a copy of the plcc state that results from the lex and par
+    # phases, along with a key identifying the lexical and grammar sections
+    # of the grammar files and the library files read (see stateKey)
+    lib = sorted([fname for fname in Inputs if not fname in argv])
+    state = {'key': stateKey(lib), 'lib': lib}
+    for name in ['flags', 'startSymbol', 'skip', 'term', 'skipSpecs', 'termSpecs',
+                 'termList', 'termBits', 'skipPats', 'termPats', 'nonterms', 'fields', 'rules', 'extends',
+                 'derives', 'cases', 'arbno', 'stubs', 'Inputs', 'Outputs']:
+        state[name] = copy.deepcopy(globals()[name])
+    return state
+
+def restoreState(state):
+    # restore the plcc state saved by saveState
+    for name in state:
+        if not name in ['key', 'lib']:
+            globals()[name] = copy.deepcopy(state[name])
+
+def stateKey(lib):
+    # return a hash of the lexical and grammar sections of the grammar
+    # files in argv (everything up to the second '%' line), along with
+    # the contents of the library files in the list lib
+    h = hashlib.sha1()
+    seen = 0
+    for fname in argv:
+        if seen == 2:
+            break
+        text = readInput(fname)
+        for line in io.StringIO(text):
+            h.update(line.encode())
+            if line.rstrip() == '%':
+                seen += 1
+                if seen == 2:
+                    break
+    for fname in lib:
+        h.update(fname.encode())
+        if os.path.isfile(fname):
+            h.update(readInput(fname).encode())
+    return h.hexdigest()
+
+# The cache flag keeps the results of the lex and par phases on disk --
+# the token and grammar analysis, the parser stubs before the semantic
+# sections are merged into them, and the files written by those phases --
+# in the file named by the flag (or .plcc-cache in destdir).  When the
+# lexical and grammar sections, the library files they read, plcc itself
+# and the flags that can affect the analysis are unchanged, a later run
+# restores these results, rewrites the files and goes straight to sem.
+
+CACHEFLAGS = ['debug', 'destdir', 'profile', 'cache', 'watch', 'batch', 'jobs',
+              'incremental', 'manifest', 'archive'] # flags that do not affect lex and par
+
+def cacheFile():
+    # return the name of the cache file, or None if not caching.  With a
+    # bare --cache, it is .NAME.plcc-cache next to the first grammar file
+    # NAME, since the grammar itself may set destdir
+    c = getFlag('cache')
+    if not c or '-' in argv:
+        return None
+    if c == True:
+        if argv[0] in Texts:
+            return None  # no grammar file to put it next to
+        (head, tail) = os.path.split(argv[0])
+        return os.path.join(head, '.%s.plcc-cache' % tail)
+    return c
+
+def cacheKey(lib, flags):
+    # return a key for the lex and par results of the grammar files in
+    # argv (see stateKey), the given flags (as set before the grammar
+    # files are read) and plcc itself
+    h = hashlib.sha1(stateKey(lib).encode())
+    for name in sorted(flags):
+        if not name in CACHEFLAGS:
+            h.update(('%s=%r\n' % (name, flags[name])).encode())
+    try:
+        f = open(__file__, 'rb')
+        h.update(f.read())
+        f.close()
+    except:
+        pass
+    return h.hexdigest()
+
+def cacheStart():
+    # start recording the files written by the lex and par phases,
+    # returning a copy of the flags for cacheSave
+    global Record
+    if cacheFile():
+        Record = []
+    return dict(flags)
+
+# The cache file is JSON, so that loading it cannot run code.  It holds
+# the plcc globals named in CACHESTATE (with sets as sorted lists, and
+# stubs as their text), the flags that the grammar files set (not the
+# command-line ones), and the files written by the lex and par phases.
+
+CACHESTATE = ['startSymbol', 'skip', 'term', 'skipSpecs', 'termSpecs', 'termList',
+              'termBits', 'skipPats', 'termPats', 'nonterms', 'fields', 'rules',
+              'extends', 'derives', 'cases', 'arbno', 'stubs', 'Inputs']
+CACHESETS = ['skip', 'term', 'nonterms']
+
+def cacheSave(cmdFlags):
+    # write the results of the lex and par phases to the cache file, with
+    # cmdFlags the flags before the lex phase (see cacheStart)
+    global Record
+    files = Record
+    Record = None
+    fname = cacheFile()
+    if not fname or files == None:
+        return
+    lib = sorted([f for f in Inputs if not f in argv])
+    state = {'key': cacheKey(lib, cmdFlags), 'lib': lib, 'files': files}
+    for name in CACHESTATE:
+        state[name] = globals()[name]
+    for name in CACHESETS:
+        state[name] = sorted(state[name])
+    state['stubs'] = {}
+    for cls in stubs:
+        state['stubs'][cls] = ''.join(templateText(stubs[cls][0]))
+    state['flags'] = {}
+    for name in flags:
+        if not name in cmdFlags or cmdFlags[name] != flags[name]:
+            state['flags'][name] = flags[name]   # set by the grammar
+    try:
+        # write a new file and rename it, so concurrent runs never see a partial cache
+        tmp = '%s.%d' % (fname, os.getpid())
+        f = open(tmp, 'w')
+        json.dump(state, f)
+        f.close()
+        os.replace(tmp, fname)
+        debug('[cacheSave] %s: saved' % fname)
+    except:
+        print('cannot write cache file %s' % fname, file=sys.stderr)
+
+def cacheCheck(state):
+    # return True if state, as read from a cache file, has the form that
+    # cacheSave writes
+    def strs(x):
+        return isinstance(x, list) and all([isinstance(y, str) for y in x])
+    def table(x, ok):
+        return isinstance(x, dict) and all([ok(v) for v in x.values()])
+    def isStr(x):
+        return isinstance(x, str)
+    def isInt(x):
+        return isinstance(x, int)
+    def isField(x):
+        return isinstance(x, list) and len(x) == 2 and isStr(x[0]) and strs(x[1])
+    def isRule(x):
+        return (isinstance(x, list) and len(x) == 3 and isStr(x[0]) and
+                (x[1] == None or isStr(x[1])) and strs(x[2]))
+    def isFile(x):
+        return isinstance(x, list) and len(x) == 2 and isStr(x[0]) and isStr(x[1])
+    if not isinstance(state, dict):
+        return False
+    checks = {
+        'key': isStr, 'lib': strs, 'startSymbol': isStr,
+        'skip': strs, 'term': strs, 'nonterms': strs,
+        'skipSpecs': strs, 'termSpecs': strs, 'termList': strs,
+        'termBits': lambda x: table(x, isInt), 'cases': lambda x: table(x, isInt),
+        'skipPats': lambda x: table(x, isStr), 'termPats': lambda x: table(x, isStr),
+        'extends': lambda x: table(x, isStr), 'stubs': lambda x: table(x, isStr),
+        'Inputs': lambda x: table(x, isStr), 'derives': lambda x: table(x, strs),
+        'arbno': lambda x: table(x, lambda y: y == None or isStr(y)),
+        'fields': lambda x: table(x, isField),
+        'rules': lambda x: isinstance(x, list) and all([isRule(y) for y in x]),
+        'flags': lambda x: table(x, lambda y: isinstance(y, (bool, int, str))),
+        'files': lambda x: isinstance(x, list) and all([isFile(y) for y in x]),
+    }
+    for name in checks:
+        if not name in state or not checks[name](state[name]):
+            debug('[cacheCheck] bad or missing %s' % name)
+            return False
+    return True
+
+def cacheLoad(nxt):
+    # if the cache file has the results of the lex and par phases for the
+    # grammar files in argv, restore them, write the files those phases
+    # wrote, skip to the semantic section and return True
+    fname = cacheFile()
+    if not fname:
+        return False
+    profStart('cache')
+    try:
+        f = open(fname)
+        state = json.load(f)
+        f.close()
+        ok = cacheCheck(state) and state['key'] == cacheKey(state['lib'], flags)
+    except:
+        ok = False # missing, unreadable or from an incompatible plcc
+    if not ok:
+        debug('[cacheLoad] %s: no usable cache' % fname)
+        profStop('cache')
+        return False
+    debug('[cacheLoad] %s: using cached lex and par results' % fname)
+    profCount('cacheHits')
+    for name in CACHESTATE:
+        globals()[name] = state[name]
+    for name in CACHESETS:
+        globals()[name] = set(state[name])
+    for cls in stubs:
+        stubs[cls] = template(stubs[cls])
+    # the command-line flags stand, except where the grammar sets them
+    flags.update(state['flags'])
+    for line in nxt:
+        if line == '%':
+            break    # end of the lexical section
+    if not getFlag('nowrite'):
+        makeDestdir()
+    parReport()
+    for (fname, text) in state['files']:
+        writeFile(fname, text)
+    for line in nxt:
+        if line == '%':
+            break    # end of the grammar section
+    profStop('cache')
+    return True
+
+def readInput(fname):
+    # return the contents of the input file fname
+    if fname in Texts:
+        return Texts[fname]
+    try:
+        f = open(fname)
+        text = f.read()
+        f.close()
+    except:
+        death(fname + ': error opening file')
+    return text
+
+def watch():
+    # process the grammar files in argv, then watch them and all of the files
+    # they include, regenerating the output whenever one of them changes.
+    # If the lexical and grammar sections are unchanged, only the sem phase
+    # is rerun, and only changed files are rewritten (as with --incremental).
+    # The watch flag value, if not True, is the polling interval in seconds.
+    global argv, flags
+    if '-' in argv:
+        death('cannot watch standard input')
+    try:
+        interval = 1.0 if getFlag('watch') == True else float(getFlag('watch'))
+    except:
+        death('improper watch flag value')
+    flags['incremental'] = True
+    files = argv[:]
+    cmdFlags = dict(flags)
+    state = None
+    stamps = None
+    while True:
+        if stamps != None:
+            # wait for one of the inputs to change
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                done()
+            if fileStamps(stamps) == stamps:
+                continue
+        argv = files[:]
+        if state and state['key'] != stateKey(state['lib']):
+            state = None
+        what = 'semantics' if state else 'all'
+        print('[watch] %s: regenerating %s' % (' '.join(files), what), file=Out)
+        try:
+            plccInit()
+            flags.update(cmdFlags)
+            argv = files[:]
+            plcc(state)
+        except PlccDone as msg:
+            if str(msg):
+                print(msg, file=sys.stderr)
+        except PlccError as msg:
+            print(msg, file=sys.stderr)
+        argv = files[:]
+        if not state and Snapshot and Snapshot['key'] == stateKey(Snapshot['lib']):
+            state = Snapshot
+        stamps = fileStamps(Inputs)
+
+def fileStamps(files):
+    # return a map from each of the existing files to its (mtime, size)
+    stamps = {}
+    for fname in files:
+        try:
+            st = os.stat(fname)
+            stamps[fname] = (st.st_mtime, st.st_size)
+        except OSError:
+            pass
+    return stamps
+
+def profInit():
+    # start profiling: each phase records its wall time, and the net and peak
+    # memory allocated while it runs (using tracemalloc).  The report is
+    # also written at exit, so that a run ending in death() still has one
+    global Profile
+    # (Profile['peak'] is the peak for the whole run, since profStart
+    # resets the tracemalloc peak for each phase)
+    Profile = {'phases': {}, 'counters': {}, 'active': [], 't0': time.perf_counter(),
+               'peak': 0}
+    tracemalloc.start()
+    atexit.unregister(profFinishUp)
+    atexit.register(profFinishUp)
+
+def profiling():
+    # return True if profiling, starting it if the profile flag has been
+    # set (on the command line or by a !profile line in a grammar file)
+    if Profile == None and getFlag('profile'):
+        profInit()
+    return Profile != None
+
+def profStart(phase):
+    if not profiling():
+        return
+    (cur, peak) = tracemalloc.get_traced_memory()
+    for frame in Profile['active']:
+        frame['peak'] = max(frame['peak'], peak)
+    Profile['peak'] = max(Profile['peak'], peak)
+    tracemalloc.reset_peak()
+    Profile['active'].append({'phase': phase, 't0': time.perf_counter(),
+                              'mem0': cur, 'peak': cur})
+
+def profStop(phase):
+    if not profiling():
+        return
+    t1 = time.perf_counter()
+    (cur, peak) = tracemalloc.get_traced_memory()
+    Profile['peak'] = max(Profile['peak'], peak)
+    active = Profile['active']
+    if not active:
+        return    # the phase began before profiling did
+    frame = active.pop()
+    if frame['phase'] != phase:
+        death('[profStop] phase %s stopped while in phase %s' % (phase, frame['phase']))
+    frame['peak'] = max(frame['peak'], peak)
+    for outer in active:
+        outer['peak'] = max(outer['peak'], frame['peak'])
+    p = Profile['phases'].setdefault(phase, {'calls': 0, 'wall': 0.0, 'alloc': 0, 'peak': 0})
+    p['calls'] += 1
+    p['wall'] += t1 - frame['t0']
+    p['alloc'] += cur - frame['mem0']
+    p['peak'] = max(p['peak'], frame['peak'] - frame['mem0'])
+
+def profCount(counter, n=1):
+    if not profiling():
+        return
+    counters = Profile['counters']
+    counters[counter] = counters.get(counter, 0) + n
+
+def profFinishUp():
+    # stop any active phases and report the profile as JSON, either to
+    # standard error (--profile) or to a file (--profile=file)
+    global Profile
+    if Profile == None:
+        return
+    while Profile['active']:
+        profStop(Profile['active'][-1]['phase'])
+    (cur, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    counters = Profile['counters']
+    counters['tokens'] = len(term)
+    counters['nonterms'] = len(nonterms)
+    counters['classes'] = len(stubs)
+    report = {
+        'grammar': argv,
+        'wall': time.perf_counter() - Profile['t0'],
+        'peak': max(Profile['peak'], peak),
+        'phases': Profile['phases'],
+        'counters': counters,
+    }
+    Profile = None
+    dest = getFlag('profile')
+    if not dest:
+        return    # turned off by a later !profile= line
+    if dest == True:
+        json.dump(report, sys.stderr, indent=1, sort_keys=True)
+        print(file=sys.stderr)
+        return
+    try:
+        f = open(dest, 'w')
+        json.dump(report, f, indent=1, sort_keys=True)
+        print(file=f)
+        f.close()
+    except:
+        print('cannot write profile to %s' % dest, file=sys.stderr)
 
 def nextLine():
     # create a generator to get the next line in the current input file
-    global Lno, Fname, Line
+    global Lno, Fname, Line, Inputs
     for Fname in argv:
-        # open the next input file
-        f = None # the current open file
+        # read the next input file
         if Fname == '-':
-            f = sys.stdin
+            text = sys.stdin.read()
             Fname = 'STDIN'
+        elif Fname in Texts:
+            text = Texts[Fname]
         else:
             try:
                 f = open(Fname, 'r')
+                text = f.read()
+                f.close()
             except:
                 death(Fname + ': error opening file')
+        Inputs[Fname] = hashlib.sha1(text.encode()).hexdigest()
         Lno = 0
-        # f is the current open file
-        for Line in f:
+        # split on '\n' only, as reading the file line by line does
+        # (str.splitlines also splits on '\f', '\x85', '\u2028', ...)
+        for Line in io.StringIO(text):
             # get the next line in this file
             Lno += 1
             line = Line.rstrip()
@@ -1013,14 +3665,11 @@ def getFlag(s):
         return None
 
 def death(msg):
-    print(msg, file=sys.stderr)
-    exit(1)
+    raise PlccError(msg)
 
 def deathLNO(msg):
     global Lno, Fname, Line
-    print('%4d [%s]: %s' % (Lno, Fname, msg), file=sys.stderr)
-    print('line:', Line, file=sys.stderr)
-    exit(1)
+    raise PlccError('%4d [%s]: %s\nline: %s' % (Lno, Fname, msg, Line))
 
 def push(struct, item):
     struct.append(item)
@@ -1049,6 +3698,7 @@ def defangg(item):
     """
     tnt = None
     field = None
+    profCount('defangg')
     debug('[defangg] item=%s' % item)
     m = re.match(r'<(\w+)>(.*)$', item)
     if m: